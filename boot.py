@@ -85,6 +85,8 @@ from .plugin.symbols import LspSelectionSetCommand
 from .plugin.symbols import LspWorkspaceSymbolsCommand
 from .plugin.tooling import LspCopyToClipboardFromBase64Command
 from .plugin.tooling import LspDumpBufferCapabilities
+from .plugin.tooling import LspDumpStartupTimelines
+from .plugin.tooling import LspDumpStderrHistory
 from .plugin.tooling import LspDumpWindowConfigs
 from .plugin.tooling import LspOnDoubleClickCommand
 from .plugin.tooling import LspParseVscodePackageJson
@@ -117,6 +119,8 @@ __all__ = (
     "LspDisableLanguageServerInProjectCommand",
     "LspDocumentSymbolsCommand",
     "LspDumpBufferCapabilities",
+    "LspDumpStartupTimelines",
+    "LspDumpStderrHistory",
     "LspDumpWindowConfigs",
     "LspEnableLanguageServerGloballyCommand",
     "LspEnableLanguageServerInProjectCommand",
@@ -16,6 +16,7 @@ from functools import wraps
 from pathlib import Path
 from typing import Any
 from typing import Callable
+from typing import ClassVar
 from typing import Final
 from typing import final
 from typing import Tuple
@@ -177,11 +178,15 @@ class APIHandler:
         # Map m_* attr names → method names (strings only, no bound methods) to avoid
         # the reference cycle self → bound_method.__self__ → self that prevents GC.
         self.handler_attr_map: dict[str, str] = {}
+        # Map LSP method names → method names, for dispatching incoming messages without deriving the m_* attr name.
+        self.method_handler_map: dict[str, str] = {}
         self._command_handler_map: dict[str, str] = {}
         self._uri_handler_map: dict[str, str] = {}
         for name, value in inspect.getmembers(self, inspect.ismethod):
             if hasattr(value, HANDLER_MARKER):
-                self.handler_attr_map[method2attr(getattr(value, HANDLER_MARKER))] = name
+                method = getattr(value, HANDLER_MARKER)
+                self.handler_attr_map[method2attr(method)] = name
+                self.method_handler_map[method] = name
             elif hasattr(value, COMMAND_HANDLER_MARKER):
                 self._command_handler_map[getattr(value, COMMAND_HANDLER_MARKER)] = name
             elif hasattr(value, URI_HANDLER_MARKER):
@@ -399,6 +404,21 @@ class LspPlugin(APIHandler):
     Use this as your directory to install server files. Its path is `$DATA/Package Storage/<Package Name>`.
     """
 
+    intercepted_methods: ClassVar[frozenset[str] | None] = None
+    """
+    The methods of the messages that the `on_pre_send_*_async` and `on_server_*_async` hooks are called for.
+
+    By default, the hooks that the plugin overrides are called for every message. When the plugin only cares about a
+    few methods, list them here, so that the other messages don't pay for wrapping them into hook arguments:
+
+    ```py
+    class LspFooPlugin(LspPlugin):
+        intercepted_methods = frozenset({'textDocument/completion', 'textDocument/publishDiagnostics'})
+    ```
+
+    Hooks that the plugin doesn't override are never called, regardless of this attribute.
+    """
+
     @classmethod
     @final
     def register(cls) -> None:
@@ -873,3 +893,19 @@ class AbstractPlugin(APIHandler, ABC):
         This API is triggered on async thread.
         """
         pass
+
+
+MESSAGE_HOOKS = (
+    'on_pre_send_request_async',
+    'on_pre_send_response_async',
+    'on_pre_send_notification_async',
+    'on_server_response_async',
+    'on_server_notification_async',
+)
+
+
+def overridden_message_hooks(plugin: AbstractPlugin | LspPlugin) -> frozenset[str]:
+    """The names of the per-message hooks that the class of `plugin` overrides."""
+    base = AbstractPlugin if isinstance(plugin, AbstractPlugin) else LspPlugin
+    cls = type(plugin)
+    return frozenset(hook for hook in MESSAGE_HOOKS if getattr(cls, hook, None) is not getattr(base, hook, None))
@@ -220,6 +220,8 @@ class QueryCompletionsTask:
         self, response: CompletionResponse, request_id: int, weak_session: weakref.ref[Session]
     ) -> ResolvedCompletions:
         self._pending_completion_requests.pop(request_id, None)
+        if session := weak_session():
+            session.startup_timeline.mark("first completion")
         return (response, weak_session)
 
     def _resolve_completions_async(self, responses: list[ResolvedCompletions]) -> None:
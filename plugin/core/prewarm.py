@@ -0,0 +1,185 @@
+"""
+Speculative starting of language servers before the first matching file is opened.
+
+When a window or project is loaded, the language servers that the project is likely to need are predicted from the file
+extensions found in the project folders, and from the servers that were used in these folders before. The window
+manager starts those servers in the background, so that the first matching file doesn't have to wait for the server
+process to start and initialize. The servers are started one at a time, and no more servers are prewarmed once the
+combined memory usage of the ones that finished initializing exceeds a budget. Prewarmed servers that don't get used
+within an idle timeout are stopped again.
+"""
+from __future__ import annotations
+
+from .constants import ST_CACHE_PATH
+from .constants import ST_PLATFORM
+from .logging import debug
+from collections import Counter
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Callable
+from typing import TYPE_CHECKING
+import json
+import os
+import shutil
+import sublime
+import subprocess
+import threading
+
+if TYPE_CHECKING:
+    from .sessions import Session
+    from .types import ClientConfig
+
+SCAN_LIMIT = 5000
+"""The maximum number of directory entries that are looked at to predict the servers that a project needs."""
+HISTORY_CONFIGS_LIMIT = 10
+HISTORY_FOLDERS_LIMIT = 200
+IGNORED_DIRECTORIES = ('node_modules', '__pycache__', 'target', 'build', 'dist', 'venv')
+
+
+def scan_file_extensions(folders: list[str], exclude_patterns: list[str], limit: int = SCAN_LIMIT) -> Counter[str]:
+    """
+    Count the file extensions in the given folders, breadth-first, so that a limited scan of a big project still sees
+    the files near the project root. Hidden directories and directories matching `exclude_patterns` are skipped.
+    """
+    extensions: Counter[str] = Counter()
+    pending = list(folders)
+    seen = 0
+    while pending and seen < limit:
+        directory = pending.pop(0)
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    seen += 1
+                    if seen > limit:
+                        break
+                    name = entry.name
+                    if name.startswith('.'):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        if name not in IGNORED_DIRECTORIES and not any(fnmatch(name, p) for p in exclude_patterns):
+                            pending.append(entry.path)
+                    elif extension := os.path.splitext(name)[1]:
+                        extensions[extension.lower()] += 1
+        except OSError:
+            continue
+    return extensions
+
+
+def scan_file_extensions_async(
+    folders: list[str], exclude_patterns: list[str], callback: Callable[[Counter[str]], None]
+) -> None:
+    """
+    Scan the folders with `scan_file_extensions` on a separate thread, and pass the result to `callback` on the async
+    thread, so that scanning a big project doesn't hold up the async thread.
+    """
+
+    def scan() -> None:
+        extensions = scan_file_extensions(folders, exclude_patterns)
+        sublime.set_timeout_async(lambda: callback(extensions))
+
+    threading.Thread(target=scan, name="LSP prewarm scan").start()
+
+
+def config_handles_extension(config: ClientConfig, extension: str) -> bool:
+    if 'file' not in config.schemes or not (selector := config.selector.strip()):
+        return False
+    syntax = sublime.find_syntax_for_file(f"file{extension}")
+    return bool(syntax) and sublime.score_selector(syntax.scope, selector) > 0
+
+
+def predict_configs(configs: list[ClientConfig], folders: list[str], extensions: Counter[str]) -> list[ClientConfig]:
+    """
+    The enabled configs that the project in `folders` is likely to need. Configs that were used in these folders before
+    come first, most recently used first, followed by configs for the `extensions` that occur most often.
+    """
+    configs = [config for config in configs if config.enabled]
+    by_name = {config.name: config for config in configs}
+    predicted = [by_name[name] for name in prewarm_history.configs(folders) if name in by_name]
+    for extension, _ in extensions.most_common():
+        for config in configs:
+            if config not in predicted and config_handles_extension(config, extension):
+                predicted.append(config)
+    return predicted
+
+
+def process_memory(pid: int) -> int | None:
+    """The resident set size of a process in bytes, or `None` when it can't be determined."""
+    try:
+        if ST_PLATFORM == "linux":
+            statm = Path(f"/proc/{pid}/statm").read_text(encoding="ascii")
+            return int(statm.split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        if ST_PLATFORM == "osx" and (ps := shutil.which("ps")):
+            output = subprocess.check_output([ps, "-o", "rss=", "-p", str(pid)], stderr=subprocess.DEVNULL)
+            return int(output.strip()) * 1024
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        pass
+    return None
+
+
+def session_memory(session: Session) -> int:
+    pid = session.transport.pid if session.transport else None
+    return (process_memory(pid) or 0) if pid else 0
+
+
+class PrewarmedSession:
+    """A session that was started speculatively, and that no view has asked for yet."""
+
+    def __init__(self, session: Session) -> None:
+        self.session = session
+        self.initiating_view: sublime.View | None = None
+        """The view that started waiting for the session while it was still initializing."""
+
+
+class PrewarmHistory:
+    """Remembers which configs were used in which project folders, across restarts of Sublime Text."""
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._history: dict[str, list[str]] | None = None
+
+    def configs(self, folders: list[str]) -> list[str]:
+        history = self._load()
+        names: list[str] = []
+        for folder in folders:
+            for name in history.get(folder, []):
+                if name not in names:
+                    names.append(name)
+        return names
+
+    def record(self, folders: list[str], config_name: str) -> None:
+        history = self._load()
+        changed = False
+        for folder in folders:
+            names = history.pop(folder, [])
+            if names[:1] != [config_name]:
+                changed = True
+                if config_name in names:
+                    names.remove(config_name)
+                names.insert(0, config_name)
+                del names[HISTORY_CONFIGS_LIMIT:]
+            # Keep the most recently used folders at the end.
+            history[folder] = names
+        while len(history) > HISTORY_FOLDERS_LIMIT:
+            changed = True
+            del history[next(iter(history))]
+        if changed:
+            self._save(history)
+
+    def _load(self) -> dict[str, list[str]]:
+        if self._history is None:
+            try:
+                history = json.loads(self._path.read_text(encoding='utf-8'))
+                self._history = history if isinstance(history, dict) else {}
+            except (OSError, ValueError):
+                self._history = {}
+        return self._history
+
+    def _save(self, history: dict[str, list[str]]) -> None:
+        try:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            self._path.write_text(json.dumps(history), encoding='utf-8')
+        except OSError as ex:
+            debug("failed to save the server prewarm history:", ex)
+
+
+prewarm_history = PrewarmHistory(Path(ST_CACHE_PATH, 'LSP', 'prewarm_history.json'))
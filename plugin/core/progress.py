@@ -1,11 +1,53 @@
 from __future__ import annotations
 
+from typing import TYPE_CHECKING
 import sublime
+import time
 
+if TYPE_CHECKING:
+    from ...protocol import ProgressToken
 
-class ProgressReporter:
+
+# The minimum time between two status bar updates of a single progress entry.
+PROGRESS_UPDATE_INTERVAL = 0.25  # seconds
+
+
+class ThrottledStatus:
+    """
+    Base class for status bar entries that may change much more often than is useful to render.
+
+    Subclasses call `_schedule_update` after every change of their state. The first change is rendered immediately, and
+    later changes at most once per `PROGRESS_UPDATE_INTERVAL` seconds, always with the latest state.
+    """
+
+    def __init__(self) -> None:
+        self._last_update = 0.0
+        self._update_scheduled = False
+
+    def _schedule_update(self) -> None:
+        if self._update_scheduled:
+            return
+        delay = self._last_update + PROGRESS_UPDATE_INTERVAL - time.monotonic()
+        if delay <= 0:
+            self._last_update = time.monotonic()
+            self._update()
+            return
+        self._update_scheduled = True
+        sublime.set_timeout_async(self._update_async, int(delay * 1000) + 1)
+
+    def _update_async(self) -> None:
+        self._update_scheduled = False
+        self._last_update = time.monotonic()
+        self._update()
+
+    def _update(self) -> None:
+        pass
+
+
+class ProgressReporter(ThrottledStatus):
 
     def __init__(self, title: str) -> None:
+        super().__init__()
         self.title = title
         self._message: str | None = None
         self._percentage: int | float | None = None
@@ -22,11 +64,12 @@ class ProgressReporter:
             result += fmt.format(self._percentage)
         return result
 
-    def __call__(self, message: str | None, percentage: float | None) -> None:
+    def __call__(self, message: str | None = None, percentage: float | None = None) -> None:
         if percentage is not None:
             self._percentage = percentage
         if message is not None:
             self._message = message
+        self._schedule_update()
 
 
 class ViewProgressReporter(ProgressReporter):
@@ -42,8 +85,7 @@ class ViewProgressReporter(ProgressReporter):
         self._view.erase_status(self._key)
         super().__del__()
 
-    def __call__(self, message: str | None = None, percentage: float | None = None) -> None:
-        super().__call__(message, percentage)
+    def _update(self) -> None:
         self._view.set_status(self._key, self._render())
 
 
@@ -61,8 +103,7 @@ class WindowProgressReporter(ProgressReporter):
             view.erase_status(self._key)
         super().__del__()
 
-    def __call__(self, message: str | None = None, percentage: float | None = None) -> None:
-        super().__call__(message, percentage)
+    def _update(self) -> None:
         display = self._render()
         for view in self._window.views():
             view.set_status(self._key, display)
@@ -82,9 +123,78 @@ class ApplicationProgressReporter(ProgressReporter):
                 view.erase_status(self._key)
         super().__del__()
 
-    def __call__(self, message: str | None = None, percentage: float | None = None) -> None:
-        super().__call__(message, percentage)
+    def _update(self) -> None:
         display = self._render()
         for window in sublime.windows():
             for view in window.views():
                 view.set_status(self._key, display)
+
+
+class WindowProgressAggregator(ThrottledStatus):
+    """
+    Shows the work done progress of all server-initiated progress tokens of a session as a single status entry.
+
+    Only the latest state of each token is kept. When more than one token is active, the oldest one is shown together
+    with the number of other active tokens.
+    """
+
+    def __init__(self, window: sublime.Window, key: str) -> None:
+        super().__init__()
+        self._window = window
+        self._key = key
+        self._reporters: dict[ProgressToken, ProgressReporter] = {}
+        self._display = ""
+
+    def __contains__(self, token: object) -> bool:
+        return token in self._reporters
+
+    def begin(self, token: ProgressToken, title: str, message: str | None = None,
+              percentage: float | None = None) -> None:
+        reporter = ProgressReporter(title)
+        reporter._message = message
+        reporter._percentage = percentage
+        self._reporters[token] = reporter
+        self._schedule_update()
+
+    def report(self, token: ProgressToken, message: str | None = None, percentage: float | None = None) -> None:
+        if reporter := self._reporters.get(token):
+            if percentage is not None:
+                reporter._percentage = percentage
+            if message is not None:
+                reporter._message = message
+            self._schedule_update()
+
+    def end(self, token: ProgressToken) -> str | None:
+        """
+        Stop showing the progress of the given token.
+
+        :returns: The title of the progress, or None if the token wasn't begun.
+        """
+        if reporter := self._reporters.pop(token, None):
+            self._schedule_update()
+            return reporter.title
+        return None
+
+    def clear(self) -> None:
+        """Stop showing the progress of all tokens, without waiting for the next update."""
+        self._reporters.clear()
+        self._update()
+
+    def _render(self) -> str:
+        if not self._reporters:
+            return ""
+        result = next(iter(self._reporters.values()))._render()
+        if len(self._reporters) > 1:
+            result += f" (+{len(self._reporters) - 1} more)"
+        return result
+
+    def _update(self) -> None:
+        display = self._render()
+        if display == self._display:
+            return
+        self._display = display
+        for view in self._window.views():
+            if display:
+                view.set_status(self._key, display)
+            else:
+                view.erase_status(self._key)
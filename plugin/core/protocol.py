@@ -227,8 +227,10 @@ class Request(Generic[P_contra, R]):
         return Request('textDocument/prepareRename', params, view, progress)
 
     @classmethod
-    def selectionRange(cls, params: SelectionRangeParams) -> Request[SelectionRangeParams, list[SelectionRange] | None]:
-        return Request('textDocument/selectionRange', params)
+    def selectionRange(
+        cls, params: SelectionRangeParams, view: sublime.View | None = None
+    ) -> Request[SelectionRangeParams, list[SelectionRange] | None]:
+        return Request('textDocument/selectionRange', params, view)
 
     @classmethod
     def foldingRange(
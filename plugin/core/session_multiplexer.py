@@ -0,0 +1,555 @@
+"""
+Sharing one language server process between the sessions of several windows.
+
+Each window normally starts its own language server. For configurations with `"share_across_windows"` enabled, the
+first window starts the process as usual and every other window that starts the same configuration attaches to it. All
+sessions talk to the server through a :class:`SessionMultiplexer`, which makes the server believe that it is talking to
+a single client:
+
+- Request IDs and progress tokens of each session are rewritten, so that they are unique on the wire, and responses and
+  progress notifications are routed back to the session that sent the request.
+- Only the first session actually initializes the server. The other sessions get the cached `InitializeResult`, and
+  their workspace folders are added via `workspace/didChangeWorkspaceFolders`.
+- Documents and workspace folders are reference-counted. A document that is open in several windows is opened and
+  closed only once, and only the session that opened it first synchronizes its content.
+- Server notifications about a document are routed to the sessions that have it open or that contain it in one of their
+  workspace folders. Everything else goes to the session that most recently sent a request.
+- The server process is shut down when the last session detaches.
+- A server that can't change its workspace folders is only shared with windows that are started after it has been
+  initialized. Because their workspace folders would be ignored, those windows start a dedicated server instead.
+"""
+from __future__ import annotations
+
+from .logging import debug
+from .transports import TransportCallbacks
+from .url import parse_uri
+from typing import Any
+from typing import cast
+from typing import Collection
+from typing import Dict
+from typing import TYPE_CHECKING
+from typing import Union
+from typing_extensions import TypeAlias
+import json
+import os
+import sublime
+import threading
+import weakref
+
+if TYPE_CHECKING:
+    from ...protocol import InitializeResult
+    from ...protocol import WorkspaceFolder
+    from .protocol import JSONRPCMessage
+    from .transports import TransportWrapper
+    from .types import ClientConfig
+
+Payload: TypeAlias = Dict[str, Any]
+"""A JSON-RPC message, which is rewritten by key."""
+RequestId: TypeAlias = Union[int, str]
+
+FAN_OUT_METHODS = frozenset((
+    'client/registerCapability',
+    'client/unregisterCapability',
+))
+"""Server requests that concern every session. The first response is passed on to the server."""
+
+DOCUMENT_OWNER_METHODS = frozenset((
+    'textDocument/didChange',
+    'textDocument/didSave',
+    'textDocument/willSave',
+))
+"""Client notifications that are only passed on to the server when they come from the owner of the document."""
+
+g_multiplexers: dict[str, SessionMultiplexer] = {}
+g_closing_multiplexers: set[SessionMultiplexer] = set()
+"""Multiplexers whose server is stopping. They are kept alive until the closed transport has notified them."""
+
+
+def shared_transport_key(config: ClientConfig, cwd: str | None, variables: dict[str, str]) -> str:
+    """Sessions can only share a server when they would start exactly the same process with exactly the same options."""
+    return json.dumps([cwd, sublime.expand_variables([
+        config.name,
+        config.command,
+        config.env,
+        config.tcp_port,
+        config.unix_socket,
+        config.initialization_options.get(),
+        config.settings.get(),
+    ], variables)], sort_keys=True)
+
+
+def start_shared_transport(
+    config: ClientConfig,
+    cwd: str | None,
+    variables: dict[str, str],
+    callback_object: TransportCallbacks
+) -> SharedTransport | TransportWrapper:
+    """
+    Attach to the running server for this configuration, or start it when no other window runs it yet. A dedicated
+    server is started when the running server can't take the workspace folders of another window.
+    """
+    key = shared_transport_key(config, cwd, variables)
+    multiplexer = g_multiplexers.get(key)
+    if multiplexer is not None and not multiplexer.can_add_workspace_folders():
+        debug(f"{config.name}: starting a dedicated language server, because the shared one can't change its workspace "
+              "folders")
+        return config.create_transport_config().start(config.command, config.env, cwd, variables, callback_object)
+    if multiplexer is None:
+        multiplexer = SessionMultiplexer(key, config.ignored_notifications)
+        multiplexer.transport = config.create_transport_config().start(
+            config.command, config.env, cwd, variables, multiplexer)
+        g_multiplexers[key] = multiplexer
+    else:
+        debug(f"{config.name}: sharing the language server process with {multiplexer.client_count()} other window(s)")
+    return multiplexer.attach(callback_object)
+
+
+class SharedTransport:
+    """Takes the place of a :class:`TransportWrapper` for a session that shares its server with other windows."""
+
+    def __init__(self, multiplexer: SessionMultiplexer, client_id: int, callback_object: TransportCallbacks) -> None:
+        self.multiplexer = multiplexer
+        self.client_id = client_id
+        self.closed = False
+        self.documents: set[str] = set()
+        self.folders: set[str] = set()
+        self._callback_object = weakref.ref(callback_object)
+
+    def __repr__(self) -> str:
+        return f"SharedTransport({self.client_id})"
+
+    @property
+    def process_args(self) -> Any:
+        return self.multiplexer.transport.process_args if self.multiplexer.transport else None
+
+    @property
+    def pid(self) -> int | None:
+        return self.multiplexer.transport.pid if self.multiplexer.transport else None
+
+    @property
+    def stderr_history(self) -> list[str]:
+        return self.multiplexer.transport.stderr_history if self.multiplexer.transport else []
+
+    @property
+    def first_payload_time(self) -> float | None:
+        # The server may have been started long before this session attached to it.
+        return None
+
+    def send(self, payload: JSONRPCMessage) -> None:
+        self.multiplexer.send(self, cast('Payload', payload))
+
+    def close(self) -> None:
+        self.multiplexer.detach(self)
+
+    def deliver(self, payload: Payload) -> None:
+        if not self.closed and (callback_object := self._callback_object()):
+            callback_object.on_payload(cast('JSONRPCMessage', payload))
+
+    def deliver_stderr_messages(self, messages: list[str]) -> None:
+        if callback_object := self._callback_object():
+            callback_object.on_stderr_messages(messages)
+
+    def deliver_ignored_notifications(self, counts: dict[str, int]) -> None:
+        if callback_object := self._callback_object():
+            callback_object.on_ignored_notifications(counts)
+
+    def deliver_close(self, exit_code: int, exception: Exception | None) -> None:
+        self.closed = True
+        if callback_object := self._callback_object():
+            callback_object.on_transport_close(exit_code, exception)
+
+
+class SessionMultiplexer(TransportCallbacks):
+    """
+    Sits between one server transport and the :class:`SharedTransport` of each attached session.
+
+    Methods that take a `client` argument may be called from any thread. Payloads from the server arrive on the async
+    thread and are delivered to the sessions on that same thread. Responses that the multiplexer makes up by itself are
+    delivered on the async thread as well, and never before `send` returns.
+    """
+
+    def __init__(self, key: str, ignored_notifications: Collection[str]) -> None:
+        self.key = key
+        self.transport: TransportWrapper | None = None
+        self._ignored_notifications = ignored_notifications
+        self._lock = threading.Lock()
+        self._clients: list[SharedTransport] = []
+        self._active: SharedTransport | None = None
+        self._next_client_id = 0
+        self._next_request_id = 0
+        # global request ID -> (client, request ID of the client, rewritten progress tokens)
+        self._requests: dict[int, tuple[SharedTransport, RequestId, list[str]]] = {}
+        self._request_ids: dict[tuple[int, RequestId], int] = {}
+        # rewritten progress token -> (client, progress token of the client)
+        self._tokens: dict[str, tuple[SharedTransport, Any]] = {}
+        # progress token created by the server -> client
+        self._server_tokens: dict[Any, SharedTransport] = {}
+        self._server_requests: set[RequestId] = set()
+        self._documents: dict[str, list[SharedTransport]] = {}
+        self._folders: dict[str, tuple[WorkspaceFolder, int]] = {}
+        self._initializer: SharedTransport | None = None
+        self._initialize_request_id: int | None = None
+        self._initialize_result: InitializeResult | None = None
+        self._pending_initialize: list[tuple[SharedTransport, RequestId, list[WorkspaceFolder]]] = []
+
+    def client_count(self) -> int:
+        return len(self._clients)
+
+    def can_add_workspace_folders(self) -> bool:
+        """
+        Whether the workspace folders of another session can be added to the server. That is unknown until the server
+        is initialized.
+        """
+        if self._initialize_result is None:
+            return False
+        folders_capability = self._initialize_result['capabilities'].get('workspace', {}).get('workspaceFolders', {})
+        return bool(folders_capability.get('supported') and folders_capability.get('changeNotifications'))
+
+    def attach(self, callback_object: TransportCallbacks) -> SharedTransport:
+        with self._lock:
+            self._next_client_id += 1
+            client = SharedTransport(self, self._next_client_id, callback_object)
+            self._clients.append(client)
+            if self._active is None:
+                self._active = client
+            return client
+
+    def detach(self, client: SharedTransport) -> None:
+        """Forget about a session that closed its transport. The last session to detach stops the server."""
+        with self._lock:
+            if client not in self._clients:
+                return
+            payloads: list[Payload] = []
+            last = len(self._clients) == 1
+            if not last:
+                client.closed = True
+                self._clients.remove(client)
+                if self._active is client:
+                    self._active = self._clients[0]
+                closed = [uri for uri in list(client.documents) if self._release_document(client, uri)]
+                payloads.extend(self._did_close(uri) for uri in closed)
+                if notification := self._did_change_workspace_folders([], self._release_folders(client)):
+                    payloads.append(notification)
+                self._forget_client(client)
+        if last:
+            g_multiplexers.pop(self.key, None)
+            if self.transport:
+                # The transport only holds the multiplexer weakly, but the closing transport still has to notify every
+                # remaining session.
+                g_closing_multiplexers.add(self)
+                self.transport.close()
+            return
+        for payload in payloads:
+            self._send_to_server(payload)
+        sublime.set_timeout_async(lambda: client.deliver_close(0, None))
+
+    def _forget_client(self, client: SharedTransport) -> None:
+        """Drop the requests and progress tokens of a detached session, so that late messages aren't routed to it."""
+        for request_id, (owner, client_request_id, _) in list(self._requests.items()):
+            # The response to the initialize request is still needed for the sessions that wait for it.
+            if owner is client and request_id != self._initialize_request_id:
+                del self._requests[request_id]
+                self._request_ids.pop((client.client_id, client_request_id), None)
+        self._tokens = {token: value for token, value in self._tokens.items() if value[0] is not client}
+        self._server_tokens = {token: owner for token, owner in self._server_tokens.items() if owner is not client}
+        self._pending_initialize = [pending for pending in self._pending_initialize if pending[0] is not client]
+
+    # --- client -> server -------------------------------------------------------------------------------------------
+
+    def send(self, client: SharedTransport, payload: Payload) -> None:
+        if client.closed:
+            return
+        replies: list[Payload] = []
+        with self._lock:
+            payloads = self._rewrite_outgoing(client, payload, replies)
+        for p in payloads:
+            self._send_to_server(p)
+        for reply in replies:
+            sublime.set_timeout_async(lambda reply=reply: client.deliver(reply))
+
+    def _send_to_server(self, payload: Payload) -> None:
+        if self.transport:
+            self.transport.send(cast('JSONRPCMessage', payload))
+
+    def _rewrite_outgoing(
+        self, client: SharedTransport, payload: Payload, replies: list[Payload]
+    ) -> list[Payload]:
+        method = payload.get('method')
+        if method is None:
+            # A response to a server request. Only the first of possibly several responses is passed on.
+            if payload.get('id') in self._server_requests:
+                self._server_requests.discard(payload['id'])
+                return [payload]
+            return []
+        params: Any = payload.get('params')
+        if 'id' in payload:
+            return self._rewrite_request(client, payload['id'], method, params, replies)
+        if method == 'initialized':
+            return [payload] if client is self._initializer else []
+        if method == 'exit':
+            return [payload] if self._clients == [client] else []
+        if method == '$/cancelRequest':
+            if (request_id := self._request_ids.get((client.client_id, params['id']))) is None:
+                return []
+            return [{**payload, 'params': {**params, 'id': request_id}}]
+        if method == 'workspace/didChangeWorkspaceFolders':
+            event = params['event']
+            added = self._retain_folders(client, event['added'])
+            removed = self._release_folders(client, [folder['uri'] for folder in event['removed']])
+            notification = self._did_change_workspace_folders(added, removed)
+            return [notification] if notification else []
+        if method == 'textDocument/didOpen':
+            uri = params['textDocument']['uri']
+            holders = self._documents.setdefault(uri, [])
+            if client not in holders:
+                holders.append(client)
+                client.documents.add(uri)
+            return [payload] if holders[0] is client and len(holders) == 1 else []
+        if method in DOCUMENT_OWNER_METHODS:
+            holders = self._documents.get(params['textDocument']['uri'])
+            return [payload] if not holders or holders[0] is client else []
+        if method == 'textDocument/didClose':
+            uri = params['textDocument']['uri']
+            return [payload] if self._release_document(client, uri) else []
+        return [payload]
+
+    def _rewrite_request(
+        self, client: SharedTransport, client_request_id: RequestId, method: str, params: Any,
+        replies: list[Payload]
+    ) -> list[Payload]:
+        if method == 'initialize':
+            folders = params.get('workspaceFolders') or []
+            if self._initializer is None:
+                self._initializer = client
+                self._retain_folders(client, folders)
+            elif self._initialize_result is None:
+                self._pending_initialize.append((client, client_request_id, folders))
+                return []
+            else:
+                replies.append({'jsonrpc': '2.0', 'id': client_request_id, 'result': self._initialize_result})
+                notification = self._did_change_workspace_folders(self._retain_folders(client, folders), [])
+                return [notification] if notification else []
+        elif method == 'shutdown':
+            if self._clients != [client]:
+                replies.append({'jsonrpc': '2.0', 'id': client_request_id, 'result': None})
+                return []
+        else:
+            self._active = client
+        self._next_request_id += 1
+        request_id = self._next_request_id
+        tokens: list[str] = []
+        if isinstance(params, dict):
+            params = dict(params)
+            for key in ('workDoneToken', 'partialResultToken'):
+                if key in params:
+                    token = f"{client.client_id}:{params[key]}"
+                    self._tokens[token] = (client, params[key])
+                    tokens.append(token)
+                    params[key] = token
+        if method == 'initialize':
+            self._initialize_request_id = request_id
+        self._requests[request_id] = (client, client_request_id, tokens)
+        self._request_ids[(client.client_id, client_request_id)] = request_id
+        return [{'jsonrpc': '2.0', 'id': request_id, 'method': method, 'params': params}]
+
+    def _release_document(self, client: SharedTransport, uri: str) -> bool:
+        """Returns whether the document isn't open in any window anymore."""
+        client.documents.discard(uri)
+        holders = self._documents.get(uri)
+        if not holders or client not in holders:
+            return True
+        holders.remove(client)
+        if holders:
+            return False
+        del self._documents[uri]
+        return True
+
+    def _did_close(self, uri: str) -> Payload:
+        return {'jsonrpc': '2.0', 'method': 'textDocument/didClose', 'params': {'textDocument': {'uri': uri}}}
+
+    def _retain_folders(self, client: SharedTransport, folders: list[WorkspaceFolder]) -> list[WorkspaceFolder]:
+        """Returns the folders that weren't part of the shared workspace before."""
+        added: list[WorkspaceFolder] = []
+        for folder in folders:
+            uri = folder['uri']
+            if uri in client.folders:
+                continue
+            client.folders.add(uri)
+            _, count = self._folders.get(uri, (folder, 0))
+            if not count:
+                added.append(folder)
+            self._folders[uri] = (folder, count + 1)
+        return added
+
+    def _release_folders(self, client: SharedTransport, uris: Collection[str] | None = None) -> list[WorkspaceFolder]:
+        """Returns the folders that aren't part of the shared workspace anymore."""
+        removed: list[WorkspaceFolder] = []
+        for uri in list(client.folders if uris is None else uris):
+            if uri not in client.folders:
+                continue
+            client.folders.discard(uri)
+            folder, count = self._folders[uri]
+            if count > 1:
+                self._folders[uri] = (folder, count - 1)
+            else:
+                del self._folders[uri]
+                removed.append(folder)
+        return removed
+
+    def _did_change_workspace_folders(
+        self, added: list[WorkspaceFolder], removed: list[WorkspaceFolder]
+    ) -> Payload | None:
+        if not added and not removed:
+            return None
+        capabilities = self._initialize_result['capabilities'] if self._initialize_result else {}
+        folders_capability = capabilities.get('workspace', {}).get('workspaceFolders', {})
+        if not folders_capability.get('supported') or not folders_capability.get('changeNotifications'):
+            debug("shared language server doesn't support changing workspace folders; using the initial folders only")
+            return None
+        return {
+            'jsonrpc': '2.0',
+            'method': 'workspace/didChangeWorkspaceFolders',
+            'params': {'event': {'added': added, 'removed': removed}}
+        }
+
+    # --- server -> client -------------------------------------------------------------------------------------------
+
+    @property
+    def workspace_folders(self) -> list[WorkspaceFolder]:
+        return [folder for folder, _ in self._folders.values()]
+
+    def on_payload(self, payload: JSONRPCMessage) -> None:
+        self._on_payload(cast('Payload', payload))
+
+    def _on_payload(self, payload: Payload) -> None:
+        deliveries: list[tuple[SharedTransport, Payload]] = []
+        to_server: list[Payload] = []
+        with self._lock:
+            method = payload.get('method')
+            if method is None:
+                self._route_response(payload, deliveries, to_server)
+            elif 'id' in payload:
+                self._route_server_request(payload, deliveries, to_server)
+            else:
+                self._route_notification(payload, deliveries)
+        for p in to_server:
+            self._send_to_server(p)
+        for client, p in deliveries:
+            client.deliver(p)
+
+    def _route_response(
+        self,
+        payload: Payload,
+        deliveries: list[tuple[SharedTransport, Payload]],
+        to_server: list[Payload]
+    ) -> None:
+        request_id = payload.get('id')
+        if not isinstance(request_id, int) or (request := self._requests.pop(request_id, None)) is None:
+            debug("shared language server sent a response for an unknown request:", request_id)
+            return
+        client, client_request_id, tokens = request
+        self._request_ids.pop((client.client_id, client_request_id), None)
+        for token in tokens:
+            self._tokens.pop(token, None)
+        deliveries.append((client, {**payload, 'id': client_request_id}))
+        if request_id != self._initialize_request_id:
+            return
+        pending = self._pending_initialize
+        self._pending_initialize = []
+        if 'result' in payload:
+            self._initialize_result = payload['result']
+        for client, client_request_id, folders in pending:
+            deliveries.append((client, {**payload, 'id': client_request_id}))
+            if self._initialize_result:
+                if notification := self._did_change_workspace_folders(self._retain_folders(client, folders), []):
+                    to_server.append(notification)
+
+    def _route_server_request(
+        self,
+        payload: Payload,
+        deliveries: list[tuple[SharedTransport, Payload]],
+        to_server: list[Payload]
+    ) -> None:
+        method = payload['method']
+        params: Any = payload.get('params')
+        if method == 'workspace/workspaceFolders':
+            to_server.append({'jsonrpc': '2.0', 'id': payload['id'], 'result': self.workspace_folders or None})
+            return
+        if method in FAN_OUT_METHODS or method.endswith('/refresh'):
+            clients = list(self._clients)
+        elif method == 'workspace/configuration':
+            items = params.get('items') if isinstance(params, dict) else None
+            scope_uri = items[0].get('scopeUri') if items else None
+            clients = self._clients_for_uri(scope_uri)[:1] if scope_uri else []
+        else:
+            clients = []
+        if not clients and self._active:
+            clients = [self._active]
+        if method == 'window/workDoneProgress/create' and clients:
+            self._server_tokens[params['token']] = clients[0]
+        self._server_requests.add(payload['id'])
+        deliveries.extend((client, payload) for client in clients)
+
+    def _route_notification(
+        self, payload: Payload, deliveries: list[tuple[SharedTransport, Payload]]
+    ) -> None:
+        method = payload['method']
+        params: Any = payload.get('params')
+        if method == '$/progress':
+            token = params['token']
+            if isinstance(token, str) and (rewritten := self._tokens.get(token)):
+                client, client_token = rewritten
+                deliveries.append((client, {**payload, 'params': {**params, 'token': client_token}}))
+                return
+            if client := self._server_tokens.get(token):
+                if params.get('value', {}).get('kind') == 'end':
+                    del self._server_tokens[token]
+                deliveries.append((client, payload))
+                return
+        elif method == 'textDocument/publishDiagnostics':
+            clients = self._clients_for_uri(params['uri'])
+            if clients:
+                deliveries.extend((client, payload) for client in clients)
+                return
+        if self._active:
+            deliveries.append((self._active, payload))
+
+    def _clients_for_uri(self, uri: str) -> list[SharedTransport]:
+        """The windows that have the document open, or else the windows that contain it in a workspace folder."""
+        if holders := self._documents.get(uri):
+            return list(holders)
+        scheme, path = parse_uri(uri)
+        if scheme != 'file':
+            return []
+        clients: list[SharedTransport] = []
+        for client in self._clients:
+            for folder_uri in client.folders:
+                _, folder_path = parse_uri(folder_uri)
+                if path == folder_path or path.startswith(folder_path.rstrip(os.sep) + os.sep):
+                    clients.append(client)
+                    break
+        return clients
+
+    # --- TransportCallbacks -----------------------------------------------------------------------------------------
+
+    def on_transport_close(self, exit_code: int, exception: Exception | None) -> None:
+        if g_multiplexers.get(self.key) is self:
+            del g_multiplexers[self.key]
+        g_closing_multiplexers.discard(self)
+        self.transport = None
+        with self._lock:
+            clients = self._clients
+            self._clients = []
+        for client in clients:
+            client.deliver_close(exit_code, exception)
+
+    def on_stderr_messages(self, messages: list[str]) -> None:
+        for client in list(self._clients):
+            client.deliver_stderr_messages(messages)
+
+    def ignored_notifications(self) -> Collection[str]:
+        return self._ignored_notifications
+
+    def on_ignored_notifications(self, counts: dict[str, int]) -> None:
+        if self._active:
+            self._active.deliver_ignored_notifications(counts)
@@ -93,6 +93,7 @@ from ..api import AbstractPlugin
 from ..api import APIHandler
 from ..api import LspPlugin
 from ..api import notification_handler
+from ..api import overridden_message_hooks
 from ..api import PostResponseCallback
 from ..api import request_handler
 from ..diagnostics import DiagnosticsIdentifier
@@ -123,7 +124,7 @@ from .open import center_selection
 from .open import open_externally
 from .open import open_file
 from .open import open_resource
-from .progress import WindowProgressReporter
+from .progress import WindowProgressAggregator
 from .promise import PackagedTask
 from .promise import Promise
 from .protocol import ClientNotification
@@ -143,8 +144,11 @@ from .protocol import ServerNotification
 from .protocol import ServerResponse
 from .settings import globalprefs
 from .settings import userprefs
+from .timeline import StartupTimeline
 from .transports import TransportCallbacks
 from .transports import TransportWrapper
+from .types import AdaptiveScheduler
+from .types import async_timer_wheel
 from .types import Capabilities
 from .types import ClientConfig
 from .types import ClientStates
@@ -171,6 +175,8 @@ from .workspace import is_subpath_of
 from .workspace import WorkspaceFolder
 from abc import ABC
 from abc import abstractmethod
+from collections import Counter
+from copy import deepcopy
 from enum import IntFlag
 from functools import lru_cache
 from functools import partial
@@ -179,10 +185,12 @@ from pathlib import Path
 from typing import Any
 from typing import Callable
 from typing import cast
+from typing import Collection
 from typing import Generator
 from typing import Literal
 from typing import overload
 from typing import Protocol
+from typing import Tuple
 from typing import TYPE_CHECKING
 from typing import Union
 from typing_extensions import TypeAlias
@@ -191,17 +199,21 @@ from urllib.parse import urldefrag
 from urllib.parse import urlparse
 from weakref import WeakSet
 import itertools
+import json
 import mdpopups
 import os
 import sublime
+import time
 import weakref
 
 if TYPE_CHECKING:
     from .active_request import ActiveRequest
     from .collections import DottedDict
+    from .session_multiplexer import SharedTransport
 
 
 InitCallback: TypeAlias = Callable[['Session', bool], None]
+ResponseHandlers: TypeAlias = Tuple[Request[Any, Any], Callable[[Any], None], Callable[[ResponseError], None]]
 
 
 class ViewStateActions(IntFlag):
@@ -326,7 +338,7 @@ class Manager(ABC):
         ...
 
     @abstractmethod
-    def handle_stderr_log(self, config_name: str, message: str) -> None:
+    def handle_stderr_log(self, config_name: str, messages: list[str]) -> None:
         ...
 
     @abstractmethod
@@ -765,6 +777,10 @@ class SessionBufferProtocol(Protocol):
     def last_synced_version(self) -> int:
         ...
 
+    @property
+    def response_cache(self) -> ResponseCache:
+        ...
+
     def get_uri(self) -> str | None:
         ...
 
@@ -959,6 +975,11 @@ class Logger(ABC):
     def stderr_message(self, message: str) -> None:
         pass
 
+    def stderr_messages(self, messages: list[str]) -> None:
+        """A batch of lines from the language server's log stream. Override this to log a batch at once."""
+        for message in messages:
+            self.stderr_message(message)
+
     @abstractmethod
     def outgoing_response(self, request_id: int | str, params: Any) -> None:
         pass
@@ -987,6 +1008,10 @@ class Logger(ABC):
     def incoming_notification(self, method: str, params: Any, unhandled: bool) -> None:
         pass
 
+    def log_ignored_notifications(self, counts: dict[str, int]) -> None:  # noqa: B027
+        """The number of notifications per method that were dropped because of the "ignored_notifications" setting."""
+        pass
+
 
 def print_to_status_bar(error: ResponseError) -> None:
     sublime.status_message(error["message"])
@@ -1026,6 +1051,162 @@ class _RegistrationData:
                 return
 
 
+MISSING_URI_CACHE_SIZE = 10000
+
+
+def _file_id(path: str) -> tuple[int, int] | None:
+    try:
+        st = Path(path).stat()
+    except (OSError, ValueError):
+        return None
+    # Some file systems on Windows don't provide file IDs.
+    return (st.st_dev, st.st_ino) if st.st_ino else None
+
+
+class SessionBufferIndex:
+    """
+    Finds the session buffer for a URI without comparing the URI to every session buffer.
+
+    Session buffers are indexed by their parsed URI and, for files, by the device and inode numbers of the file. A URI
+    that refers to an open file through another path, for instance through a symlink, thus costs a single `stat` call.
+    URIs without a session buffer are remembered until a session buffer is added or changes its URI.
+    """
+
+    def __init__(self) -> None:
+        self._by_uri: weakref.WeakValueDictionary[tuple[str, str], SessionBufferProtocol] = \
+            weakref.WeakValueDictionary()
+        self._by_file_id: weakref.WeakValueDictionary[tuple[int, int], SessionBufferProtocol] = \
+            weakref.WeakValueDictionary()
+        # session buffer -> (parsed URIs including aliases, file ID)
+        self._keys: weakref.WeakKeyDictionary[SessionBufferProtocol, tuple[list[tuple[str, str]], tuple[int, int] | None]] = weakref.WeakKeyDictionary()  # noqa: E501
+        self._missing: set[tuple[str, str]] = set()
+
+    def add(self, sb: SessionBufferProtocol) -> None:
+        """Add a session buffer, or update the index after its URI changed or its file was saved."""
+        self.discard(sb)
+        self._missing.clear()
+        if not (uri := sb.get_uri()):
+            return
+        key = parse_uri(uri)
+        file_id = _file_id(key[1]) if key[0] == "file" else None
+        self._by_uri[key] = sb
+        if file_id:
+            self._by_file_id[file_id] = sb
+        self._keys[sb] = ([key], file_id)
+
+    def discard(self, sb: SessionBufferProtocol) -> None:
+        if (entry := self._keys.pop(sb, None)) is None:
+            return
+        keys, file_id = entry
+        for key in keys:
+            if self._by_uri.get(key) is sb:
+                del self._by_uri[key]
+        if file_id and self._by_file_id.get(file_id) is sb:
+            del self._by_file_id[file_id]
+        # Another session buffer may refer to the same file.
+        for other, (other_keys, other_file_id) in self._keys.items():
+            if other_keys[0] in keys:
+                self._by_uri.setdefault(other_keys[0], other)
+            if file_id and other_file_id == file_id:
+                self._by_file_id.setdefault(file_id, other)
+
+    def get(self, uri: DocumentUri) -> SessionBufferProtocol | None:
+        key = parse_uri(uri)
+        if (sb := self._by_uri.get(key)) is not None:
+            return sb
+        if key in self._missing:
+            return None
+        if key[0] == "file" and (file_id := _file_id(key[1])) and (sb := self._by_file_id.get(file_id)) is not None:
+            # Remember the alias, so that the next lookup doesn't need a stat call.
+            self._by_uri[key] = sb
+            if entry := self._keys.get(sb):
+                entry[0].append(key)
+            return sb
+        if len(self._missing) >= MISSING_URI_CACHE_SIZE:
+            self._missing.clear()
+        self._missing.add(key)
+        return None
+
+
+COALESCED_METHODS = frozenset({
+    'textDocument/codeAction',
+    'textDocument/documentColor',
+    'textDocument/documentHighlight',
+    'textDocument/documentLink',
+    'textDocument/documentSymbol',
+    'textDocument/foldingRange',
+    'textDocument/hover',
+})
+"""Read-only requests for which identical requests that are pending at the same time share one server request."""
+
+CACHED_METHODS = frozenset({
+    'textDocument/codeLens',
+    'textDocument/documentColor',
+    'textDocument/documentLink',
+    'textDocument/documentSymbol',
+    'textDocument/foldingRange',
+    'textDocument/selectionRange',
+})
+"""Side-effect free requests whose results are cached per document version, see `ResponseCache`."""
+
+RESPONSE_CACHE_SIZE = 32
+
+MAX_EXPIRED_REQUEST_IDS = 1000
+"""The number of timed out or swept requests whose late responses are dropped silently."""
+
+RequestKey: TypeAlias = Tuple[str, str, int]
+
+
+def request_key(request: Request[Any, Any]) -> RequestKey | None:
+    """Identifies a request by its method, params and the version of the document of its view."""
+    if not request.view:
+        return None
+    try:
+        params = json.dumps(request.params, sort_keys=True)
+    except (TypeError, ValueError):
+        return None
+    return (request.method, params, request.view.change_count())
+
+
+class ResponseCache:
+    """
+    A size-bounded LRU cache of the results of side-effect free requests for one document.
+
+    Results are copied when they are stored and when they are returned, so that handlers can't modify cached results.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE) -> None:
+        self._max_entries = max_entries
+        self._entries: dict[RequestKey, Any] = {}  # In least recently used order.
+
+    def get(self, key: RequestKey) -> Any | None:
+        if (result := self._entries.pop(key, None)) is None:
+            return None
+        self._entries[key] = result
+        return deepcopy(result)
+
+    def put(self, key: RequestKey, result: Any) -> None:
+        if result is None:
+            return
+        self._entries.pop(key, None)
+        self._entries[key] = deepcopy(result)
+        while len(self._entries) > self._max_entries:
+            del self._entries[next(iter(self._entries))]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class _CoalescedRequest:
+    """A request that is sent to the server once, on behalf of every caller that sent an identical request."""
+
+    __slots__ = ('server_request_id', 'subscribers')
+
+    def __init__(self, server_request_id: int) -> None:
+        self.server_request_id = server_request_id
+        self.subscribers: dict[int, ResponseHandlers] = {}
+
+
 # These prefixes should disambiguate common string generation techniques like UUID4.
 _WORK_DONE_PROGRESS_PREFIX = "$ublime-work-done-progress-"
 _PARTIAL_RESULT_PROGRESS_PREFIX = "$ublime-partial-result-progress-"
@@ -1036,11 +1217,23 @@ class Session(APIHandler, TransportCallbacks):
     def __init__(self, manager: Manager, logger: Logger, workspace_folders: list[WorkspaceFolder],
                  config: ClientConfig, plugin_class: type[AbstractPlugin | LspPlugin] | None,
     ) -> None:
-        self.transport: TransportWrapper | None = None
+        self.transport: TransportWrapper | SharedTransport | None = None
+        self.startup_timeline = StartupTimeline()
+        self.scheduler = AdaptiveScheduler()
+        self._request_sent_times: dict[str | int, float] = {}
         self.working_directory: str | None = None
         self.request_id = 0  # Our request IDs are always integers.
         self._logger = logger
-        self._response_handlers: dict[str | int, tuple[Request[Any, Any], Callable[[Any], None], Callable[[ResponseError], None]]] = {}  # noqa: E501
+        self._response_handlers: dict[str | int, ResponseHandlers] = {}
+        self._coalesced_requests: dict[RequestKey, _CoalescedRequest] = {}
+        self._coalesced_request_keys: dict[int, RequestKey] = {}
+        # The requests sent to the server on behalf of coalesced requests, whose views are notified per caller.
+        self._coalesced_server_request_ids: set[str | int] = set()
+        # The requests answered from a response cache, whose results are about to be delivered.
+        self._cached_responses: dict[int, tuple[Request[Any, Any], Callable[[ResponseError], None]]] = {}
+        self._expired_request_ids: set[str | int] = set()
+        self.timed_out_requests: Counter[str] = Counter()
+        """The number of requests that timed out, per method."""
         self.config = config
         self.config_status_message = ''
         self.manager = weakref.ref(manager)
@@ -1048,7 +1241,7 @@ class Session(APIHandler, TransportCallbacks):
         self.state = ClientStates.STARTING
         self.capabilities = Capabilities()
         self.diagnostics = DiagnosticsStorage()
-        self.diagnostics_result_ids: dict[tuple[DocumentUri, DiagnosticsIdentifier], str | None] = {}
+        self.diagnostics_result_ids: dict[DiagnosticsIdentifier, dict[DocumentUri, str | None]] = {}
         self.workspace_diagnostics_pending_responses: dict[DiagnosticsIdentifier, int | None] = {}
         self.exiting = False
         self._registrations: dict[str, _RegistrationData] = {}
@@ -1059,7 +1252,9 @@ class Session(APIHandler, TransportCallbacks):
         self._workspace_folders = workspace_folders
         self._session_views: WeakSet[SessionViewProtocol] = WeakSet()
         self._session_buffers: WeakSet[SessionBufferProtocol] = WeakSet()
-        self._progress: dict[ProgressToken, WindowProgressReporter | None] = {}
+        self._session_buffer_index = SessionBufferIndex()
+        self._progress_tokens: set[ProgressToken] = set()
+        self._progress = WindowProgressAggregator(self.window, f"lspprogress{config.name}")
         self._watcher_impl = get_file_watcher_implementation()
         self._static_file_watchers: list[FileWatcher] = []
         self._dynamic_file_watchers: dict[str, list[FileWatcher]] = {}
@@ -1069,7 +1264,11 @@ class Session(APIHandler, TransportCallbacks):
         self._semantic_tokens_map = get_semantic_tokens_map(config.semantic_tokens)
         self._is_executing_refactoring_command = False
         self._logged_unsupported_commands: set[str] = set()
+        self._dispatch_table: dict[str, tuple[str, bool] | None] = {}
+        self._plugin_hooks: frozenset[str] = frozenset()
+        self._plugin_methods: frozenset[str] | None = None
         super().__init__()
+        self._compile_dispatch_table()
 
     # TODO: Create an assurance that the API doesn't change here as it can be used by plugins.
     def get_workspace_folders(self) -> list[WorkspaceFolder]:
@@ -1089,6 +1288,7 @@ class Session(APIHandler, TransportCallbacks):
 
     def unregister_session_view_async(self, sv: SessionViewProtocol) -> None:
         self._session_views.discard(sv)
+        self._sweep_requests_of_closed_views_async()
         if not self._session_views:
             current_count = self._views_opened
             debounced(self.end_async, 3000, lambda: self._views_opened == current_count, async_thread=True)
@@ -1120,6 +1320,7 @@ class Session(APIHandler, TransportCallbacks):
 
     def register_session_buffer_async(self, sb: SessionBufferProtocol) -> None:
         self._session_buffers.add(sb)
+        self._session_buffer_index.add(sb)
         for data in self._registrations.values():
             data.check_applicable(sb, suppress_requests=True)
         if (uri := sb.get_uri()) and (diagnostics := self.diagnostics.get_diagnostics_for_uri(uri)):
@@ -1132,39 +1333,19 @@ class Session(APIHandler, TransportCallbacks):
 
     def unregister_session_buffer_async(self, sb: SessionBufferProtocol) -> None:
         self._session_buffers.discard(sb)
+        self._session_buffer_index.discard(sb)
+
+    def reindex_session_buffer_async(self, sb: SessionBufferProtocol) -> None:
+        """Call this when the URI of a session buffer has changed, or when its file was saved."""
+        if sb in self._session_buffers:
+            self._session_buffer_index.add(sb)
 
     def session_buffers_async(self) -> Generator[SessionBufferProtocol, None, None]:
         """It is only safe to iterate over this in the async thread."""
         yield from self._session_buffers
 
     def get_session_buffer_for_uri_async(self, uri: DocumentUri) -> SessionBufferProtocol | None:
-        scheme, path = parse_uri(uri)
-        if scheme == "file":
-
-            def compare_by_samefile(sb: SessionBufferProtocol | None) -> bool:
-                if not sb:
-                    return False
-                candidate = sb.get_uri()
-                if not isinstance(candidate, str):
-                    return False
-                candidate_scheme, candidate_path = parse_uri(candidate)
-                if candidate_scheme != "file":
-                    return False
-                if path == candidate_path:
-                    return True
-                try:
-                    return os.path.samefile(path, candidate_path)
-                except FileNotFoundError:
-                    return False
-
-            predicate = compare_by_samefile
-        else:
-
-            def compare_by_string(sb: SessionBufferProtocol | None) -> bool:
-                return sb.get_uri() == path if sb else False
-
-            predicate = compare_by_string
-        return next(filter(predicate, self.session_buffers_async()), None)
+        return self._session_buffer_index.get(uri)
 
     # --- capability observers -----------------------------------------------------------------------------------------
 
@@ -1288,11 +1469,11 @@ class Session(APIHandler, TransportCallbacks):
         self,
         variables: dict[str, str],
         working_directory: str | None,
-        transport: TransportWrapper,
+        transport: TransportWrapper | SharedTransport,
         init_callback: InitCallback
     ) -> None:
         if self._plugin_class and issubclass(self._plugin_class, LspPlugin):
-            self._plugin = self._plugin_class(weakref.ref(self))
+            self._set_plugin(self._plugin_class(weakref.ref(self)))
         self.transport = transport
         self.working_directory = working_directory
         self._variables = variables
@@ -1300,8 +1481,12 @@ class Session(APIHandler, TransportCallbacks):
         self._init_callback = init_callback
         self.send_request_async(
             Request.initialize(params), self._handle_initialize_success, self._handle_initialize_error)
+        self.startup_timeline.mark("initialize sent")
 
     def _handle_initialize_success(self, result: InitializeResult) -> None:
+        self.startup_timeline.mark("initialize response")
+        if self.transport and (first_payload_time := self.transport.first_payload_time) is not None:
+            self.startup_timeline.mark("first message received", first_payload_time)
         capabilities = result['capabilities']
         self.capabilities.assign(capabilities)
         if self._workspace_folders and not self._supports_workspace_folders():
@@ -1313,9 +1498,11 @@ class Session(APIHandler, TransportCallbacks):
             # We've missed calling the "on_server_response_async" API as plugin was not created yet.
             # Handle it now and use fake request ID since it shouldn't matter.
             if issubclass(self._plugin_class, AbstractPlugin):
-                self._plugin = self._plugin_class(weakref.ref(self))
-                self._plugin.on_server_response_async('initialize', Response[InitializeResult](-1, result))
+                plugin = self._plugin_class(weakref.ref(self))
+                self._set_plugin(plugin)
+                plugin.on_server_response_async('initialize', Response[InitializeResult](-1, result))
         self.send_notification(Notification.initialized())
+        self.startup_timeline.mark("initialized sent")
         if self._plugin and isinstance(self._plugin, LspPlugin):
             self._plugin.on_initialized_async()
         self._maybe_send_did_change_configuration()
@@ -1359,9 +1546,18 @@ class Session(APIHandler, TransportCallbacks):
         return folder_excludes + file_excludes + ['**/node_modules/**']
 
     def on_stderr_message(self, message: str) -> None:
+        self.on_stderr_messages([message])
+
+    def on_stderr_messages(self, messages: list[str]) -> None:
         if mgr := self.manager():
-            mgr.handle_stderr_log(self.config.name, message)
-        self._logger.stderr_message(message)
+            mgr.handle_stderr_log(self.config.name, messages)
+        self._logger.stderr_messages(messages)
+
+    def ignored_notifications(self) -> Collection[str]:
+        return self.config.ignored_notifications
+
+    def on_ignored_notifications(self, counts: dict[str, int]) -> None:
+        self._logger.log_ignored_notifications(counts)
 
     def _supports_workspace_folders(self) -> bool:
         return self.has_capability("workspace.workspaceFolders.supported")
@@ -2036,8 +2232,8 @@ class Session(APIHandler, TransportCallbacks):
 
     def _do_workspace_diagnostics_async(self, identifier: DiagnosticsIdentifier) -> None:
         previous_result_ids: list[PreviousResultId] = [
-            {'uri': uri, 'value': result_id} for (uri, id_), result_id in self.diagnostics_result_ids.items()
-            if id_ == identifier and result_id is not None
+            {'uri': uri, 'value': result_id}
+            for uri, result_id in self.diagnostics_result_ids.get(identifier, {}).items() if result_id is not None
         ]
         params: WorkspaceDiagnosticParams = {'previousResultIds': previous_result_ids}
         if identifier is not None:
@@ -2059,6 +2255,8 @@ class Session(APIHandler, TransportCallbacks):
     ) -> None:
         if reset_pending_response:
             self.workspace_diagnostics_pending_responses[identifier] = None
+        result_ids = self.diagnostics_result_ids.setdefault(identifier, {})
+        reports: list[tuple[DocumentUri, int | None, list[Diagnostic]]] = []
         for diagnostic_report in response['items']:
             uri = normalize_uri(diagnostic_report['uri'])
             version = diagnostic_report['version']
@@ -2066,9 +2264,10 @@ class Session(APIHandler, TransportCallbacks):
             if isinstance(version, int) and (session_buffer := self.get_session_buffer_for_uri_async(uri)) and \
                     version < session_buffer.last_synced_version:
                 continue
-            self.diagnostics_result_ids[(uri, identifier)] = diagnostic_report.get('resultId')
+            result_ids[uri] = diagnostic_report.get('resultId')
             if is_workspace_full_document_diagnostic_report(diagnostic_report):
-                self.handle_diagnostics_async(uri, identifier, version, diagnostic_report['items'])
+                reports.append((uri, version, diagnostic_report['items']))
+        self._handle_diagnostics_batch_async(identifier, reports)
 
     def _on_workspace_diagnostics_error_async(self, identifier: DiagnosticsIdentifier, error: ResponseError) -> None:
         if error['code'] == LSPErrorCodes.ServerCancelled:
@@ -2137,6 +2336,7 @@ class Session(APIHandler, TransportCallbacks):
 
     @request_handler('workspace/codeLens/refresh')
     def on_workspace_code_lens_refresh(self, _: None) -> tuple[Promise[None], PostResponseCallback]:
+        self.clear_response_caches_async()
 
         def continue_after_response() -> None:
             visible_session_buffers, not_visible_session_buffers = self.session_buffers_by_visibility()
@@ -2149,6 +2349,7 @@ class Session(APIHandler, TransportCallbacks):
 
     @request_handler('workspace/semanticTokens/refresh')
     def on_workspace_semantic_tokens_refresh(self, _: None) -> tuple[Promise[None], PostResponseCallback]:
+        self.clear_response_caches_async()
 
         def continue_after_response() -> None:
             visible_session_buffers, not_visible_session_buffers = self.session_buffers_by_visibility()
@@ -2164,6 +2365,7 @@ class Session(APIHandler, TransportCallbacks):
 
     @request_handler('workspace/inlayHint/refresh')
     def on_workspace_inlay_hint_refresh(self, _: None) -> tuple[Promise[None], PostResponseCallback]:
+        self.clear_response_caches_async()
 
         def continue_after_response() -> None:
             visible_session_buffers, not_visible_session_buffers = self.session_buffers_by_visibility()
@@ -2179,6 +2381,7 @@ class Session(APIHandler, TransportCallbacks):
 
     @request_handler('workspace/diagnostic/refresh')
     def on_workspace_diagnostic_refresh(self, _: None) -> tuple[Promise[None], PostResponseCallback]:
+        self.clear_response_caches_async()
         return (Promise.resolve(None), self._refresh_diagnostics)
 
     def _refresh_diagnostics(self) -> None:
@@ -2211,18 +2414,38 @@ class Session(APIHandler, TransportCallbacks):
     def handle_diagnostics_async(
         self, uri: DocumentUri, identifier: DiagnosticsIdentifier, version: int | None, diagnostics: list[Diagnostic]
     ) -> None:
+        self._handle_diagnostics_batch_async(identifier, [(normalize_uri(uri), version, diagnostics)])
+
+    def _handle_diagnostics_batch_async(
+        self, identifier: DiagnosticsIdentifier, reports: list[tuple[DocumentUri, int | None, list[Diagnostic]]]
+    ) -> None:
+        """
+        Store the diagnostics of many documents at once, and republish them to the documents that are open.
+
+        :param identifier: The identifier of the diagnostics stream.
+        :param reports: The normalized URI, version and diagnostics of each document.
+        """
         mgr = self.manager()
         if not mgr:
             return
-        reason = mgr.should_ignore_diagnostics(uri, self.config)
-        if isinstance(reason, str):
-            debug("ignoring unsuitable diagnostics for", uri, "reason:", reason)
+        accepted: dict[DocumentUri, list[Diagnostic]] = {}
+        versions: dict[DocumentUri, int | None] = {}
+        for uri, version, diagnostics in reports:
+            reason = mgr.should_ignore_diagnostics(uri, self.config)
+            if isinstance(reason, str):
+                debug("ignoring unsuitable diagnostics for", uri, "reason:", reason)
+                continue
+            accepted[uri] = diagnostics
+            versions[uri] = version
+        if not accepted:
             return
-        self.diagnostics.set_diagnostics(uri, identifier, diagnostics)
+        self.diagnostics.set_diagnostics_batch(identifier, accepted)
+        self.startup_timeline.mark("first diagnostics")
         mgr.on_diagnostics_updated()
-        if session_buffer := self.get_session_buffer_for_uri_async(uri):
-            self._publish_diagnostics_to_session_buffer_async(
-                session_buffer, self.diagnostics.get_diagnostics_for_uri(uri), version)
+        for uri, version in versions.items():
+            if session_buffer := self.get_session_buffer_for_uri_async(uri):
+                self._publish_diagnostics_to_session_buffer_async(
+                    session_buffer, self.diagnostics.get_diagnostics_for_uri(uri), version)
 
     def clear_diagnostics_for_uri(self, uri: DocumentUri) -> None:
         self.diagnostics.clear_diagnostics(uri)
@@ -2349,7 +2572,7 @@ class Session(APIHandler, TransportCallbacks):
 
     @request_handler('window/workDoneProgress/create')
     def on_window_work_done_progress_create(self, params: WorkDoneProgressCreateParams) -> Promise[None]:
-        self._progress[params['token']] = None
+        self._progress_tokens.add(params['token'])
         return Promise.resolve(None)
 
     def _invoke_views(self, request: Request[Any, Any], method: str, *args: Any) -> None:
@@ -2360,18 +2583,17 @@ class Session(APIHandler, TransportCallbacks):
             for sv in self.session_views_async():
                 getattr(sv, method)(*args)
 
-    def _create_window_progress_reporter(self, token: ProgressToken, value: WorkDoneProgressBegin) -> None:
-        self._progress[token] = WindowProgressReporter(
-            window=self.window,
-            key=f"lspprogress{self.config.name}{token}",
-            title=value["title"],
-            message=value.get("message")
-        )
-
     @notification_handler('$/progress')
     def on_progress(self, params: ProgressParams) -> None:
         token = params['token']
         value = params['value']
+        # Servers may report progress on their own tokens many times per second, so check for those before trying to
+        # parse the token.
+        if token in self._progress_tokens:
+            if isinstance(value, dict) and 'kind' in value:
+                self._on_work_done_progress(
+                    token, cast('WorkDoneProgressBegin | WorkDoneProgressReport | WorkDoneProgressEnd', value))
+            return
         # Partial Result Progress
         # https://microsoft.github.io/language-server-protocol/specifications/specification-current/#partialResults
         if isinstance(token, str) and token.startswith(_PARTIAL_RESULT_PROGRESS_PREFIX):
@@ -2383,49 +2605,47 @@ class Session(APIHandler, TransportCallbacks):
         # Work Done Progress
         # https://microsoft.github.io/language-server-protocol/specifications/specification-current/#workDoneProgress
         if isinstance(value, dict) and 'kind' in value:
-            kind = value['kind']
-            if token not in self._progress:
-                # If the token is not in the _progress map then that could mean two things:
-                #
-                # 1) The server is reporting on our client-initiated request progress. In that case, the progress token
-                #    should be of the form $_WORK_DONE_PROGRESS_PREFIX$RequestId. We try to parse it, and if it
-                #    succeeds, we can delegate to the appropriate session view instances.
-                #
-                # 2) The server is not spec-compliant and reports progress using server-initiated progress but didn't
-                #    call window/workDoneProgress/create before hand. In that case, we check the 'kind' field of the
-                #    progress data. If the 'kind' field is 'begin', we set up a progress reporter anyway.
-                try:
-                    token = str(token)
-                    request_id = int(token[len(_WORK_DONE_PROGRESS_PREFIX):])
-                    request = self._response_handlers[request_id][0]
-                    self._invoke_views(request, "on_request_progress", request_id, params)
-                except (TypeError, IndexError, ValueError, KeyError):
-                    # The parse failed so possibility (1) is apparently not applicable. At this point we may still be
-                    # dealing with possibility (2).
-                    if kind == 'begin':
-                        # We are dealing with possibility (2), so create the progress reporter now.
-                        value = cast('WorkDoneProgressBegin', value)
-                        self._create_window_progress_reporter(token, value)
-                    else:
-                        debug(f'unknown $/progress token: {token}')
-                return
-            if kind == 'begin':
-                value = cast('WorkDoneProgressBegin', value)
-                self._create_window_progress_reporter(token, value)
-            elif kind == 'report':
-                value = cast('WorkDoneProgressReport', value)
-                progress = self._progress[token]
-                assert isinstance(progress, WindowProgressReporter)
-                progress(value.get("message"), value.get("percentage"))
-            elif kind == 'end':
-                value = cast('WorkDoneProgressEnd', value)
-                progress = self._progress.pop(token)
-                assert isinstance(progress, WindowProgressReporter)
-                title = progress.title
-                progress = None
-                message = value.get('message')
-                if message:
-                    self.window.status_message(title + ': ' + message)
+            # The token was not created with window/workDoneProgress/create. That could mean two things:
+            #
+            # 1) The server is reporting on our client-initiated request progress. In that case, the progress token
+            #    should be of the form $_WORK_DONE_PROGRESS_PREFIX$RequestId. We try to parse it, and if it
+            #    succeeds, we can delegate to the appropriate session view instances.
+            #
+            # 2) The server is not spec-compliant and reports progress using server-initiated progress but didn't
+            #    call window/workDoneProgress/create before hand. In that case, we check the 'kind' field of the
+            #    progress data. If the 'kind' field is 'begin', we set up progress reporting anyway.
+            try:
+                token = str(token)
+                request_id = int(token[len(_WORK_DONE_PROGRESS_PREFIX):])
+                request = self._response_handlers[request_id][0]
+                self._invoke_views(request, "on_request_progress", request_id, params)
+            except (TypeError, IndexError, ValueError, KeyError):
+                # The parse failed so possibility (1) is apparently not applicable. At this point we may still be
+                # dealing with possibility (2).
+                if value['kind'] == 'begin':
+                    # We are dealing with possibility (2), so start progress reporting now.
+                    self._progress_tokens.add(token)
+                    self._on_work_done_progress(token, cast('WorkDoneProgressBegin', value))
+                else:
+                    debug(f'unknown $/progress token: {token}')
+
+    def _on_work_done_progress(
+        self, token: ProgressToken, value: WorkDoneProgressBegin | WorkDoneProgressReport | WorkDoneProgressEnd
+    ) -> None:
+        kind = value['kind']
+        if kind == 'begin':
+            value = cast('WorkDoneProgressBegin', value)
+            self._progress.begin(token, value["title"], value.get("message"), value.get("percentage"))
+        elif kind == 'report':
+            value = cast('WorkDoneProgressReport', value)
+            self._progress.report(token, value.get("message"), value.get("percentage"))
+        elif kind == 'end':
+            value = cast('WorkDoneProgressEnd', value)
+            self._progress_tokens.discard(token)
+            title = self._progress.end(token)
+            message = value.get('message')
+            if title is not None and message:
+                self.window.status_message(title + ': ' + message)
 
     # --- shutdown dance -----------------------------------------------------------------------------------------------
 
@@ -2436,7 +2656,7 @@ class Session(APIHandler, TransportCallbacks):
         self.exiting = True
         if self._plugin:
             self._plugin.on_session_end_async(None, None)
-            self._plugin = None
+            self._set_plugin(None)
         for sv in self.session_views_async():
             self.shutdown_session_view_async(sv)
         self.capabilities.clear()
@@ -2456,6 +2676,7 @@ class Session(APIHandler, TransportCallbacks):
         session_view.shutdown_async()
 
     def _handle_shutdown_result(self, _: Any) -> None:
+        self._progress_tokens.clear()
         self._progress.clear()
         self.exit()
 
@@ -2463,10 +2684,20 @@ class Session(APIHandler, TransportCallbacks):
         self.exiting = True
         self.state = ClientStates.STOPPING
         self.transport = None
+        for request_id in self._response_handlers:
+            async_timer_wheel.cancel((self._on_request_deadline_async, request_id))
         self._response_handlers.clear()
+        self._request_sent_times.clear()
+        self._progress_tokens.clear()
+        self._progress.clear()
+        self._expired_request_ids.clear()
+        self._coalesced_requests.clear()
+        self._coalesced_request_keys.clear()
+        self._coalesced_server_request_ids.clear()
+        self._cached_responses.clear()
         if self._plugin:
             self._plugin.on_session_end_async(exit_code, exception)
-            self._plugin = None
+            self._set_plugin(None)
         if self._initialize_error:
             # Override potential exit error with a saved one.
             exit_code, exception = self._initialize_error
@@ -2487,20 +2718,48 @@ class Session(APIHandler, TransportCallbacks):
         """You must call this method from Sublime's worker thread. Callbacks will run in Sublime's worker thread."""
         self.request_id += 1
         request_id = self.request_id
+        on_error = on_error or (lambda _: None)
+        if cached := self._response_cache_for_request(request):
+            cache, cache_key = cached
+            if (result := cache.get(cache_key)) is not None:
+                # The result is delivered later like a response, so that the request can still be canceled.
+                self._cached_responses[request_id] = (request, on_error)
+                self._invoke_views(request, "on_request_started_async", request_id, request)
+                sublime.set_timeout_async(partial(self._deliver_cached_response_async, request_id, on_result, result))
+                return request_id
+            on_result = partial(self._on_cacheable_response_async, cache, cache_key, on_result)
         if request.progress and isinstance(request.params, dict):
             request.params["workDoneToken"] = _WORK_DONE_PROGRESS_PREFIX + str(request_id)
         if request.on_partial_result and isinstance(request.params, dict):
             request.params["partialResultToken"] = _PARTIAL_RESULT_PROGRESS_PREFIX + str(request_id)
-        on_error = on_error or (lambda _: None)
+        if key := self._coalescing_key(request):
+            self._coalesced_request_keys[request_id] = key
+            if coalesced := self._coalesced_requests.get(key):
+                # An identical request is pending. Wait for its response instead of sending another request.
+                coalesced.subscribers[request_id] = (request, on_result, on_error)
+                self._invoke_views(request, "on_request_started_async", request_id, request)
+                return request_id
+            coalesced = self._coalesced_requests[key] = _CoalescedRequest(request_id)
+            self._coalesced_server_request_ids.add(request_id)
+            coalesced.subscribers[request_id] = (request, on_result, on_error)
+            on_result = partial(self._on_coalesced_response_async, key, False)
+            on_error = partial(self._on_coalesced_response_async, key, True)
         self._response_handlers[request_id] = (request, on_result, on_error)
+        if timeout := self.config.request_timeouts.get(request.method):
+            async_timer_wheel.schedule(
+                (self._on_request_deadline_async, request_id), int(timeout * 1000),
+                partial(self._on_request_deadline_async, request_id, request, timeout))
         self._invoke_views(request, "on_request_started_async", request_id, request)
-        if self._plugin and isinstance(self._plugin, AbstractPlugin):
+        if not self._plugin_intercepts('on_pre_send_request_async', request.method):
+            pass
+        elif isinstance(self._plugin, AbstractPlugin):
             self._plugin.on_pre_send_request_async(request_id, request)
         elif self._plugin:
             client_request = cast('ClientRequest', cast('object', {'method': request.method, 'params': request.params}))
             self._plugin.on_pre_send_request_async(client_request, request.view)
             request.params = cast('P_contra', client_request['params'])
         self._logger.outgoing_request(request_id, request.method, request.params)
+        self._request_sent_times[request_id] = time.monotonic()
         self.send_payload(request.to_payload(request_id))
         return request_id
 
@@ -2525,7 +2784,126 @@ class Session(APIHandler, TransportCallbacks):
         request_id = self.send_request_async(request, resolver, lambda x: resolver(Error.from_lsp(x)))
         return (promise, request_id)
 
+    def _coalescing_key(self, request: Request[Any, Any]) -> RequestKey | None:
+        if request.method not in COALESCED_METHODS or request.progress or request.on_partial_result:
+            return None
+        return request_key(request)
+
+    def _response_cache_for_request(self, request: Request[Any, Any]) -> tuple[ResponseCache, RequestKey] | None:
+        if request.method not in CACHED_METHODS or request.on_partial_result or not request.view:
+            return None
+        if (sv := self.session_view_for_view_async(request.view)) and (key := request_key(request)):
+            return (sv.session_buffer.response_cache, key)
+        return None
+
+    def _on_cacheable_response_async(
+        self, cache: ResponseCache, key: RequestKey, on_result: Callable[[Any], None], result: Any
+    ) -> None:
+        cache.put(key, result)
+        on_result(result)
+
+    def _deliver_cached_response_async(self, request_id: int, on_result: Callable[[Any], None], result: Any) -> None:
+        if not (cached := self._cached_responses.pop(request_id, None)):
+            return  # The request was canceled.
+        self._invoke_views(cached[0], "on_request_finished_async", request_id)
+        on_result(result)
+
+    def clear_response_caches_async(self) -> None:
+        for sb in self.session_buffers_async():
+            sb.response_cache.clear()
+
+    def _on_coalesced_response_async(self, key: RequestKey, is_error: bool, result: Any) -> None:
+        if not (coalesced := self._coalesced_requests.pop(key, None)):
+            return
+        # Handlers may modify their result in place, so each caller after the first one gets its own copy, made before
+        # any handler runs.
+        results = [result] + [deepcopy(result) for _ in range(len(coalesced.subscribers) - 1)]
+        for (request_id, (request, on_result, on_error)), own_result in zip(coalesced.subscribers.items(), results):
+            del self._coalesced_request_keys[request_id]
+            self._invoke_views(request, "on_request_finished_async", request_id)
+            try:
+                (on_error if is_error else on_result)(own_result)
+            except Exception as ex:
+                exception_log(f"Error handling response to {request.method}", ex)
+
+    def _cancel_coalesced_request_async(self, request_id: int, key: RequestKey) -> None:
+        """
+        Cancel the request of a single caller. The server request is canceled when no caller is left. A caller that is
+        canceled is detached from the server request, so the views of that caller aren't told that it finished.
+        """
+        if not (coalesced := self._coalesced_requests.get(key)):
+            return
+        request, _, error_handler = coalesced.subscribers.pop(request_id)
+        error_handler({"code": LSPErrorCodes.RequestCancelled, "message": "Request canceled by client"})
+        self._invoke_views(request, "on_request_canceled_async", request_id)
+        if coalesced.subscribers:
+            return
+        del self._coalesced_requests[key]
+        server_request_id = coalesced.server_request_id
+        if server_request_id in self._response_handlers:
+            self.send_notification(Notification("$/cancelRequest", {"id": server_request_id}))
+            server_request = self._response_handlers[server_request_id][0]
+            self._response_handlers[server_request_id] = (server_request, lambda *args: None, lambda *args: None)
+
+    def _on_request_deadline_async(self, request_id: int, request: Request[Any, Any], timeout: float) -> None:
+        if (handlers := self._response_handlers.get(request_id)) is None or handlers[0] is not request:
+            return
+        self.timed_out_requests[request.method] += 1
+        debug(f"{self.config.name}: {request.method} request {request_id} timed out after {timeout:g} s")
+        self._expire_request_async(request_id, {
+            "code": LSPErrorCodes.RequestFailed, "message": f"Request timed out after {timeout:g} seconds"})
+
+    def _expire_request_async(self, request_id: int | str, error: ResponseError) -> None:
+        """Cancel a pending request and forget about it, so that its late response is dropped."""
+        if not (handlers := self._response_handlers.pop(request_id, None)):
+            return
+        self._request_sent_times.pop(request_id, None)
+        async_timer_wheel.cancel((self._on_request_deadline_async, request_id))
+        request, _, error_handler = handlers
+        if len(self._expired_request_ids) >= MAX_EXPIRED_REQUEST_IDS:
+            self._expired_request_ids.clear()
+        self._expired_request_ids.add(request_id)
+        self.send_notification(Notification("$/cancelRequest", {"id": request_id}))
+        self._finish_request_async(request, request_id)
+        error_handler(error)
+
+    def _finish_request_async(self, request: Request[Any, Any], request_id: int | str) -> None:
+        if request_id in self._coalesced_server_request_ids:
+            # Only the callers that are still subscribed are finished, by the handlers of the coalesced request.
+            self._coalesced_server_request_ids.discard(request_id)
+            return
+        self._invoke_views(request, "on_request_finished_async", request_id)
+
+    def _sweep_requests_of_closed_views_async(self) -> None:
+        """Cancel the pending requests that were sent for views that have been closed since."""
+        # Server requests of coalesced requests are canceled through their subscribers.
+        coalesced_ids = {coalesced.server_request_id for coalesced in self._coalesced_requests.values()}
+        request_ids = {
+            request_id for request_id, (request, _, _) in self._response_handlers.items()
+            if request.view and not request.view.is_valid() and request_id not in coalesced_ids
+        }
+        request_ids.update(
+            request_id for coalesced in self._coalesced_requests.values()
+            for request_id, (request, _, _) in coalesced.subscribers.items()
+            if request.view and not request.view.is_valid()
+        )
+        for request_id in request_ids:
+            if isinstance(request_id, int) and request_id in self._coalesced_request_keys:
+                # Requests for other views may still be waiting for the same response.
+                self.cancel_request_async(request_id)
+            else:
+                self._expire_request_async(request_id, {
+                    "code": LSPErrorCodes.RequestCancelled, "message": "Request canceled because its view was closed"})
+
     def cancel_request_async(self, request_id: int) -> None:
+        if cached := self._cached_responses.pop(request_id, None):
+            request, error_handler = cached
+            error_handler({"code": LSPErrorCodes.RequestCancelled, "message": "Request canceled by client"})
+            self._invoke_views(request, "on_request_canceled_async", request_id)
+            return
+        if key := self._coalesced_request_keys.pop(request_id, None):
+            self._cancel_coalesced_request_async(request_id, key)
+            return
         if request_id in self._response_handlers:
             self.send_notification(Notification("$/cancelRequest", {"id": request_id}))
             request, _, error_handler = self._response_handlers[request_id]
@@ -2534,7 +2912,9 @@ class Session(APIHandler, TransportCallbacks):
             self._response_handlers[request_id] = (request, lambda *args: None, lambda *args: None)
 
     def send_notification(self, notification: Notification[P_contra]) -> None:
-        if self._plugin and isinstance(self._plugin, AbstractPlugin):
+        if not self._plugin_intercepts('on_pre_send_notification_async', notification.method):
+            pass
+        elif isinstance(self._plugin, AbstractPlugin):
             self._plugin.on_pre_send_notification_async(notification)
         elif self._plugin:
             client_notification = cast('ClientNotification',
@@ -2584,7 +2964,9 @@ class Session(APIHandler, TransportCallbacks):
             else:
                 res = (handler, result, None, "notification", method)
                 self._logger.incoming_notification(method, result, res[0] is None)
-                if self._plugin and isinstance(self._plugin, AbstractPlugin):
+                if not self._plugin_intercepts('on_server_notification_async', method):
+                    pass
+                elif isinstance(self._plugin, AbstractPlugin):
                     self._plugin.on_server_notification_async(Notification(method, result))
                 elif self._plugin:
                     server_notification = cast('ServerNotification',
@@ -2599,7 +2981,7 @@ class Session(APIHandler, TransportCallbacks):
             handler, method, result, is_error = self.response_handler(response_id, payload)
             self._logger.incoming_response(response_id, result, is_error)
             response = Response(response_id, result)
-            if not is_error and self._plugin:
+            if not is_error and self._plugin and self._plugin_intercepts('on_server_response_async', method):
                 if isinstance(self._plugin, AbstractPlugin):
                     self._plugin.on_server_response_async(cast('str', method), response)
                 else:
@@ -2634,9 +3016,10 @@ class Session(APIHandler, TransportCallbacks):
                 exception_log(f"Error handling {typestr}", err)
                 return
             if isinstance(result_promise, Promise):
-                result_promise \
-                    .then(lambda r: self._handle_plugin_on_pre_send_response_async(method, result, r)) \
-                    .then(self.send_response)
+                if self._plugin_intercepts('on_pre_send_response_async', method):
+                    result_promise = result_promise \
+                        .then(lambda r: self._handle_plugin_on_pre_send_response_async(method, result, r))
+                result_promise.then(self.send_response)
 
     def _handle_plugin_on_pre_send_response_async(
         self, method: str | None, params: Any, response: Response[Any]
@@ -2649,13 +3032,21 @@ class Session(APIHandler, TransportCallbacks):
     def response_handler(
         self, response_id: str | int, response: JSONRPCMessage
     ) -> tuple[Callable[[ResponseError], None], str | None, Any, bool]:
-        matching_handler = self._response_handlers.pop(response_id)
+        matching_handler = self._response_handlers.pop(response_id, None)
+        sent_time = self._request_sent_times.pop(response_id, None)
+        async_timer_wheel.cancel((self._on_request_deadline_async, response_id))
+        if not matching_handler and response_id in self._expired_request_ids:
+            # The request has timed out or its view was closed; the error handler has already been called.
+            self._expired_request_ids.discard(response_id)
+            return (lambda _: None, None, None, True)
         if not matching_handler:
             error = {"code": ErrorCodes.InvalidParams, "message": f"unknown response ID {response_id}"}
             return (print_to_status_bar, None, error, True)
         request, handler, error_handler = matching_handler
-        self._invoke_views(request, "on_request_finished_async", response_id)
+        self._finish_request_async(request, response_id)
         if "result" in response and "error" not in response:
+            if sent_time is not None:
+                self.scheduler.record(request.method, time.monotonic() - sent_time)
             return (handler, request.method, response["result"], False)
         if "result" not in response and "error" in response:
             error = response["error"]
@@ -2665,14 +3056,45 @@ class Session(APIHandler, TransportCallbacks):
 
     def _get_handler(self, method: str) -> Callable | None:
         """If we don't have a request/notification handler, look up the request/notification handler in the plugin."""
-        name = method2attr(method)
-        if self._plugin:
-            # Handler added through decorator.
-            if handler_name := self._plugin.handler_attr_map.get(name):
-                return getattr(self._plugin, handler_name)
-            # Handler added through 'm_*' method.
-            if isinstance(self._plugin, AbstractPlugin) and (plugin_handler := getattr(self._plugin, name, None)):
-                return plugin_handler
-        if handler_name := self.handler_attr_map.get(name):
-            return getattr(self, handler_name)
+        try:
+            entry = self._dispatch_table[method]
+        except KeyError:
+            entry = self._dispatch_table[method] = self._resolve_plugin_handler(method)
+        if entry is None:
+            return None
+        name, on_plugin = entry
+        return getattr(self._plugin if on_plugin else self, name)
+
+    def _set_plugin(self, plugin: AbstractPlugin | LspPlugin | None) -> None:
+        self._plugin = plugin
+        self._compile_dispatch_table()
+        self._plugin_hooks = overridden_message_hooks(plugin) if plugin else frozenset()
+        self._plugin_methods = plugin.intercepted_methods if isinstance(plugin, LspPlugin) else None
+
+    def _plugin_intercepts(self, hook: str, method: str | None) -> bool:
+        """Whether the plugin overrides the per-message `hook` and wants to be called for messages with `method`."""
+        return hook in self._plugin_hooks and (self._plugin_methods is None or method in self._plugin_methods)
+
+    def _compile_dispatch_table(self) -> None:
+        """
+        Map every method that has a handler to the name of the handler and whether it's a method of the plugin, so that
+        dispatching an incoming message is a single lookup. Handlers of the plugin take precedence over our own.
+        Methods that aren't in the table are resolved on their first use, and the result is added to the table.
+        """
+        table: dict[str, tuple[str, bool] | None] = {}
+        for method, name in self.method_handler_map.items():
+            table[method] = (name, False)
+        plugin = self._plugin
+        if plugin:
+            for method in table:
+                if entry := self._resolve_plugin_handler(method):
+                    table[method] = entry
+            for method, name in plugin.method_handler_map.items():
+                table[method] = (name, True)
+        self._dispatch_table = table
+
+    def _resolve_plugin_handler(self, method: str) -> tuple[str, bool] | None:
+        """Look up a handler added to the plugin through an 'm_*' method."""
+        if isinstance(self._plugin, AbstractPlugin) and getattr(self._plugin, name := method2attr(method), None):
+            return (name, True)
         return None
@@ -0,0 +1,94 @@
+"""Full-text snapshots of documents, shared by all sessions that send the text of the same buffer."""
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Callable
+from typing import final
+import sublime
+import sys
+import threading
+
+# The maximum total size of the snapshots that are kept.
+MAX_TEXT_SNAPSHOTS_SIZE = 32 * 1024 * 1024  # bytes
+
+
+@final
+class TextSnapshot(str):  # noqa: FURB189
+    """
+    The full text of a buffer at a certain change count.
+
+    It is a plain string to everything that reads it, like plugins and the log panel. Transports recognize it when
+    encoding a message, and splice in its JSON encoding, which is computed only once for all sessions that send it.
+    """
+
+    # A subclass of `str` can't have slots of its own, so the attributes live in the instance dict.
+    __slots__ = ('__dict__',)
+
+    buffer_id: int
+    change_count: int
+    size: int
+    placeholder: str
+    _encoded: bytes | None
+    _lock: threading.Lock
+
+    def __new__(cls, text: str, buffer_id: int, change_count: int) -> TextSnapshot:
+        snapshot = super().__new__(cls, text)
+        snapshot.buffer_id = buffer_id
+        snapshot.change_count = change_count
+        # An estimate of the memory held by the snapshot: the text itself and its encoding, which is at least as long.
+        snapshot.size = sys.getsizeof(text) + len(text)
+        # A string that stands in for the text while the rest of a message is encoded.
+        snapshot.placeholder = f"lsp-text-snapshot-{id(snapshot)}"
+        snapshot._encoded = None
+        snapshot._lock = threading.Lock()
+        return snapshot
+
+    def encoded(self, encoder: Callable[[str], bytes]) -> bytes:
+        """The text encoded as a JSON string, computed on the first call."""
+        with self._lock:
+            if self._encoded is None:
+                self._encoded = encoder(str(self))
+            return self._encoded
+
+
+class TextSnapshotCache:
+    """
+    Keeps the latest snapshot of the most recently synced buffers, up to `MAX_TEXT_SNAPSHOTS_SIZE` bytes in total.
+
+    A snapshot is dropped as soon as its buffer changes or closes, because it can't be shared anymore.
+    """
+
+    def __init__(self) -> None:
+        self._snapshots: OrderedDict[int, TextSnapshot] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, view: sublime.View) -> TextSnapshot:
+        buffer_id = view.buffer_id()
+        change_count = view.change_count()
+        with self._lock:
+            snapshot = self._snapshots.get(buffer_id)
+            if snapshot is not None and snapshot.change_count == change_count:
+                self._snapshots.move_to_end(buffer_id)
+                return snapshot
+        snapshot = TextSnapshot(view.substr(sublime.Region(0, view.size())), buffer_id, change_count)
+        with self._lock:
+            self._discard(buffer_id)
+            if snapshot.size > MAX_TEXT_SNAPSHOTS_SIZE:
+                return snapshot
+            self._snapshots[buffer_id] = snapshot
+            self._size += snapshot.size
+            while self._size > MAX_TEXT_SNAPSHOTS_SIZE:
+                self._size -= self._snapshots.popitem(last=False)[1].size
+        return snapshot
+
+    def discard(self, buffer_id: int) -> None:
+        with self._lock:
+            self._discard(buffer_id)
+
+    def _discard(self, buffer_id: int) -> None:
+        if (snapshot := self._snapshots.pop(buffer_id, None)) is not None:
+            self._size -= snapshot.size
+
+
+text_snapshots = TextSnapshotCache()
@@ -0,0 +1,174 @@
+"""Compaction of the incremental changes of a document that are waiting to be sent with textDocument/didChange."""
+from __future__ import annotations
+
+from typing import Tuple
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ...protocol import TextDocumentContentChangeEvent
+    import sublime
+
+# A (line, character) pair, where the character is counted in UTF-16 code units like in the protocol.
+TextPosition = Tuple[int, int]
+
+# Beyond this many separate edits, new changes are appended as they are instead of being merged, because finding the
+# edits that a change touches takes linear time.
+MAX_COMPACTED_EDITS = 512
+# A rough estimate of the size of a content change event in JSON, excluding its text.
+CONTENT_CHANGE_OVERHEAD = 100  # bytes
+
+
+def utf16_len(text: str) -> int:
+    return len(text) if text.isascii() else len(text.encode('utf-16-le')) // 2
+
+
+def _advance(position: TextPosition, text: str) -> TextPosition:
+    """The position at the end of `text` when it is inserted at `position`."""
+    newlines = text.count('\n')
+    if not newlines:
+        return (position[0], position[1] + utf16_len(text))
+    return (position[0] + newlines, utf16_len(text[text.rindex('\n') + 1:]))
+
+
+def _index(text: str, start: TextPosition, position: TextPosition) -> int:
+    """The index in `text`, which is inserted at `start`, that corresponds to `position`."""
+    index = 0
+    character = position[1] - start[1]
+    for _ in range(position[0] - start[0]):
+        index = text.index('\n', index) + 1
+        character = position[1]
+    line_end = text.find('\n', index)
+    line = text[index:] if line_end == -1 else text[index:line_end]
+    if line.isascii():
+        return index + character
+    count = 0
+    for i, ch in enumerate(line):
+        if count >= character:
+            return index + i
+        count += 2 if ord(ch) > 0xFFFF else 1
+    return index + len(line)
+
+
+def _shift(position: TextPosition, anchor: TextPosition, shifted_anchor: TextPosition) -> TextPosition:
+    """Move a position that follows `anchor` along with the anchor, when the anchor is moved to `shifted_anchor`."""
+    if position[0] == anchor[0]:
+        return (shifted_anchor[0], shifted_anchor[1] + position[1] - anchor[1])
+    return (position[0] - anchor[0] + shifted_anchor[0], position[1])
+
+
+class _Edit:
+
+    __slots__ = ('start', 'end', 'range_length', 'text')
+
+    def __init__(self, start: TextPosition, end: TextPosition, range_length: int, text: str) -> None:
+        self.start = start
+        self.end = end
+        self.range_length = range_length
+        self.text = text
+
+    def render(self) -> TextDocumentContentChangeEvent:
+        return {
+            "range": {
+                "start": {"line": self.start[0], "character": self.start[1]},
+                "end": {"line": self.end[0], "character": self.end[1]}},
+            "rangeLength": self.range_length,
+            "text": self.text
+        }
+
+
+class TextChanges:
+    """
+    The incremental changes of a document, compacted into the smallest equivalent list of edits.
+
+    Each change is expressed in the coordinates of the document after the changes before it, like `sublime.TextChange`
+    and the content changes of textDocument/didChange. Changes that touch or overlap each other are merged into a
+    single edit. The edits are kept sorted and non-overlapping in the coordinates of the document before all changes,
+    so that they are equivalent to the original stream of changes when they are applied from last to first.
+    """
+
+    __slots__ = ('_edits', '_uncompacted')
+
+    def __init__(self) -> None:
+        self._edits: list[_Edit] = []
+        self._uncompacted: list[_Edit] = []
+
+    def __len__(self) -> int:
+        return len(self._edits) + len(self._uncompacted)
+
+    def add_text_changes(self, changes: list[sublime.TextChange]) -> None:
+        for change in changes:
+            self.add((change.a.row, change.a.col_utf16), (change.b.row, change.b.col_utf16), change.len_utf16,
+                     change.str)
+
+    def add(self, start: TextPosition, end: TextPosition, range_length: int, text: str) -> None:
+        """
+        Add a change that replaces the range from `start` to `end` in the current document with `text`.
+
+        :param range_length: The length of the replaced range in UTF-16 code units.
+        """
+        if start == end and not text:
+            return
+        if self._uncompacted or len(self._edits) >= MAX_COMPACTED_EDITS:
+            self._uncompacted.append(_Edit(start, end, range_length, text))
+            return
+        # Walk the edits in the coordinates of the current document, by shifting along with the end of the previous
+        # edit. Stop at the first edit that starts after the change.
+        anchor = shifted_anchor = (0, 0)
+        first = -1
+        first_anchors = (anchor, shifted_anchor)
+        touched: list[tuple[TextPosition, TextPosition]] = []
+        for i, edit in enumerate(self._edits):
+            current_start = _shift(edit.start, anchor, shifted_anchor)
+            if current_start > end:
+                break
+            current_end = _advance(current_start, edit.text)
+            if current_end >= start:
+                if first == -1:
+                    first = i
+                    first_anchors = (anchor, shifted_anchor)
+                touched.append((current_start, current_end))
+            anchor, shifted_anchor = edit.end, current_end
+        else:
+            i = len(self._edits)
+        if first == -1:
+            self._edits.insert(i, _Edit(
+                _shift(start, shifted_anchor, anchor), _shift(end, shifted_anchor, anchor), range_length, text))
+            return
+        last = first + len(touched) - 1
+        first_edit = self._edits[first]
+        last_edit = self._edits[last]
+        first_start = touched[0][0]
+        last_start, last_end = touched[-1]
+        if first_start < start:
+            merged_start = first_edit.start
+            prefix = first_edit.text[:_index(first_edit.text, first_start, start)]
+        else:
+            merged_start = _shift(start, first_anchors[1], first_anchors[0])
+            prefix = ""
+        if end < last_end:
+            merged_end = last_edit.end
+            suffix = last_edit.text[_index(last_edit.text, last_start, end):]
+        else:
+            merged_end = _shift(end, shifted_anchor, anchor)
+            suffix = ""
+        # The replaced range of the merged edit is the replaced ranges of the touched edits, plus the original text
+        # that the change replaced in between and around them.
+        merged_range_length = range_length
+        for edit, (current_start, current_end) in zip(self._edits[first:last + 1], touched):
+            merged_range_length += edit.range_length
+            lo = max(start, current_start)
+            hi = min(end, current_end)
+            if lo < hi:
+                merged_range_length -= utf16_len(
+                    edit.text[_index(edit.text, current_start, lo):_index(edit.text, current_start, hi)])
+        self._edits[first:last + 1] = [_Edit(merged_start, merged_end, merged_range_length, prefix + text + suffix)]
+
+    def payload_size(self) -> int:
+        """An estimate of the size of the rendered changes in JSON."""
+        return sum(len(edit.text) + CONTENT_CHANGE_OVERHEAD for edit in self._edits) + \
+            sum(len(edit.text) + CONTENT_CHANGE_OVERHEAD for edit in self._uncompacted)
+
+    def render(self) -> list[TextDocumentContentChangeEvent]:
+        result = [edit.render() for edit in reversed(self._edits)]
+        result.extend(edit.render() for edit in self._uncompacted)
+        return result
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+from operator import itemgetter
+import time
+
+
+class StartupTimeline:
+    """
+    Records when a session reached each milestone of its startup, like the spawn of the server process and the first
+    diagnostics. Only the first occurrence of each milestone is kept.
+    """
+
+    __slots__ = ('_events',)
+
+    def __init__(self) -> None:
+        self._events: dict[str, float] = {}
+
+    def mark(self, event: str, timestamp: float | None = None) -> None:
+        """
+        Record that the session reached a milestone.
+
+        :param event: The name of the milestone.
+        :param timestamp: The `time.monotonic()` at which the milestone was reached, or None for now.
+        """
+        if event not in self._events:
+            self._events[event] = time.monotonic() if timestamp is None else timestamp
+
+    def to_dict(self) -> dict[str, float]:
+        """
+        The milestones in the order in which they were reached.
+
+        :returns: A mapping from each milestone to the milliseconds that passed since the first one.
+        """
+        if not self._events:
+            return {}
+        start = min(self._events.values())
+        return {
+            event: round((timestamp - start) * 1000, 1)
+            for event, timestamp in sorted(self._events.items(), key=itemgetter(1))
+        }
+
+    def render(self) -> list[str]:
+        lines: list[str] = []
+        previous = 0.0
+        for event, elapsed in self.to_dict().items():
+            lines.append(f"{elapsed:>10.1f} ms  (+{elapsed - previous:.1f} ms)  {event}")
+            previous = elapsed
+        return lines
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.to_dict()!r})"
@@ -5,25 +5,30 @@ from .logging import debug
 from .logging import exception_log
 from .promise import PackagedTask
 from .promise import Promise
+from .snapshots import TextSnapshot
 from abc import ABC
 from abc import abstractmethod
+from collections import deque
 from contextlib import closing
-from functools import partial
-from queue import Queue
 from typing import Any
 from typing import Callable
+from typing import Collection
 from typing import final
 from typing import IO
 from typing import TYPE_CHECKING
 from typing_extensions import override
 import contextlib
+import heapq
 import http.client
 import json
 import os
+import re
+import selectors
 import shutil
 import socket
 import sublime
 import subprocess
+import tempfile
 import threading
 import time
 import weakref
@@ -38,6 +43,20 @@ except ImportError:
     orjson = None
 
 TCP_CONNECT_TIMEOUT = 5  # seconds
+READ_CHUNK_SIZE = 64 * 1024  # bytes
+MAX_HEADER_SIZE = 64 * 1024  # bytes
+INBOUND_DRAIN_BUDGET = 0.015  # seconds
+MAX_WRITE_BATCH = 256  # messages
+# How long closing a transport that is served by the shared I/O thread waits for the server to read what is queued.
+CLOSE_FLUSH_TIMEOUT = 2  # seconds
+# The number of most recent stderr lines that are kept per language server, including lines that were suppressed.
+STDERR_HISTORY_LINES = 10000
+# The maximum number of stderr lines per second that are relayed per language server. Zero means no limit.
+g_stderr_lines_per_second = 0
+# Whether new transports are served by the shared I/O thread instead of dedicated reader and writer threads.
+g_shared_io_thread = False
+# A "method" key directly following the opening brace or a comma, i.e. not inside a (properly escaped) string.
+NOTIFICATION_METHOD_PATTERN = re.compile(rb'[{,]\s*"method"\s*:\s*"([^"\\]*)"')
 
 
 class StopLoopError(Exception):
@@ -229,6 +248,79 @@ class TcpServerTransportConfig(TransportConfig):
         )
 
 
+class UnixSocketTransportConfig(TransportConfig):
+    """
+    Transport for communicating to a language server over a Unix domain socket, which avoids the overhead of the
+    loopback TCP stack and doesn't need a free port. The path of the socket is created in a temporary directory and
+    can be passed to the language server through the `${socket}` variable in the "command". When `listen` is False, the
+    language server is expected to listen on that path and this text editor connects to it. When `listen` is True, this
+    text editor listens on that path and the language server is expected to connect to it.
+    """
+
+    def __init__(self, listen: bool) -> None:
+        if not hasattr(socket, "AF_UNIX"):
+            raise RuntimeError("Unix domain sockets are not supported on this platform")
+        self._listen = listen
+
+    @override
+    def start(
+        self,
+        command: list[str] | None,
+        env: dict[str, str] | None,
+        cwd: str | None,
+        variables: dict[str, str],
+        callbacks: TransportCallbacks,
+    ) -> TransportWrapper:
+        if not command:
+            raise RuntimeError('missing "command" to start a child process for running the language server')
+        directory = tempfile.mkdtemp(prefix="lsp-")
+        path = os.path.join(directory, "server.sock")
+        variables["socket"] = path
+        try:
+            launch = TransportConfig.resolve_launch_config(command, env, variables)
+            if self._listen:
+                with closing(socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)) as listener_socket:
+                    listener_socket.bind(path)
+                    listener_socket.settimeout(TCP_CONNECT_TIMEOUT)
+                    listener_socket.listen(1)
+                    process = launch.start(cwd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                           stderr=subprocess.PIPE)
+                    sock, _ = listener_socket.accept()
+                    sock.settimeout(None)
+                reader = process.stderr
+            else:
+                process = launch.start(cwd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT)
+                sock = self._connect(path, process)
+                reader = process.stdout
+        finally:
+            # An established connection doesn't need the path anymore.
+            shutil.rmtree(directory, ignore_errors=True)
+        if not reader:
+            raise Exception('Failed to create transport config due to not being able to pipe stderr')
+        return TransportWrapper(
+            callback_object=callbacks,
+            transport=SocketTransport(encode_json, decode_json, sock),
+            process=process,
+            error_reader=ErrorReader(callbacks, reader),
+        )
+
+    def _connect(self, path: str, process: subprocess.Popen[bytes]) -> socket.socket:
+        start_time = time.time()
+        while time.time() - start_time < TCP_CONNECT_TIMEOUT:
+            if process.poll() is not None:
+                break
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(path)
+            except (FileNotFoundError, ConnectionRefusedError):
+                sock.close()
+                time.sleep(0.05)
+            else:
+                return sock
+        raise RuntimeError("failed to connect")
+
+
 # --- Transports -------------------------------------------------------------------------------------------------------
 
 
@@ -239,6 +331,19 @@ class TransportCallbacks:
 
     def on_stderr_message(self, message: str) -> None: ...
 
+    def on_stderr_messages(self, messages: list[str]) -> None:
+        """A batch of lines from the language server's log stream. Override this to handle a batch at once."""
+        for message in messages:
+            self.on_stderr_message(message)
+
+    def ignored_notifications(self) -> Collection[str]:
+        """Methods of server notifications that should be dropped before they are decoded."""
+        return ()
+
+    def on_ignored_notifications(self, counts: dict[str, int]) -> None:
+        """Called with the number of notifications per method that were dropped since the previous call."""
+        ...
+
 
 class Transport(ABC):
     def __init__(
@@ -248,6 +353,8 @@ class Transport(ABC):
     ) -> None:
         self._encoder = encoder
         self._decoder = decoder
+        self.ignore_body: Callable[[bytes], bool] | None = None
+        """Called with every raw message body before it is decoded. Return True to drop the message."""
 
     @abstractmethod
     def read(self) -> JSONRPCMessage | None:
@@ -265,6 +372,103 @@ class Transport(ABC):
     def close(self) -> None:
         raise NotImplementedError
 
+    def decode_body(self, body: bytes) -> JSONRPCMessage | None:
+        """Decode a raw message body, or return None if the message should be dropped."""
+        if self.ignore_body and self.ignore_body(body):
+            return None
+        try:
+            return self._decoder(body)
+        except Exception as ex:
+            raise Exception(f"JSON decode error: {ex}") from ex
+
+    def write_batch(self, payloads: list[JSONRPCMessage | bytes]) -> None:
+        """Write multiple payloads. Subclasses may override this to flush only once for the whole batch."""
+        for payload in payloads:
+            if isinstance(payload, bytes):
+                self.write_bytes(payload)
+            else:
+                self.write(payload)
+
+
+class MessageFramer:
+    """
+    Incrementally splits a byte stream into the bodies of "Content-Length" framed JSON-RPC messages.
+
+    Incoming data is appended to a single reusable buffer. Consumed bytes are only discarded once the read offset has
+    moved past half of the buffer, so that a burst of small messages doesn't cause a reallocation per message.
+    """
+
+    __slots__ = ("_buffer", "_offset")
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+        self._offset = 0
+
+    def feed(self, data: bytes) -> None:
+        self._buffer += data
+
+    def pending(self) -> int:
+        """The number of bytes that are buffered but not yet returned as part of a message."""
+        return len(self._buffer) - self._offset
+
+    def pending_text(self) -> str:
+        return self._buffer[self._offset:].decode("utf-8", "replace")
+
+    def next_message(self) -> bytes | None:
+        """
+        Return the next complete message body, or None if more data needs to be fed first.
+
+        :raises ValueError: When the header block is malformed or lacks a Content-Length header.
+        """
+        buffer = self._buffer
+        header_end = buffer.find(b"\r\n\r\n", self._offset)
+        if header_end == -1:
+            if len(buffer) - self._offset > MAX_HEADER_SIZE:
+                raise ValueError("Header block too long")
+            return None
+        body_start = header_end + 4
+        body_end = body_start + self._parse_content_length(self._offset, header_end)
+        if body_end > len(buffer):
+            return None
+        with memoryview(buffer) as view:
+            body = bytes(view[body_start:body_end])
+        if body_end == len(buffer):
+            buffer.clear()
+            self._offset = 0
+        elif body_end > len(buffer) // 2:
+            del buffer[:body_end]
+            self._offset = 0
+        else:
+            self._offset = body_end
+        return body
+
+    def missing(self) -> int:
+        """A hint for how many more bytes are needed to complete the message that is currently being received."""
+        buffer = self._buffer
+        header_end = buffer.find(b"\r\n\r\n", self._offset)
+        if header_end == -1:
+            return 0
+        try:
+            content_length = self._parse_content_length(self._offset, header_end)
+        except ValueError:
+            return 0
+        return max(0, header_end + 4 + content_length - len(buffer))
+
+    def _parse_content_length(self, start: int, end: int) -> int:
+        content_length = -1
+        for line in self._buffer[start:end].split(b"\r\n"):
+            name, sep, value = line.partition(b":")
+            if not sep:
+                raise ValueError(f"Invalid header line: {line.decode('utf-8', 'replace')}")
+            if name.strip().lower() == b"content-length":
+                try:
+                    content_length = int(value)
+                except ValueError:
+                    raise ValueError(f"Invalid Content-Length: {value.decode('utf-8', 'replace')}") from None
+        if content_length < 0:
+            raise ValueError("Missing Content-Length header")
+        return content_length
+
 
 class FileObjectTransport(Transport):
     def __init__(
@@ -277,9 +481,33 @@ class FileObjectTransport(Transport):
         super().__init__(encoder, decoder)
         self._reader = reader
         self._writer = writer
+        # Bulk reads require a buffered reader. Fall back to the line-based http.client parser otherwise.
+        self._framer = MessageFramer() if hasattr(reader, "read1") else None
 
     @override
-    def read(self) -> JSONRPCMessage:
+    def read(self) -> JSONRPCMessage | None:
+        if self._framer is None:
+            return self._read_with_header_parser()
+        framer = self._framer
+        while True:
+            try:
+                body = framer.next_message()
+            except ValueError as ex:
+                # Propagate server's output to the UI.
+                raise Exception(f"Unexpected payload in server's stdout:\n\n{framer.pending_text()}") from ex
+            if body is not None:
+                if (payload := self.decode_body(body)) is None:
+                    continue
+                return payload
+            chunk = self._reader.read1(max(READ_CHUNK_SIZE, framer.missing()))  # pyright: ignore[reportAttributeAccessIssue]
+            if not chunk:
+                if framer.pending():
+                    raise Exception(f"Unexpected payload in server's stdout:\n\n{framer.pending_text()}")
+                # Expected on process stopping. Gracefully stop the transport.
+                raise StopLoopError
+            framer.feed(chunk)
+
+    def _read_with_header_parser(self) -> JSONRPCMessage | None:
         headers: http.client.HTTPMessage | None = None
         try:
             headers = http.client.parse_headers(self._reader)
@@ -293,10 +521,14 @@ class FileObjectTransport(Transport):
                 raise StopLoopError from None
             # Propagate server's output to the UI.
             raise Exception(f"Unexpected payload in server's stdout:\n\n{headers}") from ex
+        return self.decode_body(body)
+
+    def selectable_fds(self) -> tuple[int, int] | None:
+        """The file descriptors to read from and write to, if this transport can be served by the shared I/O thread."""
         try:
-            return self._decoder(body)
-        except Exception as ex:
-            raise Exception(f"JSON decode error: {ex}") from ex
+            return self._reader.fileno(), self._writer.fileno()
+        except (AttributeError, OSError):
+            return None
 
     @override
     def write(self, payload: JSONRPCMessage) -> None:
@@ -304,11 +536,26 @@ class FileObjectTransport(Transport):
         self._writer.writelines((f"Content-Length: {len(body)}\r\n\r\n".encode("ascii"), body))
         self._writer.flush()
 
+    def encode(self, payload: JSONRPCMessage | bytes) -> tuple[bytes, ...]:
+        """The chunks to write for the given payload, including the header for JSON-RPC messages."""
+        if isinstance(payload, bytes):
+            return (payload,)
+        body = self._encoder(payload)
+        return (f"Content-Length: {len(body)}\r\n\r\n".encode("ascii"), body)
+
     @override
     def write_bytes(self, payload: bytes) -> None:
         self._writer.write(payload)
         self._writer.flush()
 
+    @override
+    def write_batch(self, payloads: list[JSONRPCMessage | bytes]) -> None:
+        chunks: list[bytes] = []
+        for payload in payloads:
+            chunks.extend(self.encode(payload))
+        self._writer.writelines(chunks)
+        self._writer.flush()
+
     @override
     def close(self) -> None:
         self._writer.close()
@@ -326,6 +573,11 @@ class SocketTransport(FileObjectTransport):
         super().__init__(encoder, decoder, reader_writer_pair, reader_writer_pair)
         self._socket = sock
 
+    @override
+    def selectable_fds(self) -> tuple[int, int] | None:
+        fd = self._socket.fileno()
+        return fd, fd
+
     @override
     def close(self) -> None:
         super().close()
@@ -335,6 +587,143 @@ class SocketTransport(FileObjectTransport):
 # --- TransportWrapper -------------------------------------------------------------------------------------------------
 
 
+CONTROL_LANE = 0
+INTERACTIVE_LANE = 1
+SYNC_LANE = 2
+BACKGROUND_LANE = 3
+
+CONTROL_METHODS = frozenset((
+    "$/cancelRequest",
+    "exit",
+))
+INTERACTIVE_METHODS = frozenset((
+    "completionItem/resolve",
+    "textDocument/completion",
+    "textDocument/documentHighlight",
+    "textDocument/hover",
+    "textDocument/signatureHelp",
+))
+SYNC_METHODS = frozenset((
+    "initialize",
+    "initialized",
+    "notebookDocument/didChange",
+    "notebookDocument/didClose",
+    "notebookDocument/didOpen",
+    "notebookDocument/didSave",
+    "shutdown",
+    "textDocument/didChange",
+    "textDocument/didClose",
+    "textDocument/didOpen",
+    "textDocument/didSave",
+    "textDocument/willSave",
+    "workspace/didChangeConfiguration",
+    "workspace/didChangeWorkspaceFolders",
+))
+
+
+def send_lane(payload: JSONRPCMessage | bytes) -> int:
+    if isinstance(payload, bytes):
+        # Raw payloads are opaque, so keep them in order with respect to everything else.
+        return SYNC_LANE
+    method = payload.get("method")
+    if method is None:
+        # A response to a request from the server, which is likely waiting for it.
+        return INTERACTIVE_LANE
+    if method in CONTROL_METHODS:
+        return CONTROL_LANE
+    if method in SYNC_METHODS:
+        return SYNC_LANE
+    if method in INTERACTIVE_METHODS:
+        return INTERACTIVE_LANE
+    return BACKGROUND_LANE
+
+
+class SendQueue:
+    """
+    The outgoing payloads of a transport, served in priority order.
+
+    Control messages are served before anything else. Document synchronization messages act as barriers for all other
+    messages: an interactive request may overtake background messages that were queued before it, but never a document
+    synchronization message, because the request depends on the document state that it describes. Likewise, a document
+    synchronization message never overtakes anything that was queued before it.
+    """
+
+    def __init__(self) -> None:
+        self._lanes: tuple[deque[tuple[int, JSONRPCMessage | bytes]], ...] = tuple(deque() for _ in range(4))
+        self._condition = threading.Condition()
+        self._sequence = 0
+        self._closed = False
+
+    def put(self, payload: JSONRPCMessage | bytes) -> None:
+        with self._condition:
+            self._sequence += 1
+            self._lanes[send_lane(payload)].append((self._sequence, payload))
+            self._condition.notify()
+
+    def close(self) -> None:
+        """Let `get_batch` return None once the queued payloads are served."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+
+    def get_batch(self, limit: int, block: bool = True) -> list[JSONRPCMessage | bytes] | None:
+        """
+        Take up to `limit` payloads in the order in which they should be sent. When `block` is True, this waits until at
+        least one payload is available. Returns None when the queue is closed and empty.
+        """
+        with self._condition:
+            if block:
+                while not self._closed and not any(self._lanes):
+                    self._condition.wait()
+            batch: list[JSONRPCMessage | bytes] = []
+            while len(batch) < limit and (payload := self._pop()) is not None:
+                batch.append(payload)
+            if not batch and self._closed:
+                return None
+            return batch
+
+    def pending(self) -> bool:
+        with self._condition:
+            return any(self._lanes)
+
+    def _pop(self) -> JSONRPCMessage | bytes | None:
+        control, interactive, sync, background = self._lanes
+        if control:
+            return control.popleft()[1]
+        barrier = sync[0][0] if sync else None
+        if interactive and (barrier is None or interactive[0][0] < barrier):
+            return interactive.popleft()[1]
+        if background and (barrier is None or background[0][0] < barrier):
+            return background.popleft()[1]
+        if sync:
+            return sync.popleft()[1]
+        return None
+
+
+class WriteStatistics:
+    """Counters to verify that the writer thread coalesces outgoing messages under load."""
+
+    __slots__ = ("flushes", "largest_batch", "messages")
+
+    def __init__(self) -> None:
+        self.flushes = 0
+        self.messages = 0
+        self.largest_batch = 0
+
+    @property
+    def messages_per_flush(self) -> float:
+        return self.messages / self.flushes if self.flushes else 0.0
+
+    def record(self, batch_size: int) -> None:
+        self.flushes += 1
+        self.messages += batch_size
+        self.largest_batch = max(self.largest_batch, batch_size)
+
+    def __repr__(self) -> str:
+        return (f"{self.messages} messages in {self.flushes} flushes "
+                f"({self.messages_per_flush:.2f} per flush, at most {self.largest_batch})")
+
+
 @final
 class TransportWrapper:
     """
@@ -356,49 +745,76 @@ class TransportWrapper:
         self._transport = transport
         self._process = process
         self._error_reader = error_reader
-        self._reader_thread = threading.Thread(target=self._read_loop)
-        self._writer_thread = threading.Thread(target=self._write_loop)
-        self._send_queue: Queue[JSONRPCMessage | bytes | None] = Queue(0)
-        self._reader_thread.start()
-        self._writer_thread.start()
+        self._reader_thread: threading.Thread | None = None
+        self._writer_thread: threading.Thread | None = None
+        self._channel: SharedIOChannel | None = None
+        self._send_queue = SendQueue()
+        # Payloads decoded by the reader thread, waiting to be handed to the callback object on the async thread.
+        self._inbound: deque[JSONRPCMessage] = deque()
+        self._inbound_lock = threading.Lock()
+        self._inbound_drain_scheduled = False
+        # The time.monotonic() at which the first payload was read from the server.
+        self.first_payload_time: float | None = None
+        self._ignored_notifications = frozenset(callback_object.ignored_notifications())
+        self._ignored_counts: dict[str, int] = {}
+        if self._ignored_notifications:
+            transport.ignore_body = self._ignore_body
+        self.write_statistics = WriteStatistics()
+        if g_shared_io_thread and isinstance(transport, FileObjectTransport) and (fds := transport.selectable_fds()):
+            self._channel = SharedIOChannel(self, transport, self._send_queue, *fds)
+        else:
+            self._reader_thread = threading.Thread(target=self._read_loop)
+            self._writer_thread = threading.Thread(target=self._write_loop)
+            self._reader_thread.start()
+            self._writer_thread.start()
 
     @property
     def process_args(self) -> Any:
         return self._process.args if self._process else None
 
+    @property
+    def pid(self) -> int | None:
+        return self._process.pid if self._process else None
+
+    @property
+    def stderr_history(self) -> list[str]:
+        """The most recent lines from the language server's log stream, including lines that were suppressed."""
+        return self._error_reader.history() if self._error_reader else []
+
     def send(self, payload: JSONRPCMessage) -> None:
-        self._send_queue.put_nowait(payload)
+        self._send_queue.put(payload)
+        if self._channel:
+            self._channel.start_writing()
 
     def send_bytes(self, payload: bytes) -> None:
-        self._send_queue.put_nowait(payload)
+        self._send_queue.put(payload)
+        if self._channel:
+            self._channel.start_writing()
 
     def close(self) -> None:
         if not self._closed:
             self._closed = True
-            self._send_queue.put_nowait(None)
-            _join_thread(self._writer_thread)
-            _join_thread(self._reader_thread)
+            self._send_queue.close()
+            if self._channel:
+                self._channel.close()
+            if self._writer_thread:
+                _join_thread(self._writer_thread)
+            if self._reader_thread:
+                _join_thread(self._reader_thread)
             if self._error_reader:
                 self._error_reader.on_transport_close()
                 self._error_reader = None
             if self._transport:
                 self._transport.close()
                 self._transport = None
+            debug("transport closed after writing", self.write_statistics)
 
     def _read_loop(self) -> None:
         exception = None
         try:
             while self._transport:
-                if (payload := self._transport.read()) is None:
-                    continue
-
-                def invoke(p: JSONRPCMessage) -> None:
-                    if self._closed:
-                        return
-                    if callback_object := self._callback_object():
-                        callback_object.on_payload(p)
-
-                sublime.set_timeout_async(partial(invoke, payload))
+                if (payload := self._transport.read()) is not None:
+                    self.receive(payload)
         except (AttributeError, BrokenPipeError, StopLoopError):
             pass
         except Exception as ex:
@@ -406,7 +822,68 @@ class TransportWrapper:
         if exception:
             self._end(exception)
         else:
-            self._send_queue.put_nowait(None)
+            self._send_queue.close()
+
+    def receive(self, payload: JSONRPCMessage) -> None:
+        """Queue a decoded payload for the callback object. Called from the thread that reads from the transport."""
+        if self.first_payload_time is None:
+            self.first_payload_time = time.monotonic()
+        with self._inbound_lock:
+            self._inbound.append(payload)
+            if self._inbound_drain_scheduled:
+                return
+            self._inbound_drain_scheduled = True
+        sublime.set_timeout_async(self._drain_inbound_async)
+
+    def _drain_inbound_async(self) -> None:
+        """
+        Hand all payloads that arrived since the previous drain to the callback object, in order. A burst of messages
+        is thus processed in a single wake-up of the async thread. When processing takes longer than the time budget,
+        the remaining payloads are left for another drain, so that other work on the async thread isn't starved.
+        """
+        deadline = time.perf_counter() + INBOUND_DRAIN_BUDGET
+        callback_object = self._callback_object()
+        while True:
+            with self._inbound_lock:
+                ignored_counts = self._ignored_counts
+                if ignored_counts:
+                    self._ignored_counts = {}
+                if self._closed or not callback_object or not (self._inbound or ignored_counts):
+                    self._inbound.clear()
+                    self._inbound_drain_scheduled = False
+                    return
+                payload = self._inbound.popleft() if self._inbound else None
+            # A failing handler must only lose its own message, and not stop the delivery of all later ones.
+            if ignored_counts:
+                try:
+                    callback_object.on_ignored_notifications(ignored_counts)
+                except Exception as ex:
+                    exception_log("Error handling ignored notifications", ex)
+            if payload is not None:
+                try:
+                    callback_object.on_payload(payload)
+                except Exception as ex:
+                    exception_log("Error handling payload", ex)
+            if time.perf_counter() > deadline:
+                break
+        sublime.set_timeout_async(self._drain_inbound_async)
+
+    def _ignore_body(self, body: bytes) -> bool:
+        """Runs on the reader thread. Drops ignored notifications without decoding them, but keeps count of them."""
+        method = notification_method(body)
+        if method is None or method not in self._ignored_notifications:
+            return False
+        with self._inbound_lock:
+            self._ignored_counts[method] = self._ignored_counts.get(method, 0) + 1
+            if self._inbound_drain_scheduled:
+                return True
+            self._inbound_drain_scheduled = True
+        sublime.set_timeout_async(self._drain_inbound_async)
+        return True
+
+    def end(self, exception: Exception | None) -> None:
+        """Called by the shared I/O thread when the connection is lost. Tears down the transport on another thread."""
+        threading.Thread(target=self._end, args=(exception,)).start()
 
     def _end(self, exception: Exception | None) -> None:
         exit_code = 0
@@ -441,12 +918,11 @@ class TransportWrapper:
         exception: Exception | None = None
         try:
             while self._transport:
-                if (d := self._send_queue.get()) is None:
+                # Coalesce everything that got queued in the meantime, so that a burst is written with a single flush.
+                if (batch := self._send_queue.get_batch(MAX_WRITE_BATCH)) is None:
                     break
-                if isinstance(d, bytes):
-                    self._transport.write_bytes(d)
-                else:
-                    self._transport.write(d)
+                self._transport.write_batch(batch)
+                self.write_statistics.record(len(batch))
         except (BrokenPipeError, AttributeError):
             pass
         except Exception as ex:
@@ -454,6 +930,280 @@ class TransportWrapper:
         self._end(exception)
 
 
+# --- Shared I/O thread -----------------------------------------------------------------------------------------------
+
+
+def set_shared_io_thread(enabled: bool) -> None:
+    """
+    Serve the transports of language servers started from now on with a single I/O thread, instead of dedicated reader
+    and writer threads per server. Not available on Windows, where pipes can't be waited on with `selectors`.
+    """
+    global g_shared_io_thread
+    g_shared_io_thread = enabled and ST_PLATFORM != "windows"
+
+
+class IOMultiplexer:
+    """
+    A thread that waits on the pipes and sockets of any number of language servers with a single `select` call, and
+    invokes the reader and writer callbacks that are registered for the file descriptors that are ready.
+
+    The `add_*`, `remove_*` and `call_later` methods may only be called on the I/O thread itself. Other threads use
+    `call_soon`. The thread stops once no file descriptor is registered anymore, dropping the timers that are left.
+    """
+
+    def __init__(self) -> None:
+        self._selector = selectors.DefaultSelector()
+        self._readers: dict[int, Callable[[], None]] = {}
+        self._writers: dict[int, Callable[[], None]] = {}
+        self._lock = threading.Lock()
+        self._calls: deque[Callable[[IOMultiplexer], None]] = deque()
+        self._timers: list[tuple[float, int, Callable[[], None]]] = []
+        self._timer_count = 0
+        self._stopped = False
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self._wakeup_reader.setblocking(False)
+        self._wakeup_writer.setblocking(False)
+        self._selector.register(self._wakeup_reader, selectors.EVENT_READ)
+        self._thread = threading.Thread(target=self._loop, name="LSP I/O")
+        self._thread.start()
+
+    def is_current_thread(self) -> bool:
+        return self._thread.ident == threading.current_thread().ident
+
+    def call_soon(self, f: Callable[[IOMultiplexer], None]) -> bool:
+        """Run `f` on the I/O thread, with this multiplexer as argument. Returns False if the thread already stopped."""
+        with self._lock:
+            if self._stopped:
+                return False
+            self._calls.append(f)
+        try:
+            self._wakeup_writer.send(b"\0")
+        except OSError:
+            pass  # The wake-up socket is full, so the thread is going to wake up anyway.
+        return True
+
+    def call_later(self, delay: float, f: Callable[[], None]) -> None:
+        """Run `f` on the I/O thread after `delay` seconds."""
+        self._timer_count += 1
+        heapq.heappush(self._timers, (time.monotonic() + delay, self._timer_count, f))
+
+    def add_reader(self, fd: int, callback: Callable[[], None]) -> None:
+        self._readers[fd] = callback
+        self._update(fd)
+
+    def remove_reader(self, fd: int) -> None:
+        if self._readers.pop(fd, None):
+            self._update(fd)
+
+    def add_writer(self, fd: int, callback: Callable[[], None]) -> None:
+        self._writers[fd] = callback
+        self._update(fd)
+
+    def remove_writer(self, fd: int) -> None:
+        if self._writers.pop(fd, None):
+            self._update(fd)
+
+    def _update(self, fd: int) -> None:
+        events = (selectors.EVENT_READ if fd in self._readers else 0) | \
+            (selectors.EVENT_WRITE if fd in self._writers else 0)
+        registered = fd in self._selector.get_map()
+        if not events:
+            if registered:
+                self._selector.unregister(fd)
+        elif registered:
+            self._selector.modify(fd, events)
+        else:
+            self._selector.register(fd, events)
+
+    def _loop(self) -> None:
+        try:
+            while True:
+                timeout = max(0, self._timers[0][0] - time.monotonic()) if self._timers else None
+                for key, mask in self._selector.select(timeout):
+                    if key.fileobj is self._wakeup_reader:
+                        with contextlib.suppress(OSError):
+                            self._wakeup_reader.recv(4096)
+                        continue
+                    if mask & selectors.EVENT_READ and (callback := self._readers.get(key.fd)):
+                        callback()
+                    if mask & selectors.EVENT_WRITE and (callback := self._writers.get(key.fd)):
+                        callback()
+                now = time.monotonic()
+                while self._timers and self._timers[0][0] <= now:
+                    heapq.heappop(self._timers)[2]()
+                while True:
+                    with self._lock:
+                        f = self._calls.popleft() if self._calls else None
+                        if f is None and not self._readers and not self._writers:
+                            self._stopped = True
+                    if f is None:
+                        break
+                    f(self)
+                if self._stopped:
+                    break
+        except Exception as ex:
+            exception_log("unexpected exception in the shared I/O thread", ex)
+            with self._lock:
+                self._stopped = True
+        self._selector.close()
+        self._wakeup_reader.close()
+        self._wakeup_writer.close()
+
+
+g_multiplexer: IOMultiplexer | None = None
+g_multiplexer_lock = threading.Lock()
+
+
+def _call_on_io_thread(f: Callable[[IOMultiplexer], None]) -> IOMultiplexer:
+    """Run `f` on the shared I/O thread, starting that thread if it isn't running (anymore)."""
+    global g_multiplexer
+    with g_multiplexer_lock:
+        if g_multiplexer is None or not g_multiplexer.call_soon(f):
+            g_multiplexer = IOMultiplexer()
+            g_multiplexer.call_soon(f)
+        return g_multiplexer
+
+
+class SharedIOChannel:
+    """
+    The non-blocking counterpart of the reader and writer threads of a TransportWrapper, driven by the shared I/O
+    thread. Incoming bytes are framed and decoded on the I/O thread, outgoing payloads are encoded there as well.
+    """
+
+    def __init__(
+        self,
+        wrapper: TransportWrapper,
+        transport: FileObjectTransport,
+        send_queue: SendQueue,
+        read_fd: int,
+        write_fd: int,
+    ) -> None:
+        self._wrapper = wrapper
+        self._transport = transport
+        self._send_queue = send_queue
+        self._read_fd = read_fd
+        self._write_fd = write_fd
+        self._framer = MessageFramer()
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+        self._write_scheduled = False
+        self._closing = False
+        self._detached = False
+        self._done = threading.Event()
+        os.set_blocking(read_fd, False)
+        os.set_blocking(write_fd, False)
+        self._multiplexer = _call_on_io_thread(self._attach)
+
+    def start_writing(self) -> None:
+        """Called after a payload was added to the send queue."""
+        if self._detached:
+            return
+        with self._lock:
+            if self._write_scheduled:
+                return
+            self._write_scheduled = True
+        self._multiplexer = _call_on_io_thread(self._start_writing)
+
+    def close(self) -> None:
+        """
+        Write what is still queued, waiting at most `CLOSE_FLUSH_TIMEOUT` seconds for the server to read it, then stop
+        serving the file descriptors and end the wrapper. The I/O thread keeps serving the other channels meanwhile.
+
+        On the I/O thread itself, the channel is closed right away, because the flush can't be waited for there.
+        """
+        if self._multiplexer.is_current_thread():
+            self._finish(None)
+        elif self._multiplexer.call_soon(lambda _: self._close()):
+            self._done.wait(CLOSE_FLUSH_TIMEOUT + 1)
+
+    def _attach(self, multiplexer: IOMultiplexer) -> None:
+        self._multiplexer = multiplexer
+        multiplexer.add_reader(self._read_fd, self._on_readable)
+
+    def _detach(self) -> None:
+        self._detached = True
+        self._multiplexer.remove_reader(self._read_fd)
+        self._multiplexer.remove_writer(self._write_fd)
+        self._done.set()
+
+    def _close(self) -> None:
+        """Keep writing until the queue and the buffer are empty, which `_on_writable` detects, or the deadline."""
+        if self._detached or self._closing:
+            return
+        if not self._buffer and not self._send_queue.pending():
+            self._finish(None)
+            return
+        self._closing = True
+        self._multiplexer.add_writer(self._write_fd, self._on_writable)
+        self._multiplexer.call_later(CLOSE_FLUSH_TIMEOUT, self._on_close_deadline)
+
+    def _on_close_deadline(self) -> None:
+        if not self._detached:
+            debug(f"discarding payloads that the server didn't read within {CLOSE_FLUSH_TIMEOUT} s")
+            self._finish(None)
+
+    def _finish(self, exception: Exception | None) -> None:
+        if not self._detached:
+            self._detach()
+            self._wrapper.end(exception)
+
+    def _start_writing(self, multiplexer: IOMultiplexer) -> None:
+        if not self._detached:
+            multiplexer.add_writer(self._write_fd, self._on_writable)
+
+    def _on_readable(self) -> None:
+        try:
+            chunk = os.read(self._read_fd, READ_CHUNK_SIZE)
+        except BlockingIOError:
+            return
+        except OSError as ex:
+            self._finish(ex)
+            return
+        framer = self._framer
+        if not chunk:
+            if framer.pending():
+                self._finish(Exception(f"Unexpected payload in server's stdout:\n\n{framer.pending_text()}"))
+            else:
+                self._finish(None)
+            return
+        framer.feed(chunk)
+        try:
+            while (body := framer.next_message()) is not None:
+                if (payload := self._transport.decode_body(body)) is not None:
+                    self._wrapper.receive(payload)
+        except ValueError as ex:
+            self._finish(Exception(f"Unexpected payload in server's stdout: {ex}\n\n{framer.pending_text()}"))
+        except Exception as ex:
+            self._finish(ex)
+
+    def _on_writable(self) -> None:
+        with self._lock:
+            self._write_scheduled = False
+        try:
+            # Only encode more payloads once the buffer is nearly written, so that a later payload with a higher
+            # priority doesn't end up behind a large backlog.
+            if len(self._buffer) < READ_CHUNK_SIZE and (payloads := self._send_queue.get_batch(MAX_WRITE_BATCH, False)):
+                for payload in payloads:
+                    for chunk in self._transport.encode(payload):
+                        self._buffer += chunk
+                self._wrapper.write_statistics.record(len(payloads))
+            if self._buffer:
+                del self._buffer[:os.write(self._write_fd, self._buffer)]
+        except BlockingIOError:
+            pass
+        except (BrokenPipeError, ConnectionResetError):
+            self._finish(None)
+            return
+        except Exception as ex:
+            self._finish(ex)
+            return
+        if not self._buffer and not self._send_queue.pending():
+            if self._closing:
+                self._finish(None)
+            else:
+                self._multiplexer.remove_writer(self._write_fd)
+
+
 class LaunchConfig:
     __slots__ = ("command", "env")
 
@@ -474,6 +1224,11 @@ class LaunchConfig:
 
 # --- Utils -------------------------------------------------------------------------------------------------------
 
+def set_stderr_lines_per_second(limit: int) -> None:
+    global g_stderr_lines_per_second
+    g_stderr_lines_per_second = max(0, limit)
+
+
 class ErrorReader:
     """
     Relays log messages from a raw stream to a (subclass of) TransportCallbacks.
@@ -481,36 +1236,147 @@ class ErrorReader:
     Because the various transport configurations want to listen to different streams, perhaps completely separate from
     the regular RPC transport, this is wrapped in a different class. For instance, a TCP client transport communicating
     via a socket, while it listens for log messages on the stdout/stderr streams of a spawned child process.
+
+    The stream is read in chunks and split into lines on the reading thread. The lines are handed to the callback
+    object in batches on the async thread, at most `g_stderr_lines_per_second` per second. Lines over that limit are
+    replaced by a summary, but are still kept in the bounded history.
     """
 
     def __init__(self, callback_object: TransportCallbacks, reader: IO[bytes]) -> None:
         self._callback_object = weakref.ref(callback_object)
         self._reader = reader
-        self._thread = threading.Thread(target=self._loop)
-        self._thread.start()
+        self._fd = reader.fileno()
+        self._thread: threading.Thread | None = None
+        self._multiplexer: IOMultiplexer | None = None
+        self._partial = bytearray()
+        self._lock = threading.Lock()
+        self._history: deque[str] = deque(maxlen=STDERR_HISTORY_LINES)
+        self._lines: list[str] = []
+        self._delivery_scheduled = False
+        self._window_start = 0.0
+        self._window_lines = 0
+        self._suppressed = 0
+        if g_shared_io_thread:
+            os.set_blocking(self._fd, False)
+            self._multiplexer = _call_on_io_thread(self._attach)
+        else:
+            self._thread = threading.Thread(target=self._loop)
+            self._thread.start()
 
     def on_transport_close(self) -> None:
         self._reader = None
-        _join_thread(self._thread)
+        if self._thread:
+            _join_thread(self._thread)
+        elif self._multiplexer:
+            self._multiplexer.call_soon(self._detach)
+
+    def _attach(self, multiplexer: IOMultiplexer) -> None:
+        self._multiplexer = multiplexer
+        multiplexer.add_reader(self._fd, self._on_readable)
+
+    def _detach(self, multiplexer: IOMultiplexer) -> None:
+        multiplexer.remove_reader(self._fd)
+
+    def _on_readable(self) -> None:
+        try:
+            chunk = os.read(self._fd, READ_CHUNK_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            chunk = b""
+        if chunk and self._reader and self._callback_object():
+            self._feed(chunk)
+        else:
+            self._feed_eof()
+            if self._multiplexer:
+                self._detach(self._multiplexer)
 
     def _loop(self) -> None:
         try:
-            while self._reader:
-                message = self._reader.readline().decode("utf-8", "replace")
-                if not message:
-                    continue
-                callback_object = self._callback_object()
-                if callback_object:
-                    callback_object.on_stderr_message(message.rstrip())
-                else:
+            while self._reader and self._callback_object():
+                if not (chunk := os.read(self._fd, READ_CHUNK_SIZE)):
                     break
-        except (BrokenPipeError, AttributeError):
+                self._feed(chunk)
+            self._feed_eof()
+        except (BrokenPipeError, AttributeError, OSError):
             pass
         except Exception as ex:
             exception_log("unexpected exception type in error reader", ex)
 
+    def _feed(self, chunk: bytes) -> None:
+        self._partial += chunk
+        end = self._partial.rfind(b"\n") + 1
+        if not end:
+            if len(self._partial) < READ_CHUNK_SIZE:
+                return
+            # Don't let a single line grow unbounded.
+            end = len(self._partial)
+        text = self._partial[:end].decode("utf-8", "replace")
+        del self._partial[:end]
+        self._add_lines(text.splitlines())
+
+    def _feed_eof(self) -> None:
+        if self._partial:
+            text = self._partial.decode("utf-8", "replace")
+            self._partial.clear()
+            self._add_lines(text.splitlines())
+
+    def _add_lines(self, lines: list[str]) -> None:
+        lines = [line.rstrip() for line in lines]
+        limit = g_stderr_lines_per_second
+        with self._lock:
+            self._history.extend(lines)
+            self._start_new_window_if_elapsed()
+            if limit > 0:
+                allowed = max(0, limit - self._window_lines)
+                self._window_lines += len(lines)
+                if len(lines) > allowed:
+                    if not self._suppressed:
+                        # Make sure that the summary is delivered, even if no more lines arrive.
+                        sublime.set_timeout_async(self._deliver_async, 1000)
+                    self._suppressed += len(lines) - allowed
+                    lines = lines[:allowed]
+            self._lines.extend(lines)
+            if not self._lines or self._delivery_scheduled:
+                return
+            self._delivery_scheduled = True
+        sublime.set_timeout_async(self._deliver_async)
+
+    def history(self) -> list[str]:
+        with self._lock:
+            return list(self._history)
+
+    def _start_new_window_if_elapsed(self) -> None:
+        now = time.monotonic()
+        if now - self._window_start < 1:
+            return
+        if self._suppressed:
+            self._lines.append(f"... {self._suppressed} lines suppressed")
+            self._suppressed = 0
+        self._window_start = now
+        self._window_lines = 0
+
+    def _deliver_async(self) -> None:
+        with self._lock:
+            self._start_new_window_if_elapsed()
+            lines = self._lines
+            self._lines = []
+            self._delivery_scheduled = False
+        if lines and (callback_object := self._callback_object()):
+            callback_object.on_stderr_messages(lines)
+
 
 def encode_json(data: JSONRPCMessage) -> bytes:
+    if (replaced := _replace_text_snapshot(data)) is not None:
+        # Encode the message without the text, and splice in the encoding of the text that is shared with the other
+        # sessions that send the same snapshot.
+        message, snapshot = replaced
+        body = _encode_json(message)
+        return body.replace(f'"{snapshot.placeholder}"'.encode("ascii"), snapshot.encoded(_encode_json), 1)
+    return _encode_json(data)
+
+
+def _encode_json(data: Any) -> bytes:
     if orjson:
         return orjson.dumps(data)
     return json.dumps(
@@ -522,12 +1388,52 @@ def encode_json(data: JSONRPCMessage) -> bytes:
     ).encode("utf-8")
 
 
+def _replace_text_snapshot(data: JSONRPCMessage) -> tuple[dict[str, Any], TextSnapshot] | None:
+    """
+    A copy of the message in which a TextSnapshot is replaced by its placeholder, and the snapshot, if the message has
+    one. Only the places where textDocument/didOpen, didChange and didSave carry the full text of a document are
+    checked. The message itself is left untouched, as it may still be read by other threads.
+    """
+    params = data.get("params")
+    if not isinstance(params, dict):
+        return None
+    text_document = params.get("textDocument")
+    content_changes = params.get("contentChanges")
+    if isinstance(text_document, dict) and type(text := text_document.get("text")) is TextSnapshot:
+        params = {**params, "textDocument": {**text_document, "text": text.placeholder}}
+    elif content_changes and type(text := content_changes[0].get("text")) is TextSnapshot:
+        params = {**params, "contentChanges": [{**content_changes[0], "text": text.placeholder}, *content_changes[1:]]}
+    elif type(text := params.get("text")) is TextSnapshot:
+        params = {**params, "text": text.placeholder}
+    else:
+        return None
+    return ({**data, "params": params}, text)
+
+
 def decode_json(message: bytes) -> JSONRPCMessage:
     if orjson:
         return orjson.loads(message)
     return json.loads(message.decode("utf-8"))
 
 
+def notification_method(body: bytes) -> str | None:
+    """
+    Extract the method of a notification from a raw message body, without decoding it.
+
+    This errs on the side of caution: None is returned for anything that can't cheaply be determined to be a top-level
+    notification, like requests, responses, or a "method" key that might be nested in another object.
+    """
+    if b'"id"' in body:
+        return None
+    match = NOTIFICATION_METHOD_PATTERN.search(body)
+    if not match:
+        return None
+    end = match.start() + 1
+    if body.count(b"{", 0, end) != 1 or body.find(b"[", 0, end) != -1:
+        return None
+    return match.group(1).decode("utf-8")
+
+
 # --- Internal ---------------------------------------------------------------------------------------------------------
 
 
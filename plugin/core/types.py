@@ -14,23 +14,29 @@ from .collections import DottedDict
 from .constants import LANGUAGE_IDENTIFIERS
 from .constants import MarkdownLangMap
 from .logging import debug
+from .logging import exception_log
 from .logging import set_debug_logging
+from .transports import set_shared_io_thread
+from .transports import set_stderr_lines_per_second
 from .transports import StdioTransportConfig
 from .transports import TcpClientTransportConfig
 from .transports import TcpServerTransportConfig
 from .transports import TransportConfig
+from .transports import UnixSocketTransportConfig
 from .url import filename_to_uri
 from .url import parse_uri
 from abc import ABC
 from abc import abstractmethod
 from copy import deepcopy
 from dataclasses import dataclass
+from functools import partial
 from typing import Any
 from typing import Callable
 from typing import cast
 from typing import Dict
 from typing import Final
 from typing import Generator
+from typing import Hashable
 from typing import Iterable
 from typing import List
 from typing import TYPE_CHECKING
@@ -46,10 +52,12 @@ from wcmatch.glob import GLOBSTAR
 from wcmatch.glob import IGNORECASE
 import contextlib
 import fnmatch
+import math
 import os
 import posixpath
 import re
 import sublime
+import threading
 import time
 
 if TYPE_CHECKING:
@@ -57,6 +65,13 @@ if TYPE_CHECKING:
     from .workspace import WorkspaceFolder
 
 FEATURES_TIMEOUT = 300  # milliseconds
+# The bounds of the adaptive delay between the last change of a document and syncing it with the server.
+MIN_FEATURES_TIMEOUT = 50  # milliseconds
+MAX_FEATURES_TIMEOUT = 1000  # milliseconds
+# The weight of the most recent response in the moving average of the latency of a feature.
+LATENCY_SMOOTHING = 0.3
+# The granularity of the deadlines of the timers of a TimerWheel.
+TIMER_WHEEL_RESOLUTION = 10  # milliseconds
 
 PANEL_FILE_REGEX = r"^(\S.*):$"
 PANEL_LINE_REGEX = r"^\s+(\d+):(\d+)"
@@ -184,6 +199,145 @@ def debounced(f: Callable[[], Any], timeout_ms: int = 0, condition: Callable[[],
     runner(run, timeout_ms)
 
 
+class TimerWheel:
+    """
+    Runs keyed functions after a timeout, either on the async thread or on the main thread.
+
+    Scheduling a function under the key of a pending timer replaces that timer, and pending timers can be cancelled.
+    Deadlines are rounded up to slots of `TIMER_WHEEL_RESOLUTION` milliseconds, and only the earliest slot has a
+    `sublime.set_timeout` pending, so rescheduling a timer on every keystroke doesn't queue up a callback per keystroke.
+    """
+
+    def __init__(self, async_thread: bool, resolution_ms: int = TIMER_WHEEL_RESOLUTION) -> None:
+        self._async_thread = async_thread
+        self._resolution = resolution_ms / 1000
+        self._lock = threading.Lock()
+        # The slot and function of each pending timer.
+        self._timers: dict[Hashable, tuple[int, Callable[[], Any]]] = {}
+        # The keys that were scheduled into each slot. Keys of timers that were cancelled or rescheduled in the meantime
+        # are skipped when the slot is due.
+        self._slots: dict[int, list[Hashable]] = {}
+        # The slots for which a `sublime.set_timeout` is pending.
+        self._armed: set[int] = set()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._timers
+
+    def schedule(self, key: Hashable, timeout_ms: int, f: Callable[[], Any]) -> None:
+        """
+        Run a function after a timeout, unless it is cancelled or rescheduled under the same key before then.
+
+        :param      key:         The key of the timer. A pending timer with an equal key is replaced.
+        :param      timeout_ms:  The time in milliseconds after which to run the function
+        :param      f:           The function to run. Its return type is discarded.
+        """
+        slot = math.ceil((time.monotonic() + timeout_ms / 1000) / self._resolution)
+        with self._lock:
+            self._timers[key] = (slot, f)
+            self._slots.setdefault(slot, []).append(key)
+            arm = not self._armed or slot < min(self._armed)
+            if arm:
+                self._armed.add(slot)
+        if arm:
+            self._arm(slot)
+
+    def cancel(self, key: Hashable) -> bool:
+        """
+        Cancel a pending timer.
+
+        :returns: Whether a timer with the given key was pending.
+        """
+        with self._lock:
+            return self._timers.pop(key, None) is not None
+
+    def _arm(self, slot: int) -> None:
+        delay_ms = max(0, math.ceil((slot * self._resolution - time.monotonic()) * 1000))
+        runner = sublime.set_timeout_async if self._async_thread else sublime.set_timeout
+        runner(partial(self._on_slot_due, slot), delay_ms)
+
+    def _on_slot_due(self, armed_slot: int) -> None:
+        # The timeout may fire a little early, which must not postpone the slot that it was armed for.
+        current_slot = max(armed_slot, math.floor(time.monotonic() / self._resolution))
+        due: list[Callable[[], Any]] = []
+        with self._lock:
+            self._armed.discard(armed_slot)
+            for slot in sorted(slot for slot in self._slots if slot <= current_slot):
+                for key in self._slots.pop(slot):
+                    timer = self._timers.get(key)
+                    if timer and timer[0] == slot:
+                        del self._timers[key]
+                        due.append(timer[1])
+            next_slot = min(self._slots, default=None)
+            if next_slot is not None and self._armed and min(self._armed) <= next_slot:
+                next_slot = None
+            if next_slot is not None:
+                self._armed.add(next_slot)
+        if next_slot is not None:
+            self._arm(next_slot)
+        for f in due:
+            try:
+                f()
+            except Exception as ex:
+                exception_log("Error in timer", ex)
+
+
+async_timer_wheel = TimerWheel(async_thread=True)
+main_timer_wheel = TimerWheel(async_thread=False)
+
+
+class AdaptiveScheduler:
+    """
+    Tracks how long a language server takes to respond for each feature, to adapt how long to wait after the last change
+    of a document before it is synced and the features that depend on its content are requested again.
+
+    A server that responds fast gets the changes sooner. A slow server gets them later, so that fewer of the follow-up
+    requests are cancelled by the next change. The follow-up requests are sent in the order of their latency, so that
+    the fast features don't wait behind the slow ones.
+    """
+
+    __slots__ = ('_latencies',)
+
+    def __init__(self) -> None:
+        self._latencies: dict[str, float] = {}
+
+    @staticmethod
+    def feature(method: str) -> str:
+        """The requests of a feature, like textDocument/semanticTokens/full and /range, share their latency."""
+        return '/'.join(method.split('/', 2)[:2])
+
+    def record(self, method: str, latency: float) -> None:
+        """
+        Record the time between a request and its response.
+
+        :param method: The method of the request.
+        :param latency: The latency in seconds.
+        """
+        feature = self.feature(method)
+        previous = self._latencies.get(feature)
+        self._latencies[feature] = latency if previous is None else previous + LATENCY_SMOOTHING * (latency - previous)
+
+    def latency(self, method: str) -> float | None:
+        return self._latencies.get(self.feature(method))
+
+    def debounce_ms(self, methods: Iterable[str], document_size: int) -> int:
+        """
+        The time to wait after the last change of a document before it is synced.
+
+        :param methods: The requests that follow a change of the document.
+        :param document_size: The number of characters in the document.
+        """
+        latencies = [latency for method in methods if (latency := self.latency(method)) is not None]
+        if not latencies:
+            return FEATURES_TIMEOUT
+        # Larger documents take longer to sync and to process by the server.
+        timeout = 1000 * sum(latencies) / len(latencies) + document_size / 10000
+        return int(min(MAX_FEATURES_TIMEOUT, max(MIN_FEATURES_TIMEOUT, timeout)))
+
+    def by_latency(self, methods: Iterable[str]) -> list[str]:
+        """Sort methods from the fastest to the slowest. Methods without a known latency come first."""
+        return sorted(methods, key=lambda method: self.latency(method) or 0.0)
+
+
 @dataclass
 class SettingsStore:
     settings: sublime.Settings
@@ -213,9 +367,7 @@ class DebouncerNonThreadSafe:
     """
 
     def __init__(self, async_thread: bool) -> None:
-        self._async_thread = async_thread
-        self._current_id = -1
-        self._next_id = 0
+        self._timer_wheel = async_timer_wheel if async_thread else main_timer_wheel
 
     def debounce(
         self, f: Callable[[], None], timeout_ms: int = 0, condition: Callable[[], bool] = lambda: True
@@ -228,19 +380,17 @@ class DebouncerNonThreadSafe:
         :param      condition:     The condition that must evaluate to True in order to run the function
         """
 
-        def run(debounce_id: int) -> None:
-            if debounce_id != self._current_id:
-                return
+        def run() -> None:
             if condition():
                 f()
 
-        runner = sublime.set_timeout_async if self._async_thread else sublime.set_timeout
-        current_id = self._current_id = self._next_id
-        self._next_id += 1
-        runner(lambda: run(current_id), timeout_ms)
+        self._timer_wheel.schedule(self, timeout_ms, run)
+
+    def is_pending(self) -> bool:
+        return self in self._timer_wheel
 
     def cancel_pending(self) -> None:
-        self._current_id = -1
+        self._timer_wheel.cancel(self)
 
 
 def read_dict_setting(settings_obj: sublime.Settings, key: str, default: dict) -> dict:
@@ -273,6 +423,7 @@ class Settings:
     log_debug = cast("bool", None)
     log_max_size = cast("int", None)
     log_server = cast("list[str]", None)
+    log_stderr_lines_per_second = cast("int", None)
     lsp_code_actions_on_format = cast("dict[str, bool]", None)
     lsp_code_actions_on_save = cast("dict[str, bool]", None)
     lsp_format_on_paste = cast("bool", None)
@@ -281,8 +432,12 @@ class Settings:
     only_show_lsp_completions = cast("bool", None)
     popup_max_characters_height = cast("int", None)
     popup_max_characters_width = cast("int", None)
+    prewarm_idle_timeout = cast("int", None)
+    prewarm_memory_budget = cast("int", None)
+    prewarm_servers = cast("bool", None)
     refactoring_auto_save = cast("str", None)
     semantic_highlighting = cast("bool", None)
+    shared_io_thread = cast("bool", None)
     show_code_actions = cast("str", None)
     show_code_actions_in_hover = cast("bool", None)
     show_code_lens = cast("str", None)
@@ -322,6 +477,7 @@ class Settings:
         r("link_highlight_style", "underline")
         r("log_debug", False)
         r("log_max_size", 8 * 1024)
+        r("log_stderr_lines_per_second", 1000)
         r("lsp_code_actions_on_format", {})
         r("lsp_code_actions_on_save", {})
         r("lsp_format_on_paste", False)
@@ -330,8 +486,12 @@ class Settings:
         r("only_show_lsp_completions", False)
         r("popup_max_characters_height", 1000)
         r("popup_max_characters_width", 120)
+        r("prewarm_idle_timeout", 300)
+        r("prewarm_memory_budget", 1024)
+        r("prewarm_servers", False)
         r("refactoring_auto_save", "never")
         r("semantic_highlighting", False)
+        r("shared_io_thread", False)
         r("show_code_actions", "annotation")
         r("show_code_actions_in_hover", True)
         r("show_code_lens", "annotation")
@@ -389,6 +549,8 @@ class Settings:
             self.on_save_task_timeout_ms = code_action_on_save_timeout_ms
 
         set_debug_logging(self.log_debug)
+        set_shared_io_thread(self.shared_io_thread)
+        set_stderr_lines_per_second(self.log_stderr_lines_per_second)
 
     def highlight_style_region_flags(self, style_str: str) -> tuple[sublime.RegionFlags, sublime.RegionFlags]:
         default = sublime.RegionFlags.NO_UNDO
@@ -630,8 +792,54 @@ class Capabilities(DottedDict):
     Static capabilities come from a response to the initialize request (from Client -> Server).
     Dynamic capabilities can be registered at any moment with client/registerCapability and client/unregisterCapability
     (from Server -> Client).
+
+    Capabilities are checked many times per keystroke, so lookups go through a flat table that maps every dotted path to
+    its value. The table is compiled on the first lookup after the capabilities have changed.
     """
 
+    __slots__ = ('_paths',)
+
+    def __init__(self, d: dict[str, Any] | None = None) -> None:
+        self._paths: dict[str, Any] | None = None
+        super().__init__(d)
+
+    def get(self, path: str | None = None, default: Any = None) -> Any:
+        if path is None:
+            return self._d
+        paths = self._paths if self._paths is not None else self._compile()
+        return paths.get(path, default)
+
+    def set(self, path: str, value: Any) -> None:
+        self._paths = None
+        super().set(path, value)
+
+    def remove(self, path: str) -> None:
+        self._paths = None
+        super().remove(path)
+
+    def clear(self) -> None:
+        self._paths = None
+        super().clear()
+
+    def update(self, d: dict[str, Any]) -> None:
+        self._paths = None
+        super().update(d)
+
+    def _compile(self) -> dict[str, Any]:
+        paths: dict[str, Any] = {}
+        pending: list[tuple[str, dict[str, Any]]] = [('', self._d)]
+        while pending:
+            prefix, d = pending.pop()
+            for key, value in d.items():
+                if '.' in key:
+                    continue  # Not addressable by a dotted path.
+                path = prefix + key
+                paths[path] = value
+                if isinstance(value, dict):
+                    pending.append((path + '.', value))
+        self._paths = paths
+        return paths
+
     def register(
         self,
         registration_id: str,
@@ -667,6 +875,7 @@ class Capabilities(DottedDict):
 
     def assign(self, d: ServerCapabilities) -> None:
         textsync = normalize_text_sync(d.pop("textDocumentSync", None))
+        self._paths = None
         super().assign(cast("dict", d))
         if textsync:
             self.update(textsync)
@@ -782,14 +991,19 @@ class ClientConfig:
         'env',
         'experimental_capabilities',
         'file_watcher',
+        'ignored_notifications',
         'initialization_options',
+        'large_file_threshold',
         'markdown_language_map',
         'priority_selector',
+        'request_timeouts',
         'semantic_tokens',
         'selector',
         'settings',
+        'share_across_windows',
         'syntax_map',
         'tcp_port',
+        'unix_socket',
     }
     """All server configuration keys that we recognize and have handling for."""
 
@@ -802,6 +1016,7 @@ class ClientConfig:
         schemes: list[str] | None = None,
         command: list[str] | None = None,
         tcp_port: int | None = None,
+        unix_socket: str | None = None,
         auto_complete_selector: str | None = None,
         enabled: bool = True,
         initialization_options: DottedDict | None = None,
@@ -815,6 +1030,10 @@ class ClientConfig:
         markdown_language_map: MarkdownLangMapJson | None = None,
         syntax_map: dict[str, str] | None = None,
         path_maps: list[PathMap] | None = None,
+        ignored_notifications: list[str] | None = None,
+        share_across_windows: bool = False,
+        request_timeouts: dict[str, float | None] | None = None,
+        large_file_threshold: int | None = None,
         settings_store: SettingsStore | None = None,
         custom_config_keys: dict[str, Any] | None = None
     ) -> None:
@@ -829,6 +1048,9 @@ class ClientConfig:
         :param tcp_port: Port for TCP transport. `None` uses stdio. `0` picks a free port. Negative values cause LSP to
             host a TCP server (the language server connects to LSP rather than the other way around); `-1` picks any
             free port, and `-N` binds to port `N`.
+        :param unix_socket: Use a Unix domain socket instead of stdio or TCP. `"connect"` makes LSP connect to the
+            socket that the language server listens on, `"listen"` makes LSP listen for the language server to connect.
+            The path of the socket is available as the `${socket}` variable in the `command`.
         :param auto_complete_selector: Scope selector that restricts when auto-complete suggestions are shown. `None`
              means that the value from the Sublime Text setting of the same name is used.
         :param enabled: Whether this server is enabled.
@@ -855,6 +1077,15 @@ class ClientConfig:
             document content from the server via `workspace/textDocumentContent` request.
         :param path_maps: List of :class:`PathMap` entries for translating paths between the local machine and a remote
             server (e.g. inside a container).
+        :param ignored_notifications: Methods of server notifications that are dropped without being decoded, for
+            servers that flood the client with notifications that are of no use to it.
+        :param share_across_windows: Whether windows that start this server with identical settings share one server
+            process, instead of starting a process per window. The server must support workspace folders.
+        :param request_timeouts: Seconds after which requests are canceled, per request method. Requests of other
+            methods never time out. A value of `0` or `None` disables the timeout for the method.
+        :param large_file_threshold: The number of characters above which a document is handled in large file mode,
+            where features that are requested for the whole document are limited to the viewport or skipped. A value of
+            `0` or `None`, the default, disables large file mode.
         :param settings_store: The `SettingsStore` instance holding resource path and `Settings` instance
             for the plugin settings. Present only for `ClientConfig`s created through `from_sublime_settings()`.
         :param custom_config_keys: The complete raw settings dictionary. Used as a fallback for attribute/key access for
@@ -869,6 +1100,7 @@ class ClientConfig:
             self.schemes = ["file"]
         self.command = command or []
         self.tcp_port = tcp_port
+        self.unix_socket = unix_socket
         self.auto_complete_selector = auto_complete_selector
         self._enabled = enabled
         self.initialization_options = initialization_options or DottedDict()
@@ -876,6 +1108,9 @@ class ClientConfig:
         self.env = env or {}
         self.experimental_capabilities = experimental_capabilities
         self.disabled_capabilities = disabled_capabilities or DottedDict()
+        # The results of is_disabled_capability, valid for as long as disabled_capabilities isn't replaced.
+        self._disabled_capability_paths: dict[str, bool] = {}
+        self._disabled_capability_paths_source = self.disabled_capabilities
         self.file_watcher = file_watcher or {}
         self.path_maps = path_maps
         self.semantic_tokens = semantic_tokens
@@ -884,6 +1119,12 @@ class ClientConfig:
         self.resolved_markdown_language_map: MarkdownLangMap | None = None
         self.markdown_language_map = markdown_language_map  # use the setter to populate resolved_markdown_language_map
         self.syntax_map = syntax_map or {}
+        self.ignored_notifications = ignored_notifications or []
+        self.share_across_windows = share_across_windows
+        self.request_timeouts: dict[str, float] = {
+            method: timeout for method, timeout in (request_timeouts or {}).items() if timeout
+        }
+        self.large_file_threshold = large_file_threshold or 0
         self._settings_store = settings_store
         if isinstance(custom_config_keys, dict):
             self._custom_config_keys = custom_config_keys
@@ -986,6 +1227,7 @@ class ClientConfig:
             schemes=deepcopy(s.get("schemes")),
             command=deepcopy(read_list_setting(s, "command", [])),
             tcp_port=deepcopy(s.get("tcp_port")),
+            unix_socket=deepcopy(s.get("unix_socket")),
             auto_complete_selector=deepcopy(s.get("auto_complete_selector")),
             # Default to True, because an LSP plugin is enabled iff it is enabled as a Sublime package.
             enabled=bool(s.get("enabled", True)),
@@ -1000,6 +1242,10 @@ class ClientConfig:
             markdown_language_map=deepcopy(s.get("markdown_language_map")),
             syntax_map=deepcopy(s.get("syntax_map")),
             path_maps=PathMap.parse(s.get("path_maps")),
+            ignored_notifications=deepcopy(read_list_setting(s, "ignored_notifications", [])),
+            share_across_windows=bool(s.get("share_across_windows")),
+            request_timeouts=deepcopy(read_dict_setting(s, "request_timeouts", {})),
+            large_file_threshold=s.get("large_file_threshold"),
             settings_store=settings_store,
             custom_config_keys=deepcopy(s.to_dict())
         )
@@ -1024,6 +1270,7 @@ class ClientConfig:
             schemes=deepcopy(schemes),
             command=deepcopy(d.get("command", [])),
             tcp_port=deepcopy(d.get("tcp_port")),
+            unix_socket=deepcopy(d.get("unix_socket")),
             auto_complete_selector=deepcopy(d.get("auto_complete_selector")),
             enabled=deepcopy(d.get("enabled", False)),
             initialization_options=DottedDict(
@@ -1038,6 +1285,10 @@ class ClientConfig:
             markdown_language_map=deepcopy(d.get("markdown_language_map")),
             syntax_map=deepcopy(d.get("syntax_map")),
             path_maps=PathMap.parse(d.get("path_maps")),
+            ignored_notifications=deepcopy(d.get("ignored_notifications", [])),
+            share_across_windows=bool(d.get("share_across_windows")),
+            request_timeouts=deepcopy(d.get("request_timeouts", {})),
+            large_file_threshold=d.get("large_file_threshold"),
             custom_config_keys=deepcopy(d)
         )
 
@@ -1065,6 +1316,7 @@ class ClientConfig:
             schemes=deepcopy(override.get("schemes", src_config.schemes)),
             command=deepcopy(override.get("command", src_config.command)),
             tcp_port=deepcopy(override.get("tcp_port", src_config.tcp_port)),
+            unix_socket=deepcopy(override.get("unix_socket", src_config.unix_socket)),
             auto_complete_selector=deepcopy(override.get("auto_complete_selector", src_config.auto_complete_selector)),
             enabled=deepcopy(override.get("enabled", src_config.enabled)),
             initialization_options=DottedDict.from_base_and_override(
@@ -1081,6 +1333,10 @@ class ClientConfig:
             markdown_language_map=deepcopy(override.get("markdown_language_map", src_config.markdown_language_map)),
             syntax_map=deepcopy(override.get("syntax_map", src_config.syntax_map)),
             path_maps=PathMap.parse(override.get("path_maps")) or deepcopy(src_config.path_maps),
+            ignored_notifications=deepcopy(override.get("ignored_notifications", src_config.ignored_notifications)),
+            share_across_windows=bool(override.get("share_across_windows", src_config.share_across_windows)),
+            request_timeouts={**src_config.request_timeouts, **override.get("request_timeouts", {})},
+            large_file_threshold=override.get("large_file_threshold", src_config.large_file_threshold),
             settings_store=src_config._settings_store,
             custom_config_keys=deepcopy({**src_config._custom_config_keys, **override})
         )
@@ -1095,6 +1351,10 @@ class ClientConfig:
         :param variables: Sublime Text variable substitution dict (e.g. from `window.extract_variables()`). A `"port"`
             key is added automatically when a TCP port is in use.
         """
+        if self.unix_socket is not None:
+            if self.unix_socket not in {"connect", "listen"}:
+                raise RuntimeError(f'invalid "unix_socket" value: {self.unix_socket}')
+            return UnixSocketTransportConfig(listen=self.unix_socket == "listen")
         if self.tcp_port is not None:
             if self.tcp_port < 0:
                 return TcpServerTransportConfig(None if self.tcp_port == -1 else -self.tcp_port)
@@ -1196,6 +1456,19 @@ class ClientConfig:
 
         :param capability_path: Dotted capability path to check.
         """
+        if self.disabled_capabilities is not self._disabled_capability_paths_source:
+            self.invalidate_disabled_capabilities()
+        if (disabled := self._disabled_capability_paths.get(capability_path)) is None:
+            disabled = self._disabled_capability_paths[capability_path] = self._walk_disabled_capabilities(
+                capability_path)
+        return disabled
+
+    def invalidate_disabled_capabilities(self) -> None:
+        """Forget the cached results of `is_disabled_capability`. Call this after modifying `disabled_capabilities`."""
+        self._disabled_capability_paths.clear()
+        self._disabled_capability_paths_source = self.disabled_capabilities
+
+    def _walk_disabled_capabilities(self, capability_path: str) -> bool:
         for value in self.disabled_capabilities.walk(capability_path):
             if isinstance(value, bool):
                 return value
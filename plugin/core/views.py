@@ -53,6 +53,8 @@ from .protocol import Notification
 from .protocol import Point
 from .protocol import Request
 from .settings import userprefs
+from .snapshots import text_snapshots
+from .text_changes import TextChanges
 from .url import encode_code_action_uri
 from .url import parse_uri
 from .workspace import is_subpath_of
@@ -303,13 +305,18 @@ def entire_content_range(view: sublime.View) -> Range:
     return region_to_range(view, entire_content_region(view))
 
 
-def text_document_item(view: sublime.View, language_id: str) -> TextDocumentItem:
+def document_text(view: sublime.View, shared: bool = True) -> str:
+    """The full text of the view. A shared text is a snapshot that all sessions of the buffer send without copying."""
+    return text_snapshots.get(view) if shared else entire_content(view)
+
+
+def text_document_item(view: sublime.View, language_id: str, shared_text: bool = True) -> TextDocumentItem:
     language_id = cast('LanguageKind', language_id)
     return {
         "uri": uri_from_view(view),
         "languageId": language_id,
         "version": view.change_count(),
-        "text": entire_content(view)
+        "text": document_text(view, shared_text)
     }
 
 
@@ -321,8 +328,10 @@ def text_document_position_params(view: sublime.View, location: int) -> TextDocu
     return {"textDocument": text_document_identifier(view), "position": position(view, location)}
 
 
-def did_open_text_document_params(view: sublime.View, language_id: str) -> DidOpenTextDocumentParams:
-    return {"textDocument": text_document_item(view, language_id)}
+def did_open_text_document_params(
+    view: sublime.View, language_id: str, shared_text: bool = True
+) -> DidOpenTextDocumentParams:
+    return {"textDocument": text_document_item(view, language_id, shared_text)}
 
 
 def render_text_change(change: sublime.TextChange) -> TextDocumentContentChangeEvent:
@@ -337,7 +346,10 @@ def render_text_change(change: sublime.TextChange) -> TextDocumentContentChangeE
 
 
 def did_change_text_document_params(
-    view: sublime.View, version: int, changes: list[sublime.TextChange] | None = None
+    view: sublime.View,
+    version: int,
+    changes: list[sublime.TextChange] | TextChanges | None = None,
+    shared_text: bool = True
 ) -> DidChangeTextDocumentParams:
     content_changes: list[TextDocumentContentChangeEvent] = []
     result: DidChangeTextDocumentParams = {
@@ -346,7 +358,10 @@ def did_change_text_document_params(
     }
     if changes is None:
         # TextDocumentSyncKind.Full
-        content_changes.append({"text": entire_content(view)})
+        content_changes.append({"text": document_text(view, shared_text)})
+    elif isinstance(changes, TextChanges):
+        # TextDocumentSyncKind.Incremental, compacted
+        content_changes.extend(changes.render())
     else:
         # TextDocumentSyncKind.Incremental
         content_changes.extend(render_text_change(change) for change in changes)
@@ -360,13 +375,13 @@ def will_save_text_document_params(
 
 
 def did_save_text_document_params(
-    view: sublime.View, include_text: bool, uri: DocumentUri | None = None
+    view: sublime.View, include_text: bool, uri: DocumentUri | None = None, shared_text: bool = True
 ) -> DidSaveTextDocumentParams:
     result: DidSaveTextDocumentParams = {
         "textDocument": text_document_identifier(uri if uri is not None else view)
     }
     if include_text:
-        result["text"] = entire_content(view)
+        result["text"] = document_text(view, shared_text)
     return result
 
 
@@ -374,13 +389,17 @@ def did_close_text_document_params(uri: DocumentUri) -> DidCloseTextDocumentPara
     return {"textDocument": text_document_identifier(uri)}
 
 
-def did_open(view: sublime.View, language_id: str) -> Notification[DidOpenTextDocumentParams]:
-    return Notification.didOpen(did_open_text_document_params(view, language_id))
+def did_open(
+    view: sublime.View, language_id: str, shared_text: bool = True
+) -> Notification[DidOpenTextDocumentParams]:
+    return Notification.didOpen(did_open_text_document_params(view, language_id, shared_text))
 
 
 def did_change(view: sublime.View, version: int,
-               changes: list[sublime.TextChange] | None = None) -> Notification[DidChangeTextDocumentParams]:
-    return Notification.didChange(did_change_text_document_params(view, version, changes))
+               changes: list[sublime.TextChange] | TextChanges | None = None,
+               shared_text: bool = True
+               ) -> Notification[DidChangeTextDocumentParams]:
+    return Notification.didChange(did_change_text_document_params(view, version, changes, shared_text))
 
 
 def will_save(uri: DocumentUri, reason: TextDocumentSaveReason) -> Notification[WillSaveTextDocumentParams]:
@@ -394,9 +413,9 @@ def will_save_wait_until(
 
 
 def did_save(
-    view: sublime.View, include_text: bool, uri: DocumentUri | None = None
+    view: sublime.View, include_text: bool, uri: DocumentUri | None = None, shared_text: bool = True
 ) -> Notification[DidSaveTextDocumentParams]:
-    return Notification.didSave(did_save_text_document_params(view, include_text, uri))
+    return Notification.didSave(did_save_text_document_params(view, include_text, uri, shared_text))
 
 
 def did_close(uri: DocumentUri) -> Notification[DidCloseTextDocumentParams]:
@@ -30,18 +30,28 @@ from .panels import MAX_LOG_LINES_LIMIT_OFF
 from .panels import MAX_LOG_LINES_LIMIT_ON
 from .panels import PanelManager
 from .panels import PanelName
+from .prewarm import predict_configs
+from .prewarm import prewarm_history
+from .prewarm import PrewarmedSession
+from .prewarm import scan_file_extensions_async
+from .prewarm import session_memory
 from .promise import Promise
 from .protocol import Error
 from .protocol import Notification
 from .protocol import Point
+from .session_multiplexer import start_shared_transport
 from .sessions import AbstractViewListener
+from .sessions import InitCallback
 from .sessions import Logger
 from .sessions import Manager
 from .sessions import Session
 from .settings import client_configs
+from .settings import globalprefs
 from .settings import LspSettingsChangeListener
 from .settings import userprefs
+from .types import async_timer_wheel
 from .types import ClientConfig
+from .types import ClientStates
 from .types import match_file_operation_filters
 from .types import matches_pattern
 from .types import sublime_pattern_to_glob
@@ -68,9 +78,11 @@ import functools
 import json
 import sublime
 import threading
+import time
 
 if TYPE_CHECKING:
     from .tree_view import TreeViewSheet
+    from collections import Counter
 
 
 _NO_DIAGNOSTICS_PLACEHOLDER = "  No diagnostics. Well done!"
@@ -98,8 +110,15 @@ class WindowManager(Manager, WindowConfigChangeListener, ViewStatusHandler):
         self._listeners: WeakSet[AbstractViewListener] = WeakSet()
         self._new_listener: AbstractViewListener | None = None
         self._new_session: Session | None = None
+        self._prewarmed: dict[str, PrewarmedSession] = {}
+        self._prewarm_queue: list[ClientConfig] = []
+        # The config of the prewarmed server that is starting. The next one is started once it finished initializing.
+        self._prewarming: str | None = None
         self._panel_code_phantoms: sublime.PhantomSet | None = None
+        self._diagnostics_update_scheduled = False
         self._server_log: list[tuple[str, str]] = []
+        self._pending_server_log: list[tuple[str, str]] = []
+        self._pending_server_log_lock = threading.Lock()
         self.panel_manager: PanelManager | None = PanelManager(self._window)
         self.tree_view_sheets: dict[str, TreeViewSheet] = {}
         self.formatters: dict[str, str] = {}
@@ -133,6 +152,7 @@ class WindowManager(Manager, WindowConfigChangeListener, ViewStatusHandler):
     def on_load_project_async(self) -> None:
         self.update_workspace_folders_async()
         self._config_manager.update()
+        self.prewarm_async()
 
     def on_post_save_project_async(self) -> None:
         if self.suppress_sessions_restart_on_project_update:
@@ -243,6 +263,7 @@ class WindowManager(Manager, WindowConfigChangeListener, ViewStatusHandler):
                 except Exception as ex:
                     message = f"failed to register session {session.config.name} to listener {listener}"
                     exception_log(message, ex)
+                self._schedule_prewarmed_session_reaper_async(session)
 
     def get_session(self, config_name: str, file_path: str | None = None) -> Session | None:
         if file_path:
@@ -291,43 +312,15 @@ class WindowManager(Manager, WindowConfigChangeListener, ViewStatusHandler):
         file_path = initiating_view.file_name() or ''
         if not self._can_start_config(config.name, file_path):
             return
+        if self._adopt_prewarmed_session(config.name, initiating_view):
+            return
         try:
             workspace_folders = sorted_workspace_folders(self._workspace.folders, file_path)
-            plugin_class = get_plugin(config.name)
-            variables = extract_variables(self._window)
-            cwd = workspace_folders[0].path if workspace_folders else None
-            context = OnPreStartContext(config, variables, initiating_view, cwd, workspace_folders)
-            if plugin_class:
-                if issubclass(plugin_class, LspPlugin):
-                    config.set_view_status(initiating_view, "installing...")
-                    plugin_class.on_pre_start_async(context)
-                    cwd = context.working_directory
-                else:
-                    if plugin_class.needs_update_or_installation():
-                        config.set_view_status(initiating_view, "installing...")
-                        plugin_class.install_or_update()
-                    additional_variables = plugin_class.additional_variables()
-                    if isinstance(additional_variables, dict):
-                        variables.update(additional_variables)
-                    cannot_start_reason = plugin_class.can_start(
-                        self._window, initiating_view, workspace_folders, config)
-                    if cannot_start_reason:
-                        raise PluginStartError(cannot_start_reason)
-                    if new_cwd := plugin_class.on_pre_start(self._window, initiating_view, workspace_folders, config):
-                        cwd = new_cwd
-            config.set_view_status(initiating_view, "starting...")
-            session = Session(self, self._create_logger(config.name), workspace_folders, config, plugin_class)
-            transport = config.create_transport_config().start(config.command, config.env, cwd, variables, session)
-            if plugin_class and issubclass(plugin_class, AbstractPlugin):
-                plugin_class.on_post_start(self._window, initiating_view, workspace_folders, config)
-            config.set_view_status(initiating_view, "initialize")
-            session.initialize_async(
-                variables=variables,
-                transport=transport,
-                working_directory=cwd,
-                init_callback=functools.partial(self._on_post_session_initialize, initiating_view)
-            )
-            self._new_session = session
+            self._new_session = self._create_session_async(
+                config, initiating_view, workspace_folders,
+                functools.partial(self._on_post_session_initialize, initiating_view))
+            if self._workspace.folders:
+                prewarm_history.record(self._workspace.folders, config.name)
         except PluginStartError as ex:
             config.erase_view_status(initiating_view)
             message = f"cannot start {config.name}: {ex!s}"
@@ -350,6 +343,70 @@ class WindowManager(Manager, WindowConfigChangeListener, ViewStatusHandler):
             self._new_session = None
             sublime.set_timeout_async(self._dequeue_listener_async)
 
+    def _create_session_async(
+        self,
+        config: ClientConfig,
+        initiating_view: sublime.View | None,
+        workspace_folders: list[WorkspaceFolder],
+        init_callback: InitCallback,
+        prewarm: bool = False
+    ) -> Session:
+        """
+        Run the plugin hooks, start the server process and send the `initialize` request. When `prewarm` is true, the
+        initiating view is just a stand-in for the plugin hooks, so no status is shown in it. It can only be omitted
+        when prewarming a server without a plugin.
+        """
+        started = time.monotonic()
+        plugin_class = get_plugin(config.name)
+        variables = extract_variables(self._window)
+        cwd = workspace_folders[0].path if workspace_folders else None
+        status_view = None if prewarm else initiating_view
+        if plugin_class:
+            if not initiating_view:
+                raise PluginStartError("no view to start the plugin for")
+            if issubclass(plugin_class, LspPlugin):
+                if status_view:
+                    config.set_view_status(status_view, "installing...")
+                context = OnPreStartContext(config, variables, initiating_view, cwd, workspace_folders)
+                plugin_class.on_pre_start_async(context)
+                cwd = context.working_directory
+            else:
+                if plugin_class.needs_update_or_installation():
+                    if status_view:
+                        config.set_view_status(status_view, "installing...")
+                    plugin_class.install_or_update()
+                additional_variables = plugin_class.additional_variables()
+                if isinstance(additional_variables, dict):
+                    variables.update(additional_variables)
+                cannot_start_reason = plugin_class.can_start(
+                    self._window, initiating_view, workspace_folders, config)
+                if cannot_start_reason:
+                    raise PluginStartError(cannot_start_reason)
+                if new_cwd := plugin_class.on_pre_start(self._window, initiating_view, workspace_folders, config):
+                    cwd = new_cwd
+        if status_view:
+            config.set_view_status(status_view, "starting...")
+        session = Session(self, self._create_logger(config.name), workspace_folders, config, plugin_class)
+        session.startup_timeline.mark("start", started)
+        session.startup_timeline.mark("plugin hooks done")
+        if config.share_across_windows:
+            transport = start_shared_transport(config, cwd, variables, session)
+        else:
+            transport = config.create_transport_config().start(
+                config.command, config.env, cwd, variables, session)
+        session.startup_timeline.mark("process spawned")
+        if plugin_class and issubclass(plugin_class, AbstractPlugin) and initiating_view:
+            plugin_class.on_post_start(self._window, initiating_view, workspace_folders, config)
+        if status_view:
+            config.set_view_status(status_view, "initialize")
+        session.initialize_async(
+            variables=variables,
+            transport=transport,
+            working_directory=cwd,
+            init_callback=init_callback
+        )
+        return session
+
     def _on_post_session_initialize(
         self, initiating_view: sublime.View, session: Session, is_error: bool = False
     ) -> None:
@@ -360,6 +417,141 @@ class WindowManager(Manager, WindowConfigChangeListener, ViewStatusHandler):
         else:
             sublime.set_timeout_async(self._dequeue_listener_async)
 
+    # --- prewarming -------------------------------------------------------------------------------------------------
+
+    def prewarm_async(self) -> None:
+        """Start the language servers that the project in this window is likely to need, before they are needed."""
+        if not userprefs().prewarm_servers or not self._workspace.folders:
+            return
+        folders = list(self._workspace.folders)
+        exclude_patterns = globalprefs().get('folder_exclude_patterns') or []
+        scan_file_extensions_async(
+            folders, exclude_patterns, functools.partial(self._on_file_extensions_scanned_async, folders))
+
+    def _on_file_extensions_scanned_async(self, folders: list[str], extensions: Counter[str]) -> None:
+        if folders != self._workspace.folders:
+            return  # The folders changed during the scan, and another scan was started for the new ones.
+        self._prewarm_queue = predict_configs(self._config_manager.get_configs(), folders, extensions)
+        if not self._prewarming:
+            self._prewarm_next_async()
+
+    def _prewarm_next_async(self) -> None:
+        """
+        Start the next predicted server. Servers are started one at a time, because a process that was just spawned
+        barely uses any memory yet, so the budget can only be checked once the previous server finished initializing.
+        """
+        self._prewarming = None
+        while self._prewarm_queue:
+            config = self._prewarm_queue.pop(0)
+            if config.name in self._prewarmed or self.get_session(config.name):
+                continue
+            if self._prewarmed_memory() >= userprefs().prewarm_memory_budget * 1024 * 1024:
+                debug("memory budget for prewarmed servers is exhausted")
+                self._prewarm_queue.clear()
+                return
+            if self._prewarm_async(config):
+                self._prewarming = config.name
+                return
+
+    def _prewarm_async(self, config: ClientConfig) -> bool:
+        config = ClientConfig.from_config(config, {})
+        config.set_view_status_handler(self)
+        workspace_folders = sorted_workspace_folders(self._workspace.folders, '')
+        plugin_class = get_plugin(config.name)
+        if plugin_class and issubclass(plugin_class, AbstractPlugin) and plugin_class.needs_update_or_installation():
+            debug(f"{config.name}: not prewarming: needs to be installed or updated first")
+            return False
+        if plugin_class and issubclass(plugin_class, LspPlugin) and (
+            plugin_class.on_pre_start_async.__func__  # pyright: ignore[reportFunctionMemberAccess]
+            is not LspPlugin.on_pre_start_async.__func__  # pyright: ignore[reportFunctionMemberAccess]
+        ):
+            # The hook may install or update the server, which is only done when the user opens a file.
+            debug(f"{config.name}: not prewarming: the plugin prepares the server before it starts")
+            return False
+        # Only the plugin hooks look at the initiating view, so it must be a view that the server is applicable to.
+        initiating_view = self._applicable_view(config.name, workspace_folders) if plugin_class else None
+        if plugin_class and not initiating_view:
+            debug(f"{config.name}: not prewarming: no view to run the plugin hooks for")
+            return False
+        debug(f"{config.name}: prewarming")
+        try:
+            session = self._create_session_async(
+                config, initiating_view, workspace_folders,
+                functools.partial(self._on_prewarmed_session_initialize, config.name), prewarm=True)
+        except Exception as ex:
+            debug(f"{config.name}: not prewarming: {ex}")
+            return False
+        self._prewarmed[config.name] = PrewarmedSession(session)
+        return True
+
+    def _applicable_view(self, config_name: str, workspace_folders: list[WorkspaceFolder]) -> sublime.View | None:
+        for view in self._window.views():
+            if any(config.name == config_name for config in self._config_manager.match_view(view, workspace_folders)):
+                return view
+        return None
+
+    def _adopt_prewarmed_session(self, config_name: str, initiating_view: sublime.View) -> bool:
+        """Rather than starting another server for the view, wait for the prewarmed server that is initializing."""
+        prewarmed = self._prewarmed.get(config_name)
+        if not prewarmed or prewarmed.session.state != ClientStates.STARTING:
+            return False
+        file_path = initiating_view.file_name() or ''
+        if not prewarmed.session.handles_path(file_path, self._workspace.contains(file_path)):
+            return False
+        prewarmed.initiating_view = initiating_view
+        prewarmed.session.config.set_view_status(initiating_view, "initialize")
+        self._new_session = prewarmed.session
+        return True
+
+    def _on_prewarmed_session_initialize(self, config_name: str, session: Session, is_error: bool = False) -> None:
+        if self._prewarming == config_name:
+            # Start the next server after this one is handled, so that its memory counts towards the budget.
+            sublime.set_timeout_async(self._prewarm_next_async)
+        prewarmed = self._prewarmed.get(config_name)
+        if not prewarmed or prewarmed.session is not session:
+            return
+        if initiating_view := prewarmed.initiating_view:
+            del self._prewarmed[config_name]
+            self._on_post_session_initialize(initiating_view, session, is_error)
+            return
+        if is_error:
+            # The entry is removed in on_post_exit_async, where it also suppresses the crash handling.
+            return
+        self._sessions.add(session)
+        for listener in self._listeners:
+            self._publish_sessions_to_listener_async(listener)
+        if self._prewarmed_memory() > userprefs().prewarm_memory_budget * 1024 * 1024:
+            debug(f"{config_name}: stopping prewarmed server because the memory budget is exceeded")
+            self._reap_prewarmed_session_async(config_name, session)
+            return
+        self._schedule_prewarmed_session_reaper_async(session)
+
+    def _schedule_prewarmed_session_reaper_async(self, session: Session) -> None:
+        """Stop a prewarmed server when no view has used it for the idle timeout. Using it restarts the timeout."""
+        config_name = session.config.name
+        prewarmed = self._prewarmed.get(config_name)
+        if not prewarmed or prewarmed.session is not session or prewarmed.initiating_view:
+            return
+        async_timer_wheel.schedule(
+            (self._reap_prewarmed_session_async, config_name), userprefs().prewarm_idle_timeout * 1000,
+            functools.partial(self._reap_prewarmed_session_async, config_name, session))
+
+    def _reap_prewarmed_session_async(self, config_name: str, session: Session) -> None:
+        prewarmed = self._prewarmed.get(config_name)
+        if not prewarmed or prewarmed.session is not session:
+            return
+        async_timer_wheel.cancel((self._reap_prewarmed_session_async, config_name))
+        del self._prewarmed[config_name]
+        if any(session.session_views_async()):
+            prewarm_history.record(self._workspace.folders, config_name)
+            return
+        debug(f"{config_name}: stopping prewarmed server that wasn't used")
+        self._sessions.discard(session)
+        session.end_async()
+
+    def _prewarmed_memory(self) -> int:
+        return sum(session_memory(prewarmed.session) for prewarmed in self._prewarmed.values())
+
     def _create_logger(self, config_name: str) -> Logger:
         logger_map = {
             "panel": PanelLogger,
@@ -395,6 +587,11 @@ class WindowManager(Manager, WindowConfigChangeListener, ViewStatusHandler):
             self.register_listener_async(listener)
 
     def _end_sessions_async(self, config_names: list[str] | None = None) -> None:
+        for config_name, prewarmed in list(self._prewarmed.items()):
+            if config_names is None or config_name in config_names:
+                del self._prewarmed[config_name]
+                if prewarmed.session not in self._sessions:
+                    prewarmed.session.end_async()
         for session in list(self._sessions):
             if config_names is None or session.config.name in config_names:
                 session.end_async()
@@ -436,6 +633,13 @@ class WindowManager(Manager, WindowConfigChangeListener, ViewStatusHandler):
         self._sessions.discard(session)
         for listener in self._listeners:
             listener.on_session_shutdown_async(session)
+        prewarmed = self._prewarmed.get(session.config.name)
+        if prewarmed and prewarmed.session is session:
+            async_timer_wheel.cancel((self._reap_prewarmed_session_async, session.config.name))
+            del self._prewarmed[session.config.name]
+            if not any(session.session_views_async()):
+                # Nobody asked for this server, so don't bother the user about it.
+                return
         if exit_code != 0 or exception:
             config = session.config
             restart = self._config_manager.record_crash(config.name, exit_code, exception)
@@ -473,14 +677,33 @@ class WindowManager(Manager, WindowConfigChangeListener, ViewStatusHandler):
         if message_type == MessageType.Error:
             self.window.status_message(f"{config_name}: {message}")
 
-    def handle_stderr_log(self, config_name: str, message: str) -> None:
-        self.handle_server_message_async(config_name, message)
+    def handle_stderr_log(self, config_name: str, messages: list[str]) -> None:
+        self._queue_server_log([(config_name, message) for message in messages])
 
     def handle_server_message_async(self, config_name: str, message: str) -> None:
-        sublime.set_timeout(lambda: self.log_server_message(config_name, message))
+        self._queue_server_log([(config_name, message)])
+
+    def _queue_server_log(self, messages: list[tuple[str, str]]) -> None:
+        # Messages that arrive before the UI thread got around to the previous ones are appended to the same batch, so
+        # that a chatty server causes a single panel update per UI tick rather than one per message.
+        with self._pending_server_log_lock:
+            scheduled = bool(self._pending_server_log)
+            self._pending_server_log.extend(messages)
+            if scheduled or not messages:
+                return
+        sublime.set_timeout(self._flush_server_log)
+
+    def _flush_server_log(self) -> None:
+        with self._pending_server_log_lock:
+            messages = self._pending_server_log
+            self._pending_server_log = []
+        self.log_server_messages(messages)
 
     def log_server_message(self, config_name: str, message: str) -> None:
-        self._server_log.append((config_name, message))
+        self.log_server_messages([(config_name, message)])
+
+    def log_server_messages(self, messages: list[tuple[str, str]]) -> None:
+        self._server_log.extend(messages)
         list_len = len(self._server_log)
         max_lines = self.get_log_lines_limit()
         if list_len >= max_lines:
@@ -512,6 +735,15 @@ class WindowManager(Manager, WindowConfigChangeListener, ViewStatusHandler):
             self.total_warning_count += local_warnings
         for listener in list(self._listeners):
             set_diagnostics_count(listener.view, self.total_error_count, self.total_warning_count)
+        # Diagnostics of many documents can change within a single tick, for example with each partial result of
+        # workspace diagnostics. Render the panel only once for all of those changes.
+        if self._diagnostics_update_scheduled:
+            return
+        self._diagnostics_update_scheduled = True
+        sublime.set_timeout_async(self._on_diagnostics_updated_async)
+
+    def _on_diagnostics_updated_async(self) -> None:
+        self._diagnostics_update_scheduled = False
         if self.panel_manager and self.panel_manager.is_panel_open(PanelName.Diagnostics):
             self.update_diagnostics_panel_async()
 
@@ -647,6 +879,7 @@ class WindowRegistry(LspSettingsChangeListener):
         window_config_manager = WindowConfigManager(window, client_configs.all)
         manager = WindowManager(window, workspace, window_config_manager)
         self._windows[window.id()] = manager
+        sublime.set_timeout_async(manager.prewarm_async)
         return manager
 
     def listener_for_view(self, view: sublime.View) -> AbstractViewListener | None:
@@ -711,6 +944,9 @@ class PanelLogger(Logger):
         """
         pass
 
+    def stderr_messages(self, messages: list[str]) -> None:
+        pass
+
     def log(self, message: str, params: Any) -> None:
 
         def run_on_async_worker_thread() -> None:
@@ -767,6 +1003,12 @@ class PanelLogger(Logger):
         direction = "<? " if unhandled else "<- "
         self.log(self._format_notification(direction, method), params)
 
+    def log_ignored_notifications(self, counts: dict[str, int]) -> None:
+        if not userprefs().log_server:
+            return
+        for method, count in counts.items():
+            self.log(self._format_notification("<x ", method), {"ignored": count})
+
     def _format_response(self, direction: str, request_id: int | str, duration: str) -> str:
         time = RequestTimeTracker.formatted_now()
         return f"[{time}] {direction} {self._server_name} ({request_id}) (duration: {duration})"
@@ -832,14 +1074,19 @@ class RemoteLogger(Logger):
         debug(f"Client({client['id']}) said: {message}")
 
     def stderr_message(self, message: str) -> None:
-        self._broadcast_json({
-            'server': self._server_name,
-            'time': round(perf_counter() * 1000),
-            'method': 'stderr',
-            'params': message,
-            'isError': True,
-            'direction': self.DIRECTION_INCOMING,
-        })
+        self.stderr_messages([message])
+
+    def stderr_messages(self, messages: list[str]) -> None:
+        now = round(perf_counter() * 1000)
+        for message in messages:
+            self._broadcast_json({
+                'server': self._server_name,
+                'time': now,
+                'method': 'stderr',
+                'params': message,
+                'isError': True,
+                'direction': self.DIRECTION_INCOMING,
+            })
 
     def outgoing_request(self, request_id: int | str, method: str, params: Any) -> None:
         self._broadcast_json({
@@ -909,6 +1156,16 @@ class RemoteLogger(Logger):
             'direction': self.DIRECTION_INCOMING,
         })
 
+    def log_ignored_notifications(self, counts: dict[str, int]) -> None:
+        for method, count in counts.items():
+            self._broadcast_json({
+                'server': self._server_name,
+                'time': round(perf_counter() * 1000),
+                'method': method,
+                'params': {'ignored': count},
+                'direction': self.DIRECTION_INCOMING,
+            })
+
     def _broadcast_json(self, data: dict[str, Any]) -> None:
         if RemoteLogger._ws_server:
             json_data = json.dumps(data, sort_keys=True, check_circular=False, separators=(',', ':'))
@@ -925,6 +1182,9 @@ class RouterLogger(Logger):
     def stderr_message(self, *args: Any, **kwargs: Any) -> None:
         self._foreach("stderr_message", *args, **kwargs)
 
+    def stderr_messages(self, *args: Any, **kwargs: Any) -> None:
+        self._foreach("stderr_messages", *args, **kwargs)
+
     def outgoing_response(self, *args: Any, **kwargs: Any) -> None:
         self._foreach("outgoing_response", *args, **kwargs)
 
@@ -946,6 +1206,9 @@ class RouterLogger(Logger):
     def incoming_notification(self, *args: Any, **kwargs: Any) -> None:
         self._foreach("incoming_notification", *args, **kwargs)
 
+    def log_ignored_notifications(self, *args: Any, **kwargs: Any) -> None:
+        self._foreach("log_ignored_notifications", *args, **kwargs)
+
     def _foreach(self, method: str, *args: Any, **kwargs: Any) -> None:
         for logger in self._loggers:
             getattr(logger, method)(*args, **kwargs)
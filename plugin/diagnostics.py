@@ -80,10 +80,16 @@ class DiagnosticsStorage:
     def set_diagnostics(
         self, uri: DocumentUri, identifier: DiagnosticsIdentifier, diagnostics: list[Diagnostic]
     ) -> None:
+        self.set_diagnostics_batch(identifier, {normalize_uri(uri): diagnostics})
+
+    def set_diagnostics_batch(
+        self, identifier: DiagnosticsIdentifier, diagnostics: dict[DocumentUri, list[Diagnostic]]
+    ) -> None:
+        """Set the diagnostics of a stream for many documents at once. The URIs must already be normalized."""
         if identifier is not None and identifier not in self._identifiers:
             raise ValueError(f'diagnostic stream with identifier {identifier} must be registered first')
-        normalized_uri = normalize_uri(uri)
-        self._diagnostics.setdefault(normalized_uri, {})[identifier] = diagnostics
+        for uri, items in diagnostics.items():
+            self._diagnostics.setdefault(uri, {})[identifier] = items
 
     def clear_diagnostics(self, uri: DocumentUri) -> None:
         self._diagnostics.pop(normalize_uri(uri), None)
@@ -46,8 +46,8 @@ from .core.sessions import SessionBufferProtocol
 from .core.settings import userprefs
 from .core.signature_help import SigHelp
 from .core.signature_help import SignatureHelpStyle
+from .core.types import async_timer_wheel
 from .core.types import basescope2languageid
-from .core.types import debounced
 from .core.types import FEATURES_TIMEOUT
 from .core.types import SettingsRegistration
 from .core.url import CODE_ACTION_SCHEME
@@ -246,6 +246,8 @@ class DocumentSyncListener(sublime_plugin.ViewEventListener, AbstractViewListene
         triggers = [trigger for trigger in triggers if 'server' not in trigger]
         settings.set("auto_complete_triggers", triggers)
         self._stored_selection = []
+        async_timer_wheel.cancel((self, self._on_selection_modified_debounced_async))
+        async_timer_wheel.cancel((self, self._do_highlights_async))
         self.view.erase_status(AbstractViewListener.TOTAL_ERRORS_AND_WARNINGS_STATUS_KEY)
         self._clear_highlight_regions()
         self._clear_session_views_async()
@@ -437,6 +439,7 @@ class DocumentSyncListener(sublime_plugin.ViewEventListener, AbstractViewListene
         if not session_views:
             return
         for sb in self.session_buffers_async():
+            sb.refresh_viewport_async(self.view)
             if sb.pending_refreshes & RequestFlags.CODE_LENS:
                 sb.do_code_lenses_async(self.view)
             if sb.pending_refreshes & RequestFlags.DIAGNOSTIC:
@@ -475,6 +478,7 @@ class DocumentSyncListener(sublime_plugin.ViewEventListener, AbstractViewListene
         for sv in self.session_views_async():
             if code_lenses_enabled:
                 sv.session_buffer.resolve_visible_code_lenses_async(self.view)
+            sv.session_buffer.refresh_viewport_async(self.view)
             if plugin := sv.session.plugin:
                 plugin.on_selection_modified_async(sv)
 
@@ -985,7 +989,13 @@ class DocumentSyncListener(sublime_plugin.ViewEventListener, AbstractViewListene
     # --- Private utility methods --------------------------------------------------------------------------------------
 
     def _when_selection_remains_stable_async(self, f: Callable[[], None], r: sublime.Region, after_ms: int) -> None:
-        debounced(f, after_ms, partial(self._is_selection_stable_async, r), async_thread=True)
+
+        def run() -> None:
+            if self._is_selection_stable_async(r):
+                f()
+
+        # Keyed by the function, so that only the latest selection change schedules it.
+        async_timer_wheel.schedule((self, f), after_ms, run)
 
     def _is_selection_stable_async(self, region: sublime.Region) -> bool:
         return bool(self._stored_selection and self._stored_selection[0] == region)
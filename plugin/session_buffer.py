@@ -22,6 +22,7 @@ from ..protocol import FullDocumentDiagnosticReport
 from ..protocol import InlayHint
 from ..protocol import InlayHintParams
 from ..protocol import LSPErrorCodes
+from ..protocol import Range
 from ..protocol import RelatedFullDocumentDiagnosticReport
 from ..protocol import SemanticTokens
 from ..protocol import SemanticTokensDelta
@@ -50,13 +51,14 @@ from .core.protocol import Request
 from .core.protocol import ResolvedCodeLens
 from .core.protocol import ResponseError
 from .core.sessions import is_diagnostic_server_cancellation_data
+from .core.sessions import ResponseCache
 from .core.sessions import Session
 from .core.sessions import SessionViewProtocol
 from .core.settings import userprefs
+from .core.snapshots import text_snapshots
+from .core.text_changes import TextChanges
 from .core.types import Capabilities
-from .core.types import debounced
 from .core.types import DebouncerNonThreadSafe
-from .core.types import FEATURES_TIMEOUT
 from .core.types import SemanticToken
 from .core.url import normalize_uri
 from .core.views import diagnostic_severity
@@ -98,6 +100,18 @@ P = ParamSpec('P')
 # If the total number of characters in the file exceeds this limit, try to send a semantic tokens request only for the
 # visible part first when the file was just opened
 HUGE_FILE_SIZE = 50000
+# In large file mode, only this many diagnostics are drawn in the view, the most severe first.
+LARGE_FILE_MAX_DIAGNOSTICS = 1000
+# The features that are requested again after a change of the document. They are requested in the order of how fast the
+# server responds to them.
+AFTER_CHANGE_METHODS = (
+    'textDocument/documentColor',
+    'textDocument/diagnostic',
+    'textDocument/semanticTokens',
+    'textDocument/documentLink',
+    'textDocument/inlayHint',
+    'textDocument/codeLens',
+)
 
 
 def is_full_document_diagnostic_report(
@@ -118,11 +132,12 @@ class PendingChanges:
 
     def __init__(self, version: int, changes: list[sublime.TextChange]) -> None:
         self.version = version
-        self.changes = list(changes)
+        self.changes = TextChanges()
+        self.changes.add_text_changes(changes)
 
     def update(self, version: int, changes: list[sublime.TextChange]) -> None:
         self.version = version
-        self.changes.extend(changes)
+        self.changes.add_text_changes(changes)
 
 
 @dataclass
@@ -176,6 +191,10 @@ class SessionBuffer:
         self._last_synced_version = 0
         self._last_text_change_time = 0.0
         self._diagnostics_debouncer_async = DebouncerNonThreadSafe(async_thread=True)
+        self._purge_debouncer_async = DebouncerNonThreadSafe(async_thread=True)
+        self.large_file_mode = False
+        # The visible region for which viewport-limited requests were last made in large file mode.
+        self._large_file_viewport: sublime.Region | None = None
         self._color_phantoms = sublime.PhantomSet(view, "lsp_color")
         self._document_links: list[DocumentLink] = []
         self.semantic_tokens = SemanticTokensData()
@@ -187,6 +206,7 @@ class SessionBuffer:
         self._is_saving = False
         self._has_changed_during_save = False
         self._code_lenses = CodeLensCache()
+        self._response_cache = ResponseCache()
         self.code_lens_annotation_color: str = ''
         self._dynamically_registered_commands: dict[str, list[str]] = {}
         self._supported_commands: set[str] = set()
@@ -211,6 +231,10 @@ class SessionBuffer:
     def last_synced_version(self) -> int:
         return self._last_synced_version
 
+    @property
+    def response_cache(self) -> ResponseCache:
+        return self._response_cache
+
     def on_session_view_initialized(self, view: sublime.View) -> None:
         self._check_did_open(view)
 
@@ -220,7 +244,9 @@ class SessionBuffer:
             if not language_id:
                 # we're closing
                 return
-            self.session.send_notification(did_open(view, language_id))
+            self._update_large_file_mode(view)
+            self.session.send_notification(did_open(view, language_id, not self.large_file_mode))
+            self.session.startup_timeline.mark("first didOpen")
             self.opened = True
             version = view.change_count()
             self._last_synced_version = version
@@ -270,14 +296,21 @@ class SessionBuffer:
     def add_session_view(self, sv: SessionViewProtocol) -> None:
         self.session_views.add(sv)
         sv.handle_code_lenses_async(self._filter_supported_code_lenses())
+        if self.large_file_mode:
+            sv.view.set_status(self._large_file_status_key(), self._large_file_status_message())
 
     def remove_session_view(self, sv: SessionViewProtocol) -> None:
         self._clear_semantic_token_regions(sv.view)
+        if self.large_file_mode:
+            sv.view.erase_status(self._large_file_status_key())
         self.session_views.remove(sv)
         if len(self.session_views) == 0:
             self._on_before_destroy(sv.view)
 
     def _on_before_destroy(self, view: sublime.View) -> None:
+        text_snapshots.discard(self._id)
+        self._purge_debouncer_async.cancel_pending()
+        self._diagnostics_debouncer_async.cancel_pending()
         self.remove_all_inlay_hints()
         # With pull diagnostics, the client is responsible to update or clear diagnostics when appropriate.
         # Clear all diagnostics for this view if the file is outside of the workspace folders, so that they don't
@@ -373,6 +406,7 @@ class SessionBuffer:
     ) -> None:
         if change_count <= self._last_synced_version:
             return
+        text_snapshots.discard(self._id)
         self._last_text_change_time = time.time()
         last_change = changes[-1]
         if last_change.a.pt == 0 and last_change.b.pt == 0 and not last_change.str and view.size() != 0:
@@ -397,8 +431,10 @@ class SessionBuffer:
                 self.session.send_request_task(Request.onTypeFormatting(params, view)) \
                     .then(partial(self._on_type_formatting_result_async, view, change_count))
             else:
-                debounced(lambda: self.purge_changes_async(view), FEATURES_TIMEOUT,
-                          lambda: view.is_valid() and change_count == view.change_count(), async_thread=True)
+                timeout = self.session.scheduler.debounce_ms(AFTER_CHANGE_METHODS, view.size())
+                self._purge_debouncer_async.debounce(
+                    lambda: self.purge_changes_async(view), timeout,
+                    lambda: view.is_valid() and change_count == view.change_count())
 
     def _cancel_pending_requests_async(self) -> None:
         for identifier, pending_request in self._document_diagnostic_pending_requests.items():
@@ -412,31 +448,35 @@ class SessionBuffer:
     def on_revert_async(self, view: sublime.View) -> None:
         self._pending_changes = None  # Don't bother with pending changes
         version = view.change_count()
-        self.session.send_notification(did_change(view, version, None))
+        self.session.send_notification(did_change(view, version, None, not self.large_file_mode))
         sublime.set_timeout_async(lambda: self._on_after_change_async(view, version))
 
     on_reload_async = on_revert_async
 
     def purge_changes_async(self, view: sublime.View, suppress_requests: bool = False) -> None:
+        self._purge_debouncer_async.cancel_pending()
         if self._pending_changes is None:
             return
+        self._response_cache.clear()
         sync_kind = self.text_sync_kind()
         if sync_kind == TextDocumentSyncKind.None_:
             return
-        if sync_kind == TextDocumentSyncKind.Full:
+        if sync_kind == TextDocumentSyncKind.Full or self._pending_changes.changes.payload_size() > view.size():
+            # Also send the full text when that's smaller than the incremental changes.
             changes = None
             version = view.change_count() or self._pending_changes.version
         else:
             changes = self._pending_changes.changes
             version = self._pending_changes.version
         try:
-            notification = did_change(view, version, changes)
+            notification = did_change(view, version, changes, not self.large_file_mode)
             self.session.send_notification(notification)
             self._last_synced_version = version
         except MissingUriError:
             return  # we're closing
         finally:
             self._pending_changes = None
+        self._update_large_file_mode(view)
         self.session.notify_plugin_on_session_buffer_change(self)
         sublime.set_timeout_async(lambda: self._on_after_change_async(view, version, suppress_requests))
 
@@ -448,16 +488,23 @@ class SessionBuffer:
             return
         try:
             request_flags = self._get_request_flags(view)
-            if request_flags & RequestFlags.DOCUMENT_COLOR:
-                self._do_color_boxes_async(view, version)
-            self.do_document_diagnostic_async(view, version)
-            if request_flags & RequestFlags.SEMANTIC_TOKENS:
-                self.do_semantic_tokens_async(view)
-            if userprefs().link_highlight_style == 'underline':
-                self._do_document_link_async(view, version)
-            if request_flags & RequestFlags.INLAY_HINT:
-                self.do_inlay_hints_async(view)
-            self.do_code_lenses_async(view)
+            for method in self.session.scheduler.by_latency(AFTER_CHANGE_METHODS):
+                if method == 'textDocument/documentColor':
+                    if request_flags & RequestFlags.DOCUMENT_COLOR:
+                        self._do_color_boxes_async(view, version)
+                elif method == 'textDocument/diagnostic':
+                    self.do_document_diagnostic_async(view, version)
+                elif method == 'textDocument/semanticTokens':
+                    if request_flags & RequestFlags.SEMANTIC_TOKENS:
+                        self.do_semantic_tokens_async(view)
+                elif method == 'textDocument/documentLink':
+                    if userprefs().link_highlight_style == 'underline':
+                        self._do_document_link_async(view, version)
+                elif method == 'textDocument/inlayHint':
+                    if request_flags & RequestFlags.INLAY_HINT:
+                        self.do_inlay_hints_async(view)
+                elif method == 'textDocument/codeLens':
+                    self.do_code_lenses_async(view)
         except MissingUriError:
             pass
 
@@ -470,6 +517,8 @@ class SessionBuffer:
 
     def on_post_save_async(self, view: sublime.View, new_uri: DocumentUri) -> None:
         self._is_saving = False
+        # Saving may replace the file, which changes its inode, even if the URI stays the same.
+        self.session.reindex_session_buffer_async(self)
         if new_uri != self._last_known_uri:
             self._check_did_close(view)
             self._last_known_uri = new_uri
@@ -478,7 +527,8 @@ class SessionBuffer:
             send_did_save, include_text = self.should_notify_did_save()
             if send_did_save:
                 self.purge_changes_async(view)
-                self.session.send_notification(did_save(view, include_text, self._last_known_uri))
+                self.session.send_notification(
+                    did_save(view, include_text, self._last_known_uri, not self.large_file_mode))
         if self._has_changed_during_save:
             self._has_changed_during_save = False
             self._on_after_change_async(view, view.change_count())
@@ -573,9 +623,54 @@ class SessionBuffer:
             return session_view.get_request_flags()
         return RequestFlags.NONE
 
+    # --- large file mode ----------------------------------------------------------------------------------------------
+
+    def _update_large_file_mode(self, view: sublime.View) -> None:
+        threshold = self.session.config.large_file_threshold
+        large_file_mode = bool(threshold) and view.size() > threshold
+        if large_file_mode == self.large_file_mode:
+            return
+        self.large_file_mode = large_file_mode
+        self._large_file_viewport = None
+        key = self._large_file_status_key()
+        for sv in self.session_views:
+            if large_file_mode:
+                sv.view.set_status(key, self._large_file_status_message())
+            else:
+                sv.view.erase_status(key)
+        if large_file_mode:
+            # The result IDs of semantic tokens only exist for full requests.
+            self.semantic_tokens.result_id = None
+            # These are only available for the whole document.
+            self.clear_color_boxes_async()
+            self._document_links = []
+            self._redraw_document_links_async()
+
+    def _large_file_status_key(self) -> str:
+        return f"lsp_large_file_{self.session.config.name}"
+
+    def _large_file_status_message(self) -> str:
+        return f"{self.session.config.name}: large file mode"
+
+    def _large_file_viewport_range(self, view: sublime.View) -> Range:
+        self._large_file_viewport = view.visible_region()
+        return region_to_range(view, self._large_file_viewport)
+
+    def refresh_viewport_async(self, view: sublime.View) -> None:
+        """Request the features that are limited to the viewport in large file mode again, if the viewport moved."""
+        if not self.large_file_mode or view.visible_region() == self._large_file_viewport:
+            return
+        request_flags = self._get_request_flags(view)
+        if request_flags & RequestFlags.SEMANTIC_TOKENS:
+            self.do_semantic_tokens_async(view)
+        if request_flags & RequestFlags.INLAY_HINT:
+            self.do_inlay_hints_async(view)
+
     # --- textDocument/documentColor -----------------------------------------------------------------------------------
 
     def _do_color_boxes_async(self, view: sublime.View, version: int) -> None:
+        if self.large_file_mode:
+            return
         if self.has_capability("colorProvider"):
             self.session.send_request_async(
                 Request.documentColor(document_color_params(view), view),
@@ -592,6 +687,8 @@ class SessionBuffer:
     # --- textDocument/documentLink ------------------------------------------------------------------------------------
 
     def _do_document_link_async(self, view: sublime.View, version: int) -> None:
+        if self.large_file_mode:
+            return
         if self.has_capability("documentLinkProvider"):
             self.session.send_request_async(
                 Request.documentLink({'textDocument': text_document_identifier(view)}, view),
@@ -655,7 +752,8 @@ class SessionBuffer:
         params: DocumentDiagnosticParams = {'textDocument': text_document_identifier(view)}
         if identifier:
             params['identifier'] = identifier
-        if (result_id := self.session.diagnostics_result_ids.get((self._last_known_uri, identifier))) is not None:
+        result_ids = self.session.diagnostics_result_ids.get(identifier, {})
+        if (result_id := result_ids.get(self._last_known_uri)) is not None:
             params['previousResultId'] = result_id
         request_id = self.session.send_request_async(
             Request.documentDiagnostic(params, view),
@@ -670,13 +768,14 @@ class SessionBuffer:
     ) -> None:
         self._diagnostics_versions[identifier] = version
         self._document_diagnostic_pending_requests[identifier] = None
-        self.session.diagnostics_result_ids[(self._last_known_uri, identifier)] = response.get('resultId')
+        result_ids = self.session.diagnostics_result_ids.setdefault(identifier, {})
+        result_ids[self._last_known_uri] = response.get('resultId')
         if is_related_full_document_diagnostic_report(response):
             self.session.handle_diagnostics_async(self._last_known_uri, identifier, version, response['items'])
         if related_documents := response.get('relatedDocuments'):
             for uri, diagnostic_report in related_documents.items():
                 uri = normalize_uri(uri)
-                self.session.diagnostics_result_ids[(uri, identifier)] = diagnostic_report.get('resultId')
+                result_ids[uri] = diagnostic_report.get('resultId')
                 if is_full_document_diagnostic_report(diagnostic_report):
                     self.session.handle_diagnostics_async(uri, identifier, None, diagnostic_report['items'])
 
@@ -711,6 +810,8 @@ class SessionBuffer:
         elif version != change_count:
             return
         diagnostics_version = version
+        if self.large_file_mode and len(raw_diagnostics) > LARGE_FILE_MAX_DIAGNOSTICS:
+            raw_diagnostics = sorted(raw_diagnostics, key=diagnostic_severity)[:LARGE_FILE_MAX_DIAGNOSTICS]
         diagnostics: list[tuple[Diagnostic, sublime.Region]] = []
         data_per_severity: dict[tuple[DiagnosticSeverity, bool], DiagnosticSeverityData] = {}
         for diagnostic in raw_diagnostics:
@@ -825,7 +926,17 @@ class SessionBuffer:
         if self.semantic_tokens.pending_response:
             self.session.cancel_request_async(self.semantic_tokens.pending_response)
         self.semantic_tokens.view_change_count = view.change_count()
-        if only_viewport and self.has_capability("semanticTokensProvider.range"):
+        if self.large_file_mode:
+            if not self.has_capability("semanticTokensProvider.range"):
+                self._reset_pending_refresh(RequestFlags.SEMANTIC_TOKENS)
+                return
+            request = Request.semanticTokensRange({
+                "textDocument": text_document_identifier(view),
+                "range": self._large_file_viewport_range(view)
+            }, view)
+            self.semantic_tokens.pending_response = self.session.send_request_async(
+                request, self._on_semantic_tokens_async, self._on_semantic_tokens_error_async)
+        elif only_viewport and self.has_capability("semanticTokensProvider.range"):
             request = Request.semanticTokensRange({
                 "textDocument": text_document_identifier(view),
                 "range": region_to_range(view, view.visible_region())
@@ -965,7 +1076,7 @@ class SessionBuffer:
             return
         params: InlayHintParams = {
             "textDocument": text_document_identifier(view),
-            "range": entire_content_range(view)
+            "range": self._large_file_viewport_range(view) if self.large_file_mode else entire_content_range(view)
         }
         self.session.send_request_async(Request.inlayHint(params, view), self._on_inlay_hints_async)
         self._reset_pending_refresh(RequestFlags.INLAY_HINT)
@@ -375,6 +375,14 @@ class LspTroubleshootServerCommand(sublime_plugin.WindowCommand):
         line(self.json_dump(config.settings.get()))
         line(' - env')
         line(self.json_dump(config.env))
+        line(' - request_timeouts')
+        line(self.json_dump(config.request_timeouts))
+        line(f' - large_file_threshold\n{self.code_block(str(config.large_file_threshold))}')
+
+        if (wm := windows.lookup(self.window)) and (session := wm.get_session(config.name)):
+            line('\n## Running Session')
+            line(' - timed out requests')
+            line(self.json_dump(dict(session.timed_out_requests)))
 
         line('\n## Active view')
         if active_view:
@@ -448,6 +456,57 @@ class LspDumpWindowConfigs(sublime_plugin.WindowCommand):
             view.run_command("append", {"characters": str(config) + "\n"})
 
 
+class LspDumpStartupTimelines(sublime_plugin.WindowCommand):
+    """Show how long each step in the startup of the window's language servers took, as a table or as JSON."""
+
+    def run(self, output_format: str = "text") -> None:
+        wm = windows.lookup(self.window)
+        if not wm:
+            return
+        sessions = sorted(wm.get_sessions(), key=lambda session: session.config.name)
+        view = self.window.new_file()
+        view.set_scratch(True)
+        view.set_name(f"Window {self.window.id()} startup timelines")
+        view.settings().set("word_wrap", False)
+        if output_format == "json":
+            view.assign_syntax("Packages/JSON/JSON.sublime-syntax")
+            timelines = [
+                {
+                    "config": session.config.name,
+                    "pid": session.transport.pid if session.transport else None,
+                    "events": session.startup_timeline.to_dict()
+                } for session in sessions
+            ]
+            view.run_command("append", {"characters": json.dumps(timelines, indent=2) + "\n"})
+            return
+        lines: list[str] = []
+        for session in sessions:
+            lines.append(f"{session.config.name}:")
+            lines.extend(session.startup_timeline.render())
+            lines.append("")
+        view.run_command("append", {"characters": "\n".join(lines) or "No language servers are running.\n"})
+
+
+class LspDumpStderrHistory(sublime_plugin.WindowCommand):
+    """Show the most recent stderr lines of the window's language servers, including lines that were suppressed."""
+
+    def run(self) -> None:
+        wm = windows.lookup(self.window)
+        if not wm:
+            return
+        sessions = sorted(wm.get_sessions(), key=lambda session: session.config.name)
+        view = self.window.new_file()
+        view.set_scratch(True)
+        view.set_name(f"Window {self.window.id()} stderr history")
+        view.settings().set("word_wrap", False)
+        lines: list[str] = []
+        for session in sessions:
+            lines.append(f"{session.config.name}:")
+            lines.extend(session.transport.stderr_history if session.transport else [])
+            lines.append("")
+        view.run_command("append", {"characters": "\n".join(lines) or "No language servers are running.\n"})
+
+
 class LspDumpBufferCapabilities(sublime_plugin.TextCommand):
     """Very basic command to dump the current view's static and dynamically registered capabilities."""
 
@@ -538,8 +597,8 @@ class ServerTestRunner(TransportCallbacks):
     def on_payload(self, payload: dict[str, Any]) -> None:
         pass
 
-    def on_stderr_message(self, message: str) -> None:
-        self._stderr_lines.append(message)
+    def on_stderr_messages(self, messages: list[str]) -> None:
+        self._stderr_lines.extend(messages)
 
     def on_transport_close(self, exit_code: int, exception: Exception | None) -> None:
         self._transport = None
@@ -0,0 +1,192 @@
+"""
+Micro-benchmarks for hot paths.
+
+The module name deliberately doesn't match the default "test*.py" pattern, so that the benchmarks don't slow down the
+regular test runs. Run them explicitly via UnitTesting, using "benchmarks.py" as the pattern.
+"""
+from __future__ import annotations
+
+from .test_mocks import TEST_CONFIG
+from .test_session import MockLogger
+from .test_session import MockManager
+from LSP.plugin.core.collections import DottedDict
+from LSP.plugin.core.sessions import Session
+from LSP.plugin.core.transports import decode_json
+from LSP.plugin.core.transports import encode_json
+from LSP.plugin.core.transports import FileObjectTransport
+from LSP.plugin.core.transports import StopLoopError
+from LSP.plugin.core.types import Capabilities
+from LSP.plugin.core.types import ClientConfig
+from LSP.plugin.core.types import method2attr
+from LSP.plugin.core.views import diagnostic_severity
+from LSP.plugin.core.views import entire_content
+from LSP.plugin.core.views import range_to_region
+from LSP.plugin.session_buffer import LARGE_FILE_MAX_DIAGNOSTICS
+from typing import Any
+from typing import Callable
+import io
+import sublime
+import time
+import unittest
+
+
+def measure(name: str, f: Callable[[], object], repeat: int = 5) -> float:
+    """Print and return the best wall clock time out of `repeat` runs of `f`."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - start)
+    print(f"{name}: {best * 1000:.2f} ms")
+    return best
+
+
+def recorded_message_stream() -> tuple[bytes, int]:
+    """A stream resembling what a language server sends while a project is being edited."""
+    messages: list[Any] = []
+    for i in range(200):
+        messages.extend((
+            {"jsonrpc": "2.0", "method": "$/progress", "params": {
+                "token": "indexing", "value": {"kind": "report", "message": f"{i}/200", "percentage": i // 2}}},
+            {"jsonrpc": "2.0", "method": "textDocument/publishDiagnostics", "params": {
+                "uri": f"file:///project/src/module_{i}.py", "diagnostics": [{
+                    "range": {"start": {"line": j, "character": 0}, "end": {"line": j, "character": 10}},
+                    "severity": 2, "source": "linter", "message": "unused variable"} for j in range(i % 20)]}},
+            {"jsonrpc": "2.0", "id": i, "result": {"isIncomplete": False, "items": [{
+                "label": f"item_{j}", "kind": 6, "detail": "int", "sortText": f"{j:04}"} for j in range(50)]}},
+        ))
+    stream = b"".join(
+        b"Content-Length: " + str(len(body)).encode("ascii") + b"\r\n\r\n" + body
+        for body in map(encode_json, messages)
+    )
+    return stream, len(messages)
+
+
+class UnbufferedReader:
+    """Hides `read1` so that FileObjectTransport falls back to the http.client header parser."""
+
+    def __init__(self, data: bytes) -> None:
+        self._stream = io.BytesIO(data)
+        self.read = self._stream.read
+        self.readline = self._stream.readline
+
+
+class FramingBenchmark(unittest.TestCase):
+
+    def test_framer_vs_header_parser(self) -> None:
+        stream, count = recorded_message_stream()
+
+        def read_all(reader: Any) -> int:
+            transport = FileObjectTransport(encode_json, decode_json, reader, io.BytesIO())
+            received = 0
+            try:
+                while True:
+                    transport.read()
+                    received += 1
+            except StopLoopError:
+                pass
+            self.assertEqual(received, count)
+            return received
+
+        print(f"\n{count} messages, {len(stream)} bytes")
+        framer = measure("incremental framer", lambda: read_all(io.BytesIO(stream)))
+        parser = measure("http.client parser", lambda: read_all(UnbufferedReader(stream)))
+        print(f"speedup: {parser / framer:.2f}x")
+
+
+class DispatchBenchmark(unittest.TestCase):
+
+    def test_dispatch_table_vs_attribute_lookup(self) -> None:
+        session = Session(manager=MockManager(sublime.active_window()), logger=MockLogger(), workspace_folders=[],
+                          config=TEST_CONFIG, plugin_class=None)
+        methods = ["$/progress", "textDocument/publishDiagnostics", "window/logMessage", "telemetry/event"] * 25000
+
+        def attribute_lookup() -> None:
+            # How handlers were looked up before the dispatch table existed.
+            for method in methods:
+                if handler_name := session.handler_attr_map.get(method2attr(method)):
+                    getattr(session, handler_name)
+
+        def dispatch_table() -> None:
+            for method in methods:
+                session._get_handler(method)
+
+        print(f"\n{len(methods)} lookups")
+        old = measure("attribute lookup", attribute_lookup)
+        new = measure("dispatch table", dispatch_table)
+        print(f"speedup: {old / new:.2f}x")
+
+
+class CapabilitiesBenchmark(unittest.TestCase):
+
+    def test_compiled_capabilities_vs_dotted_dict(self) -> None:
+        server_capabilities: Any = {
+            "textDocumentSync": {"openClose": True, "change": 2, "save": {"includeText": False}},
+            "hoverProvider": True,
+            "completionProvider": {"triggerCharacters": [".", ":"], "resolveProvider": True},
+            "signatureHelpProvider": {"triggerCharacters": ["(", ","]},
+            "codeActionProvider": {"codeActionKinds": ["quickfix", "refactor"], "resolveProvider": True},
+            "semanticTokensProvider": {"legend": {"tokenTypes": [], "tokenModifiers": []}, "full": {"delta": True}},
+            "inlayHintProvider": {"resolveProvider": True},
+            "workspace": {"workspaceFolders": {"supported": True, "changeNotifications": True}},
+        }
+        paths = [
+            "hoverProvider", "completionProvider.resolveProvider", "textDocumentSync.change.syncKind",
+            "semanticTokensProvider.full.delta", "documentHighlightProvider", "workspace.workspaceFolders.supported",
+        ] * 20000
+        config = ClientConfig(name="test", selector="", command=["ls"],
+                              disabled_capabilities=DottedDict({"codeLensProvider": True}))
+        dotted = DottedDict()
+        dotted.assign(dict(server_capabilities))
+        capabilities = Capabilities()
+        capabilities.assign(dict(server_capabilities))
+
+        def dotted_dict() -> None:
+            # How capabilities were looked up before they were compiled.
+            for path in paths:
+                if not config._walk_disabled_capabilities(path):
+                    dotted.get(path)
+
+        def compiled() -> None:
+            for path in paths:
+                if not config.is_disabled_capability(path):
+                    capabilities.get(path)
+
+        print(f"\n{len(paths)} capability checks")
+        old = measure("dotted dict", dotted_dict)
+        new = measure("compiled", compiled)
+        print(f"speedup: {old / new:.2f}x")
+
+
+class LargeFileBenchmark(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.view = sublime.active_window().new_file()
+        self.view.set_scratch(True)
+        # A synthetic dump of about 20 MB.
+        lines = [f'{{"id": {i}, "name": "row_{i}", "values": [{i}, {i * 2}, {i * 3}], "valid": true}},\n'
+                 for i in range(300000)]
+        self.view.run_command("append", {"characters": "".join(lines)})
+
+    def tearDown(self) -> None:
+        self.view.close()
+
+    def test_capped_diagnostics(self) -> None:
+        view = self.view
+        diagnostics: list[Any] = [{
+            "range": {"start": {"line": i * 15, "character": 1}, "end": {"line": i * 15, "character": 5}},
+            "severity": i % 4 + 1, "message": "unexpected value"} for i in range(20000)]
+
+        def all_diagnostics() -> None:
+            for diagnostic in diagnostics:
+                view.split_by_newlines(range_to_region(diagnostic["range"], view))
+
+        def capped() -> None:
+            for diagnostic in sorted(diagnostics, key=diagnostic_severity)[:LARGE_FILE_MAX_DIAGNOSTICS]:
+                view.split_by_newlines(range_to_region(diagnostic["range"], view))
+
+        print(f"\n{view.size()} characters, {len(diagnostics)} diagnostics")
+        measure("textDocument/didOpen text", lambda: encode_json({"text": entire_content(view)}), repeat=1)
+        old = measure("all diagnostics", all_diagnostics, repeat=1)
+        new = measure("large file mode", capped, repeat=1)
+        print(f"speedup: {old / new:.2f}x")
@@ -57,6 +57,14 @@ class ConfigParsingTests(DeferrableTestCase):
         config = read_client_config("pyls", settings)
         self.assertEqual(config.experimental_capabilities, experimental_capabilities)
 
+    def test_large_file_threshold(self) -> None:
+        config = read_client_config("pyls", {"command": ["pyls"]})
+        self.assertEqual(config.large_file_threshold, 0)
+        config = update_client_config(config, {"large_file_threshold": 1000})
+        self.assertEqual(config.large_file_threshold, 1000)
+        config = update_client_config(config, {"large_file_threshold": None})
+        self.assertEqual(config.large_file_threshold, 0)
+
     def test_transport_config_extends_env_path(self) -> None:
         settings = {
             "command": ["pyls"],
@@ -128,6 +136,16 @@ class ConfigParsingTests(DeferrableTestCase):
         # This one should be enabled
         self.assertFalse(config.is_disabled_capability("definitionProvider"))
 
+    def test_disabled_capabilities_can_change(self) -> None:
+        config = read_client_config("pyls", {"command": ["pyls"], "selector": "source.python"})
+        self.assertFalse(config.is_disabled_capability("hoverProvider"))
+        config.disabled_capabilities.set("hoverProvider", True)
+        config.invalidate_disabled_capabilities()
+        self.assertTrue(config.is_disabled_capability("hoverProvider"))
+        config.disabled_capabilities = DottedDict({"colorProvider": True})
+        self.assertFalse(config.is_disabled_capability("hoverProvider"))
+        self.assertTrue(config.is_disabled_capability("colorProvider"))
+
     def test_filter_out_disabled_capabilities_ignore_partially(self) -> None:
         settings = {
             "command": ["pyls"],
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+from LSP.plugin.core.prewarm import PrewarmHistory
+from LSP.plugin.core.prewarm import scan_file_extensions
+from LSP.plugin.core.prewarm import scan_file_extensions_async
+from pathlib import Path
+from typing import Any
+from unittest.mock import MagicMock
+from unittest.mock import patch
+import tempfile
+import threading
+import unittest
+
+
+class ScanFileExtensionsTests(unittest.TestCase):
+
+    def test_scan(self) -> None:
+        with tempfile.TemporaryDirectory() as folder:
+            for path in ("a.py", "b.py", "src/c.PY", "src/d.ts", ".git/e.py", "node_modules/f.ts", "out/g.ts", "h"):
+                file = Path(folder, path)
+                file.parent.mkdir(parents=True, exist_ok=True)
+                file.touch()
+            extensions = scan_file_extensions([folder], ["out"])
+            self.assertEqual(dict(extensions), {".py": 3, ".ts": 1})
+
+    def test_limit(self) -> None:
+        with tempfile.TemporaryDirectory() as folder:
+            for i in range(10):
+                Path(folder, f"{i}.py").touch()
+            self.assertEqual(scan_file_extensions([folder], [], limit=4)[".py"], 4)
+
+    def test_scan_off_the_calling_thread(self) -> None:
+        done = threading.Event()
+        results: list[Any] = []
+
+        def callback(extensions: Any) -> None:
+            results.append((dict(extensions), threading.current_thread()))
+            done.set()
+
+        with tempfile.TemporaryDirectory() as folder:
+            Path(folder, "a.py").touch()
+            with patch("LSP.plugin.core.prewarm.sublime", MagicMock(set_timeout_async=lambda f: f())):
+                scan_file_extensions_async([folder], [], callback)
+                self.assertTrue(done.wait(5))
+        self.assertEqual(results[0][0], {".py": 1})
+        self.assertIsNot(results[0][1], threading.current_thread())
+
+
+class PrewarmHistoryTests(unittest.TestCase):
+
+    def test_record(self) -> None:
+        with tempfile.TemporaryDirectory() as folder:
+            path = Path(folder, "history.json")
+            history = PrewarmHistory(path)
+            history.record(["/a"], "pyright")
+            history.record(["/a", "/b"], "gopls")
+            self.assertEqual(history.configs(["/a"]), ["gopls", "pyright"])
+            self.assertEqual(history.configs(["/b", "/a"]), ["gopls", "pyright"])
+            self.assertEqual(history.configs(["/c"]), [])
+            # The history survives a restart.
+            self.assertEqual(PrewarmHistory(path).configs(["/a"]), ["gopls", "pyright"])
+
+    def test_corrupt_file(self) -> None:
+        with tempfile.TemporaryDirectory() as folder:
+            path = Path(folder, "history.json")
+            path.write_text("{", encoding="utf-8")
+            self.assertEqual(PrewarmHistory(path).configs(["/a"]), [])
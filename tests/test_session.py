@@ -1,12 +1,18 @@
 from __future__ import annotations
 
 from .test_mocks import TEST_CONFIG
+from LSP.plugin.api import AbstractPlugin
+from LSP.plugin.api import LspPlugin
+from LSP.plugin.api import notification_handler
 from LSP.plugin.core.collections import DottedDict
 from LSP.plugin.core.promise import Promise
+from LSP.plugin.core.protocol import Request
 from LSP.plugin.core.sessions import get_initialize_params
 from LSP.plugin.core.sessions import Logger
 from LSP.plugin.core.sessions import Manager
+from LSP.plugin.core.sessions import ResponseCache
 from LSP.plugin.core.sessions import Session
+from LSP.plugin.core.types import async_timer_wheel
 from LSP.plugin.core.types import ClientConfig
 from LSP.plugin.core.workspace import WorkspaceFolder
 from LSP.protocol import Diagnostic
@@ -15,6 +21,7 @@ from LSP.protocol import FileCreate
 from LSP.protocol import FileDelete
 from LSP.protocol import FileRename
 from LSP.protocol import LogMessageParams
+from LSP.protocol import LSPErrorCodes
 from LSP.protocol import MessageActionItem
 from LSP.protocol import ShowMessageParams
 from LSP.protocol import ShowMessageRequestParams
@@ -22,11 +29,13 @@ from LSP.protocol import TextDocumentSyncKind
 from typing import Any
 from typing import Generator
 from typing import TYPE_CHECKING
+from unittest.mock import patch
 import sublime
 import unittest
 import weakref
 
 if TYPE_CHECKING:
+    from LSP.plugin.core.protocol import ClientRequest
     from LSP.plugin.core.protocol import Error
 
 
@@ -35,6 +44,7 @@ class MockManager(Manager):
     def __init__(self, window: sublime.Window) -> None:
         self._window = window
 
+    @property
     def window(self) -> sublime.Window:
         return self._window
 
@@ -72,7 +82,7 @@ class MockManager(Manager):
     def handle_log_message(self, config_name: str, params: LogMessageParams) -> None:
         ...
 
-    def handle_stderr_log(self, config_name: str, message: str) -> None:
+    def handle_stderr_log(self, config_name: str, messages: list[str]) -> None:
         ...
 
     def notify_did_create_files(self, created_files: list[FileCreate]) -> None:
@@ -96,13 +106,13 @@ class MockLogger(Logger):
     def outgoing_error_response(self, request_id: Any, error: Error) -> None:
         pass
 
-    def outgoing_request(self, request_id: int, method: str, params: Any, blocking: bool) -> None:
+    def outgoing_request(self, request_id: int, method: str, params: Any) -> None:
         pass
 
     def outgoing_notification(self, method: str, params: Any) -> None:
         pass
 
-    def incoming_response(self, request_id: int | None, params: Any, is_error: bool, blocking: bool) -> None:
+    def incoming_response(self, request_id: int | str, params: Any, is_error: bool) -> None:
         pass
 
     def incoming_request(self, request_id: Any, method: str, params: Any) -> None:
@@ -112,6 +122,27 @@ class MockLogger(Logger):
         pass
 
 
+class MockTransport:
+
+    def __init__(self) -> None:
+        self.sent: list[Any] = []
+
+    def send(self, payload: Any) -> None:
+        self.sent.append(payload)
+
+
+class MockView:
+
+    def __init__(self) -> None:
+        self.valid = True
+
+    def change_count(self) -> int:
+        return 1
+
+    def is_valid(self) -> bool:
+        return self.valid
+
+
 class MockSessionBuffer:
 
     def __init__(self, session: Session, mock_uri: str, mock_language_id: str) -> None:
@@ -298,3 +329,274 @@ class SessionTest(unittest.TestCase):
     def test_get_session_buffer_for_uri_with_files(self) -> None:
         # TODO: write windows-only test
         pass
+
+    def test_dispatch_table(self) -> None:
+
+        class Plugin(AbstractPlugin):
+
+            @classmethod
+            def name(cls) -> str:
+                return "test"
+
+            def m_window_logMessage(self, params: Any) -> None:
+                pass
+
+            @notification_handler("custom/notification")
+            def on_custom_notification(self, params: Any) -> None:
+                pass
+
+        manager = MockManager(sublime.active_window())
+        session = Session(manager=manager, logger=MockLogger(), workspace_folders=[], config=TEST_CONFIG,
+                          plugin_class=Plugin)
+        self.assertEqual(session._get_handler("window/logMessage"), session.on_window_log_message)
+        self.assertIsNone(session._get_handler("custom/notification"))
+        plugin = Plugin(weakref.ref(session))
+        session._set_plugin(plugin)
+        # Handlers of the plugin take precedence.
+        self.assertEqual(session._get_handler("window/logMessage"), plugin.m_window_logMessage)
+        self.assertEqual(session._get_handler("custom/notification"), plugin.on_custom_notification)
+        self.assertEqual(session._get_handler("window/showMessage"), session.on_window_show_message)
+        self.assertIsNone(session._get_handler("unknown/method"))
+        session._set_plugin(None)
+        self.assertEqual(session._get_handler("window/logMessage"), session.on_window_log_message)
+
+    def test_plugin_message_hooks(self) -> None:
+
+        class Plugin(LspPlugin):
+            intercepted_methods = frozenset({"textDocument/completion"})
+
+            def on_pre_send_request_async(self, request: ClientRequest, view: sublime.View | None) -> None:
+                request["params"]["intercepted"] = True
+
+        manager = MockManager(sublime.active_window())
+        session = Session(manager=manager, logger=MockLogger(), workspace_folders=[], config=TEST_CONFIG,
+                          plugin_class=Plugin)
+        session._set_plugin(Plugin(weakref.ref(session)))
+        self.assertTrue(session._plugin_intercepts("on_pre_send_request_async", "textDocument/completion"))
+        self.assertFalse(session._plugin_intercepts("on_pre_send_request_async", "textDocument/hover"))
+        self.assertFalse(session._plugin_intercepts("on_server_response_async", "textDocument/completion"))
+        completion = Request("textDocument/completion", {})
+        hover = Request("textDocument/hover", {})
+        session.send_request_async(completion, lambda _: None)
+        session.send_request_async(hover, lambda _: None)
+        self.assertEqual(completion.params, {"intercepted": True})
+        self.assertEqual(hover.params, {})
+
+    def test_identical_requests_are_coalesced(self) -> None:
+        manager = MockManager(sublime.active_window())
+        session = Session(manager=manager, logger=MockLogger(), workspace_folders=[], config=TEST_CONFIG,
+                          plugin_class=None)
+        transport = MockTransport()
+        session.transport = transport  # type: ignore
+        view = MockView()
+        params = {"textDocument": {"uri": "file:///a.py"}, "position": {"line": 0, "character": 0}}
+        results: list[Any] = []
+        errors: list[Any] = []
+        first = session.send_request_async(Request("textDocument/hover", params, view), results.append)  # type: ignore
+        second = session.send_request_async(
+            Request("textDocument/hover", dict(reversed(params.items())), view), results.append, errors.append)  # type: ignore
+        third = session.send_request_async(Request("textDocument/hover", params, view), results.append)  # type: ignore
+        self.assertEqual(len(transport.sent), 1)
+        self.assertEqual(len({first, second, third}), 3)
+        session.cancel_request_async(second)
+        self.assertEqual(len(transport.sent), 1)
+        self.assertEqual(len(errors), 1)
+        session.on_payload({"jsonrpc": "2.0", "id": first, "result": "hover"})
+        self.assertEqual(results, ["hover", "hover"])
+        # Once the response arrived, identical requests are sent again.
+        fourth = session.send_request_async(Request("textDocument/hover", params, view), results.append)  # type: ignore
+        fifth = session.send_request_async(Request("textDocument/hover", params, view), results.append)  # type: ignore
+        self.assertEqual(len(transport.sent), 2)
+        session.cancel_request_async(fourth)
+        self.assertEqual(len(transport.sent), 2)
+        session.cancel_request_async(fifth)
+        self.assertEqual(transport.sent[-1]["method"], "$/cancelRequest")
+        self.assertEqual(transport.sent[-1]["params"], {"id": fourth})
+
+    def test_canceled_callers_of_coalesced_requests_are_not_finished(self) -> None:
+        manager = MockManager(sublime.active_window())
+        session = Session(manager=manager, logger=MockLogger(), workspace_folders=[], config=TEST_CONFIG,
+                          plugin_class=None)
+        session.transport = MockTransport()  # type: ignore
+        hooks: list[tuple[str, int]] = []
+        session._invoke_views = lambda request, method, request_id, *args: hooks.append((method, request_id))  # type: ignore
+        view = MockView()
+        params = {"textDocument": {"uri": "file:///a.py"}, "position": {"line": 0, "character": 0}}
+        first = session.send_request_async(Request("textDocument/hover", params, view), print)  # type: ignore
+        second = session.send_request_async(Request("textDocument/hover", params, view), print)  # type: ignore
+        # The caller that owns the server request is canceled, while another caller still waits for the response.
+        session.cancel_request_async(first)
+        session.on_payload({"jsonrpc": "2.0", "id": first, "result": "hover"})
+        self.assertEqual(hooks, [
+            ("on_request_started_async", first),
+            ("on_request_started_async", second),
+            ("on_request_canceled_async", first),
+            ("on_request_finished_async", second),
+        ])
+
+    def test_callers_of_coalesced_requests_get_their_own_result(self) -> None:
+        manager = MockManager(sublime.active_window())
+        session = Session(manager=manager, logger=MockLogger(), workspace_folders=[], config=TEST_CONFIG,
+                          plugin_class=None)
+        session.transport = MockTransport()  # type: ignore
+        view = MockView()
+        params = {"textDocument": {"uri": "file:///a.py"}}
+        results: list[Any] = []
+
+        def sort_in_place(result: list[int]) -> None:
+            result.sort()
+            results.append(result)
+
+        first = session.send_request_async(Request("textDocument/foldingRange", params, view), sort_in_place)  # type: ignore
+        session.send_request_async(Request("textDocument/foldingRange", params, view), results.append)  # type: ignore
+        session.on_payload({"jsonrpc": "2.0", "id": first, "result": [2, 1]})
+        self.assertEqual(results, [[1, 2], [2, 1]])
+
+    def test_cached_responses_can_be_canceled(self) -> None:
+        manager = MockManager(sublime.active_window())
+        session = Session(manager=manager, logger=MockLogger(), workspace_folders=[], config=TEST_CONFIG,
+                          plugin_class=None)
+        session.transport = MockTransport()  # type: ignore
+        hooks: list[tuple[str, int]] = []
+        session._invoke_views = lambda request, method, request_id, *args: hooks.append((method, request_id))  # type: ignore
+        cache = ResponseCache()
+        key = ("textDocument/foldingRange", "{}", 1)
+        cache.put(key, [1])
+        session._response_cache_for_request = lambda request: (cache, key)  # type: ignore
+        view = MockView()
+        results: list[Any] = []
+        errors: list[Any] = []
+        scheduled: list[Any] = []
+        with patch("LSP.plugin.core.sessions.sublime.set_timeout_async", lambda f, *args: scheduled.append(f)):
+            first = session.send_request_async(
+                Request("textDocument/foldingRange", {}, view), results.append, errors.append)  # type: ignore
+            second = session.send_request_async(Request("textDocument/foldingRange", {}, view), results.append)  # type: ignore
+        session.cancel_request_async(first)
+        for f in scheduled:
+            f()
+        self.assertEqual(session.transport.sent, [])  # type: ignore
+        self.assertEqual(results, [[1]])
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(hooks, [
+            ("on_request_started_async", first),
+            ("on_request_started_async", second),
+            ("on_request_canceled_async", first),
+            ("on_request_finished_async", second),
+        ])
+
+    def test_request_deadline(self) -> None:
+        manager = MockManager(sublime.active_window())
+        config = ClientConfig(
+            name="test", command=[], selector="text.plain", request_timeouts={"textDocument/hover": 10})
+        session = Session(manager=manager, logger=MockLogger(), workspace_folders=[], config=config, plugin_class=None)
+        transport = MockTransport()
+        session.transport = transport  # type: ignore
+        errors: list[Any] = []
+        request = Request("textDocument/hover", {}, MockView())  # type: ignore
+        request_id = session.send_request_async(request, lambda _: None, errors.append)
+        self.assertIn((session._on_request_deadline_async, request_id), async_timer_wheel)
+        session._on_request_deadline_async(request_id, request, 10)
+        self.assertEqual(errors[0]["code"], LSPErrorCodes.RequestFailed)
+        self.assertEqual(transport.sent[-1]["method"], "$/cancelRequest")
+        self.assertEqual(session.timed_out_requests["textDocument/hover"], 1)
+        self.assertNotIn(request_id, session._response_handlers)
+        self.assertNotIn(request_id, session._request_sent_times)
+        self.assertNotIn((session._on_request_deadline_async, request_id), async_timer_wheel)
+        # A late response is dropped.
+        session.on_payload({"jsonrpc": "2.0", "id": request_id, "result": "hover"})
+        self.assertEqual(len(errors), 1)
+
+    def test_requests_of_closed_views_are_swept(self) -> None:
+        manager = MockManager(sublime.active_window())
+        session = Session(manager=manager, logger=MockLogger(), workspace_folders=[], config=TEST_CONFIG,
+                          plugin_class=None)
+        session.transport = MockTransport()  # type: ignore
+        errors: list[Any] = []
+        closed = MockView()
+        session.send_request_async(Request("textDocument/definition", {}, closed), print, errors.append)  # type: ignore
+        session.send_request_async(Request("textDocument/definition", {}, MockView()), print, errors.append)  # type: ignore
+        closed.valid = False
+        session._sweep_requests_of_closed_views_async()
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(len(session._response_handlers), 1)
+        self.assertEqual(len(session._request_sent_times), 1)
+
+    def test_response_cancels_request_deadline(self) -> None:
+        manager = MockManager(sublime.active_window())
+        config = ClientConfig(
+            name="test", command=[], selector="text.plain", request_timeouts={"textDocument/hover": 10})
+        session = Session(manager=manager, logger=MockLogger(), workspace_folders=[], config=config, plugin_class=None)
+        session.transport = MockTransport()  # type: ignore
+        request_id = session.send_request_async(Request("textDocument/hover", {}, MockView()), print)  # type: ignore
+        session.on_payload({"jsonrpc": "2.0", "id": request_id, "result": None})
+        self.assertNotIn((session._on_request_deadline_async, request_id), async_timer_wheel)
+        # Requests of methods without a timeout have no deadline.
+        request_id = session.send_request_async(Request("textDocument/definition", {}, MockView()), print)  # type: ignore
+        self.assertNotIn((session._on_request_deadline_async, request_id), async_timer_wheel)
+
+    def test_progress_tokens_are_aggregated(self) -> None:
+        manager = MockManager(sublime.active_window())
+        session = Session(manager=manager, logger=MockLogger(), workspace_folders=[], config=TEST_CONFIG,
+                          plugin_class=None)
+        session.on_window_work_done_progress_create({"token": "a"}, 1)
+        session.on_progress({"token": "a", "value": {"kind": "begin", "title": "Indexing"}})
+        session.on_progress({"token": "b", "value": {"kind": "begin", "title": "Building"}})
+        for percentage in range(100):
+            session.on_progress({"token": "a", "value": {"kind": "report", "percentage": percentage}})
+        self.assertEqual(session._progress._render(), "Indexing (99%) (+1 more)")
+        session.on_progress({"token": "a", "value": {"kind": "end"}})
+        self.assertEqual(session._progress._render(), "Building")
+        self.assertNotIn("a", session._progress_tokens)
+        # Reports on unknown tokens are ignored.
+        session.on_progress({"token": "c", "value": {"kind": "report", "message": "foo"}})
+        self.assertNotIn("c", session._progress)
+        session.on_progress({"token": "b", "value": {"kind": "end"}})
+        self.assertEqual(session._progress._render(), "")
+
+    def test_workspace_diagnostics_are_applied_in_bulk(self) -> None:
+        manager = MockManager(sublime.active_window())
+        session = Session(manager=manager, logger=MockLogger(), workspace_folders=[], config=TEST_CONFIG,
+                          plugin_class=None)
+        session.transport = MockTransport()  # type: ignore
+        session.diagnostics.register_provider(None, {"interFileDependencies": True, "workspaceDiagnostics": True})
+        diagnostic: Diagnostic = {
+            "range": {"start": {"line": 0, "character": 0}, "end": {"line": 0, "character": 1}},
+            "message": "foo"
+        }
+        session._on_workspace_diagnostics_async(None, {"items": [
+            {"kind": "full", "uri": "file:///a.py", "version": None, "resultId": "1", "items": [diagnostic]},
+            {"kind": "full", "uri": "file:///b.py", "version": None, "resultId": "2", "items": []},
+            {"kind": "unchanged", "uri": "file:///c.py", "version": None, "resultId": "3"},
+        ]}, reset_pending_response=False)
+        self.assertEqual(session.diagnostics.get_diagnostics_for_uri("file:///a.py"), [diagnostic])
+        self.assertEqual(session.diagnostics_result_ids, {None: {
+            "file:///a.py": "1", "file:///b.py": "2", "file:///c.py": "3"}})
+        session._do_workspace_diagnostics_async(None)
+        self.assertEqual(len(session.transport.sent[-1]["params"]["previousResultIds"]), 3)  # type: ignore
+
+
+class ResponseCacheTests(unittest.TestCase):
+
+    def test_results_are_copied(self) -> None:
+        cache = ResponseCache()
+        key = ("textDocument/documentSymbol", "{}", 1)
+        result = [{"name": "foo"}]
+        cache.put(key, result)
+        result[0]["name"] = "bar"
+        cached = cache.get(key)
+        self.assertEqual(cached, [{"name": "foo"}])
+        cached[0]["name"] = "bar"
+        self.assertEqual(cache.get(key), [{"name": "foo"}])
+
+    def test_least_recently_used_is_evicted(self) -> None:
+        cache = ResponseCache(max_entries=2)
+        a, b, c = (("textDocument/foldingRange", "{}", version) for version in range(3))
+        cache.put(a, ["a"])
+        cache.put(b, ["b"])
+        self.assertEqual(cache.get(a), ["a"])
+        cache.put(c, ["c"])
+        self.assertIsNone(cache.get(b))
+        self.assertEqual(cache.get(a), ["a"])
+        self.assertEqual(cache.get(c), ["c"])
+        cache.clear()
+        self.assertIsNone(cache.get(a))
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+from LSP.plugin.core.sessions import SessionBufferIndex
+from LSP.plugin.core.url import filename_to_uri
+from pathlib import Path
+import os
+import tempfile
+import unittest
+
+
+class MockSessionBuffer:
+
+    def __init__(self, uri: str) -> None:
+        self.uri = uri
+
+    def get_uri(self) -> str:
+        return self.uri
+
+
+class SessionBufferIndexTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.folder = Path(self.tmp.name).resolve()
+        self.index = SessionBufferIndex()
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def file(self, name: str) -> Path:
+        path = self.folder / name
+        path.touch()
+        return path
+
+    def test_lookup_by_uri(self) -> None:
+        sb = MockSessionBuffer(filename_to_uri(str(self.file("a.py"))))
+        other = MockSessionBuffer("untitled:Untitled-1")
+        self.index.add(sb)  # type: ignore
+        self.index.add(other)  # type: ignore
+        self.assertIs(self.index.get(sb.uri), sb)
+        self.assertIs(self.index.get("untitled:Untitled-1"), other)
+        self.assertIsNone(self.index.get(filename_to_uri(str(self.file("b.py")))))
+
+    @unittest.skipIf(os.name == "nt", "symlinks need extra privileges on Windows")
+    def test_lookup_through_symlink(self) -> None:
+        path = self.file("a.py")
+        link = self.folder / "link.py"
+        link.symlink_to(path)
+        sb = MockSessionBuffer(filename_to_uri(str(path)))
+        self.index.add(sb)  # type: ignore
+        self.assertIs(self.index.get(filename_to_uri(str(link))), sb)
+        self.index.discard(sb)  # type: ignore
+        self.assertIsNone(self.index.get(filename_to_uri(str(link))))
+
+    def test_missing_uri_is_found_after_add(self) -> None:
+        uri = filename_to_uri(str(self.file("a.py")))
+        self.assertIsNone(self.index.get(uri))
+        sb = MockSessionBuffer(uri)
+        self.index.add(sb)  # type: ignore
+        self.assertIs(self.index.get(uri), sb)
+
+    def test_save_as(self) -> None:
+        old_uri = filename_to_uri(str(self.file("a.py")))
+        new_uri = filename_to_uri(str(self.file("b.py")))
+        sb = MockSessionBuffer(old_uri)
+        self.index.add(sb)  # type: ignore
+        sb.uri = new_uri
+        self.index.add(sb)  # type: ignore
+        self.assertIsNone(self.index.get(old_uri))
+        self.assertIs(self.index.get(new_uri), sb)
+
+    def test_buffers_with_same_uri(self) -> None:
+        uri = filename_to_uri(str(self.file("a.py")))
+        a = MockSessionBuffer(uri)
+        b = MockSessionBuffer(uri)
+        self.index.add(a)  # type: ignore
+        self.index.add(b)  # type: ignore
+        self.index.discard(b)  # type: ignore
+        self.assertIs(self.index.get(uri), a)
+
+    def test_buffers_are_held_weakly(self) -> None:
+        uri = filename_to_uri(str(self.file("a.py")))
+        self.index.add(MockSessionBuffer(uri))  # type: ignore
+        self.assertIsNone(self.index.get(uri))
@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+from LSP.plugin.core.session_multiplexer import g_closing_multiplexers
+from LSP.plugin.core.session_multiplexer import SessionMultiplexer
+from LSP.plugin.core.session_multiplexer import shared_transport_key
+from LSP.plugin.core.session_multiplexer import SharedTransport
+from LSP.plugin.core.transports import TransportCallbacks
+from LSP.plugin.core.types import ClientConfig
+from typing import Any
+import unittest
+
+CAPABILITIES = {"workspace": {"workspaceFolders": {"supported": True, "changeNotifications": True}}}
+
+
+class MockServerTransport:
+
+    def __init__(self) -> None:
+        self.sent: list[Any] = []
+        self.closed = False
+
+    def send(self, payload: Any) -> None:
+        self.sent.append(payload)
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class MockSession(TransportCallbacks):
+
+    def __init__(self) -> None:
+        self.received: list[Any] = []
+
+    def on_payload(self, payload: Any) -> None:
+        self.received.append(payload)
+
+
+def folder(name: str) -> dict[str, str]:
+    return {"uri": f"file:///{name}", "name": name}
+
+
+def did_open(uri: str) -> dict[str, Any]:
+    return {"jsonrpc": "2.0", "method": "textDocument/didOpen", "params": {"textDocument": {"uri": uri}}}
+
+
+def notification(method: str, uri: str) -> dict[str, Any]:
+    return {"jsonrpc": "2.0", "method": method, "params": {"textDocument": {"uri": uri}}}
+
+
+class SessionMultiplexerTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = MockServerTransport()
+        self.multiplexer = SessionMultiplexer("key", ())
+        self.multiplexer.transport = self.server  # type: ignore
+        self.sessions: list[MockSession] = []
+
+    def attach(self, *folders: dict[str, str]) -> tuple[SharedTransport, MockSession]:
+        session = MockSession()
+        self.sessions.append(session)  # The multiplexer holds sessions weakly.
+        transport = self.multiplexer.attach(session)
+        transport.send({"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {
+            "workspaceFolders": list(folders)}})
+        return transport, session
+
+    def initialize(self) -> None:
+        request = self.server.sent[0]
+        self.assertEqual(request["method"], "initialize")
+        self.multiplexer.on_payload({"jsonrpc": "2.0", "id": request["id"], "result": {
+            "capabilities": CAPABILITIES}})  # type: ignore
+        self.server.sent.clear()
+
+    def methods(self) -> list[str]:
+        return [payload.get("method") for payload in self.server.sent]
+
+    def test_request_ids_are_rewritten(self) -> None:
+        a, session_a = self.attach(folder("a"))
+        self.initialize()
+        b, session_b = self.attach(folder("b"))
+        self.server.sent.clear()
+        a.send({"jsonrpc": "2.0", "id": 2, "method": "textDocument/hover", "params": {}})
+        b.send({"jsonrpc": "2.0", "id": 2, "method": "textDocument/hover", "params": {}})
+        ids = [payload["id"] for payload in self.server.sent]
+        self.assertEqual(len(set(ids)), 2)
+        self.multiplexer.on_payload({"jsonrpc": "2.0", "id": ids[1], "result": "b"})
+        self.multiplexer.on_payload({"jsonrpc": "2.0", "id": ids[0], "result": "a"})
+        self.assertEqual(session_a.received[-1], {"jsonrpc": "2.0", "id": 2, "result": "a"})
+        self.assertEqual(session_b.received[-1], {"jsonrpc": "2.0", "id": 2, "result": "b"})
+
+    def test_cancel_request(self) -> None:
+        a, _ = self.attach()
+        self.initialize()
+        a.send({"jsonrpc": "2.0", "id": 2, "method": "textDocument/hover", "params": {}})
+        a.send({"jsonrpc": "2.0", "method": "$/cancelRequest", "params": {"id": 2}})
+        self.assertEqual(self.server.sent[1]["params"]["id"], self.server.sent[0]["id"])
+
+    def test_only_first_session_initializes(self) -> None:
+        self.attach(folder("a"))
+        self.initialize()
+        self.attach(folder("a"), folder("b"))
+        self.assertEqual(self.methods(), ["workspace/didChangeWorkspaceFolders"])
+        self.assertEqual(self.server.sent[0]["params"]["event"], {"added": [folder("b")], "removed": []})
+
+    def test_initialize_while_first_is_pending(self) -> None:
+        _, session_a = self.attach(folder("a"))
+        _, session_b = self.attach(folder("b"))
+        self.assertEqual(self.methods(), ["initialize"])
+        request_id = self.server.sent.pop()["id"]
+        self.multiplexer.on_payload({"jsonrpc": "2.0", "id": request_id, "result": {"capabilities": CAPABILITIES}})
+        self.assertEqual(session_a.received[0]["result"]["capabilities"], CAPABILITIES)
+        self.assertEqual(session_b.received[0]["result"]["capabilities"], CAPABILITIES)
+        self.assertEqual(self.methods(), ["workspace/didChangeWorkspaceFolders"])
+
+    def test_documents_are_reference_counted(self) -> None:
+        a, _ = self.attach()
+        self.initialize()
+        b, _ = self.attach()
+        a.send(did_open("file:///a/x.py"))
+        b.send(did_open("file:///a/x.py"))
+        a.send(notification("textDocument/didChange", "file:///a/x.py"))
+        b.send(notification("textDocument/didChange", "file:///a/x.py"))
+        a.send(notification("textDocument/didClose", "file:///a/x.py"))
+        b.send(notification("textDocument/didChange", "file:///a/x.py"))
+        b.send(notification("textDocument/didClose", "file:///a/x.py"))
+        self.assertEqual(self.methods(), [
+            "textDocument/didOpen", "textDocument/didChange", "textDocument/didChange", "textDocument/didClose"])
+
+    def test_diagnostics_are_routed_by_uri(self) -> None:
+        _, session_a = self.attach(folder("a"))
+        self.initialize()
+        b, session_b = self.attach(folder("b"))
+        b.send(did_open("file:///a/x.py"))
+        for uri in ("file:///a/x.py", "file:///a/y.py", "file:///b/z.py"):
+            self.multiplexer.on_payload({"jsonrpc": "2.0", "method": "textDocument/publishDiagnostics", "params": {
+                "uri": uri, "diagnostics": []}})
+        received_a = [payload["params"]["uri"] for payload in session_a.received if "method" in payload]
+        received_b = [payload["params"]["uri"] for payload in session_b.received if "method" in payload]
+        self.assertEqual(received_a, ["file:///a/y.py"])
+        self.assertEqual(received_b, ["file:///a/x.py", "file:///b/z.py"])
+
+    def test_progress_tokens_are_rewritten(self) -> None:
+        _, session_a = self.attach()
+        self.initialize()
+        b, session_b = self.attach()
+        b.send({"jsonrpc": "2.0", "id": 2, "method": "textDocument/references", "params": {"workDoneToken": "t"}})
+        token = self.server.sent[-1]["params"]["workDoneToken"]
+        self.assertNotEqual(token, "t")
+        self.multiplexer.on_payload({"jsonrpc": "2.0", "method": "$/progress", "params": {
+            "token": token, "value": {"kind": "begin", "title": "references"}}})
+        self.assertEqual(session_b.received[-1]["params"]["token"], "t")
+        self.assertEqual([payload for payload in session_a.received if "method" in payload], [])
+
+    def test_capability_registration_is_sent_to_every_session(self) -> None:
+        a, session_a = self.attach()
+        self.initialize()
+        b, session_b = self.attach()
+        self.server.sent.clear()
+        request = {"jsonrpc": "2.0", "id": "r", "method": "client/registerCapability", "params": {"registrations": []}}
+        self.multiplexer.on_payload(request)  # type: ignore
+        self.assertEqual(session_a.received[-1], request)
+        self.assertEqual(session_b.received[-1], request)
+        a.send({"jsonrpc": "2.0", "id": "r", "result": None})
+        b.send({"jsonrpc": "2.0", "id": "r", "result": None})
+        self.assertEqual(self.server.sent, [{"jsonrpc": "2.0", "id": "r", "result": None}])
+
+    def test_workspace_folders_request(self) -> None:
+        self.attach(folder("a"))
+        self.initialize()
+        self.attach(folder("b"))
+        self.server.sent.clear()
+        self.multiplexer.on_payload({"jsonrpc": "2.0", "id": 7, "method": "workspace/workspaceFolders"})
+        self.assertEqual(self.server.sent, [{"jsonrpc": "2.0", "id": 7, "result": [folder("a"), folder("b")]}])
+
+    def test_detach(self) -> None:
+        a, _ = self.attach(folder("a"))
+        self.initialize()
+        b, _ = self.attach(folder("a"), folder("b"))
+        a.send(did_open("file:///a/x.py"))
+        b.send(did_open("file:///a/x.py"))
+        b.send(did_open("file:///b/y.py"))
+        self.server.sent.clear()
+        b.send({"jsonrpc": "2.0", "id": 2, "method": "shutdown"})
+        b.send({"jsonrpc": "2.0", "method": "exit"})
+        b.close()
+        self.assertEqual(self.methods(), ["textDocument/didClose", "workspace/didChangeWorkspaceFolders"])
+        self.assertEqual(self.server.sent[0]["params"]["textDocument"]["uri"], "file:///b/y.py")
+        self.assertEqual(self.server.sent[1]["params"]["event"], {"added": [], "removed": [folder("b")]})
+        self.assertFalse(self.server.closed)
+        self.server.sent.clear()
+        a.send({"jsonrpc": "2.0", "id": 2, "method": "shutdown"})
+        a.send({"jsonrpc": "2.0", "method": "exit"})
+        a.close()
+        self.assertEqual(self.methods(), ["shutdown", "exit"])
+        self.assertTrue(self.server.closed)
+
+    def test_detach_forgets_requests_and_tokens(self) -> None:
+        self.attach()
+        self.initialize()
+        b, session_b = self.attach()
+        b.send({"jsonrpc": "2.0", "id": 2, "method": "textDocument/references", "params": {"workDoneToken": "t"}})
+        request = self.server.sent[-1]
+        b.close()
+        self.assertEqual(self.multiplexer._requests, {})
+        self.assertEqual(self.multiplexer._request_ids, {})
+        self.assertEqual(self.multiplexer._tokens, {})
+        received = len(session_b.received)
+        self.multiplexer.on_payload({"jsonrpc": "2.0", "id": request["id"], "result": []})
+        self.assertEqual(len(session_b.received), received)
+
+    def test_can_add_workspace_folders(self) -> None:
+        self.attach(folder("a"))
+        self.assertFalse(self.multiplexer.can_add_workspace_folders())
+        self.initialize()
+        self.assertTrue(self.multiplexer.can_add_workspace_folders())
+        multiplexer = SessionMultiplexer("other", ())
+        multiplexer.transport = MockServerTransport()  # type: ignore
+        multiplexer.attach(MockSession()).send({"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {}})
+        multiplexer.on_payload({"jsonrpc": "2.0", "id": 1, "result": {"capabilities": {}}})
+        self.assertFalse(multiplexer.can_add_workspace_folders())
+
+    def test_multiplexer_is_kept_alive_until_the_transport_closed(self) -> None:
+        a, _ = self.attach()
+        self.initialize()
+        a.close()
+        self.assertTrue(self.server.closed)
+        self.assertIn(self.multiplexer, g_closing_multiplexers)
+        self.multiplexer.on_transport_close(0, None)
+        self.assertNotIn(self.multiplexer, g_closing_multiplexers)
+
+
+class SharedTransportKeyTests(unittest.TestCase):
+
+    def test_working_directory_is_part_of_the_key(self) -> None:
+        config = ClientConfig(name="test", selector="source.test", command=["server"])
+        self.assertNotEqual(shared_transport_key(config, "/a", {}), shared_transport_key(config, "/b", {}))
+        self.assertEqual(shared_transport_key(config, "/a", {}), shared_transport_key(config, "/a", {}))
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+from LSP.plugin.core.snapshots import TextSnapshotCache
+from unittest.mock import MagicMock
+from unittest.mock import patch
+import unittest
+
+
+def mock_view(buffer_id: int, text: str, change_count: int = 1) -> MagicMock:
+    view = MagicMock()
+    view.buffer_id.return_value = buffer_id
+    view.change_count.return_value = change_count
+    view.size.return_value = len(text)
+    view.substr.return_value = text
+    return view
+
+
+class TextSnapshotCacheTests(unittest.TestCase):
+
+    def test_snapshot_is_shared_until_the_buffer_changes(self) -> None:
+        cache = TextSnapshotCache()
+        snapshot = cache.get(mock_view(1, "foo"))
+        self.assertIs(cache.get(mock_view(1, "foo")), snapshot)
+        self.assertIsNot(cache.get(mock_view(1, "foo bar", change_count=2)), snapshot)
+
+    def test_discard(self) -> None:
+        cache = TextSnapshotCache()
+        snapshot = cache.get(mock_view(1, ""))
+        cache.discard(1)
+        self.assertIsNot(cache.get(mock_view(1, "")), snapshot)
+        self.assertEqual(cache._size, snapshot.size)
+
+    def test_size_is_bounded(self) -> None:
+        cache = TextSnapshotCache()
+        first = cache.get(mock_view(1, "x" * 1000))
+        with patch("LSP.plugin.core.snapshots.MAX_TEXT_SNAPSHOTS_SIZE", 2 * first.size + 1):
+            second = cache.get(mock_view(2, "y" * 1000))
+            cache.get(mock_view(3, "z" * 1000))
+            # The least recently used snapshot is dropped.
+            self.assertIs(cache.get(mock_view(2, "y" * 1000)), second)
+            self.assertIsNot(cache.get(mock_view(1, "x" * 1000)), first)
+            # Snapshots that exceed the bound on their own are not kept.
+            huge = cache.get(mock_view(4, "w" * 10000))
+            self.assertIsNot(cache.get(mock_view(4, "w" * 10000)), huge)
+            self.assertLessEqual(cache._size, 2 * first.size + 1)
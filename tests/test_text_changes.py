@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+from LSP.plugin.core.text_changes import TextChanges
+from LSP.plugin.core.text_changes import utf16_len
+from typing import Tuple
+from typing import TYPE_CHECKING
+import random
+import unittest
+
+if TYPE_CHECKING:
+    from LSP.protocol import TextDocumentContentChangeEvent
+
+Change = Tuple[Tuple[int, int], Tuple[int, int], int, str]
+
+ALPHABET = "ab \n\né\U0001f600"
+
+
+def position_to_offset(text: str, line: int, character: int) -> int:
+    offset = 0
+    for _ in range(line):
+        offset = text.index("\n", offset) + 1
+    count = 0
+    while count < character:
+        count += 2 if ord(text[offset]) > 0xFFFF else 1
+        offset += 1
+    return offset
+
+
+def offset_to_position(text: str, offset: int) -> tuple[int, int]:
+    before = text[:offset]
+    line = before.count("\n")
+    return (line, utf16_len(before[before.rfind("\n") + 1:]))
+
+
+def apply(text: str, change: TextDocumentContentChangeEvent) -> str:
+    assert "range" in change
+    start = position_to_offset(text, change["range"]["start"]["line"], change["range"]["start"]["character"])
+    end = position_to_offset(text, change["range"]["end"]["line"], change["range"]["end"]["character"])
+    assert change.get("rangeLength") == utf16_len(text[start:end])
+    return text[:start] + change["text"] + text[end:]
+
+
+def random_text(rng: random.Random, max_length: int) -> str:
+    return "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, max_length)))
+
+
+def random_change(rng: random.Random, text: str) -> tuple[str, Change]:
+    """Return the changed text, and the change like ST reports it in a sublime.TextChange."""
+    start = rng.randint(0, len(text))
+    end = min(len(text), start + rng.choice([0, 0, 1, rng.randint(0, 10)]))
+    new_text = random_text(rng, 3)
+    change = (offset_to_position(text, start), offset_to_position(text, end), utf16_len(text[start:end]), new_text)
+    return text[:start] + new_text + text[end:], change
+
+
+class TextChangesTests(unittest.TestCase):
+
+    def check(self, document: str, changes: list[Change], expected: str) -> TextChanges:
+        text_changes = TextChanges()
+        for change in changes:
+            text_changes.add(*change)
+        result = document
+        for content_change in text_changes.render():
+            result = apply(result, content_change)
+        self.assertEqual(result, expected)
+        return text_changes
+
+    def test_typing_is_merged_into_one_edit(self) -> None:
+        changes: list[Change] = [((1, 2 + i), (1, 2 + i), 0, "x") for i in range(200)]
+        text_changes = self.check("foo\nbar\nbaz", changes, "foo\nba" + "x" * 200 + "r\nbaz")
+        self.assertEqual(len(text_changes), 1)
+
+    def test_typing_and_deleting_is_merged_into_one_edit(self) -> None:
+        changes: list[Change] = [
+            ((0, 3), (0, 3), 0, "a"),
+            ((0, 4), (0, 4), 0, "b"),
+            ((0, 4), (0, 5), 1, ""),
+            ((0, 2), (0, 4), 2, ""),
+        ]
+        text_changes = self.check("foo bar", changes, "fo bar")
+        self.assertEqual(len(text_changes), 1)
+        self.assertEqual(text_changes.render()[0].get("rangeLength"), 1)
+
+    def test_multiple_cursors(self) -> None:
+        document = "\n".join(f"line {i}" for i in range(100))
+        changes: list[Change] = []
+        for column in range(4, 10):
+            changes.extend(((line, column), (line, column), 0, "x") for line in range(0, 100, 10))
+        expected = "\n".join(f"line{'x' * 6} {i}" if i % 10 == 0 else f"line {i}" for i in range(100))
+        text_changes = self.check(document, changes, expected)
+        self.assertEqual(len(text_changes), 10)
+
+    def test_random_changes_are_equivalent(self) -> None:
+        for seed in range(500):
+            rng = random.Random(seed)  # noqa: S311
+            document = random_text(rng, 40)
+            text = document
+            changes: list[Change] = []
+            for _ in range(rng.randint(1, 30)):
+                text, change = random_change(rng, text)
+                changes.append(change)
+            with self.subTest(seed=seed):
+                text_changes = self.check(document, changes, text)
+                self.assertLessEqual(len(text_changes), len(changes))
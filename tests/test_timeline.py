@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+from LSP.plugin.core.timeline import StartupTimeline
+import unittest
+
+
+class StartupTimelineTests(unittest.TestCase):
+
+    def test_only_first_occurrence_is_kept(self) -> None:
+        timeline = StartupTimeline()
+        timeline.mark("start", 10.0)
+        timeline.mark("first diagnostics", 12.5)
+        timeline.mark("process spawned", 10.25)
+        timeline.mark("first diagnostics", 13.0)
+        self.assertEqual(timeline.to_dict(), {"start": 0.0, "process spawned": 250.0, "first diagnostics": 2500.0})
+        lines = timeline.render()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[2].endswith("(+2250.0 ms)  first diagnostics"))
+
+    def test_empty(self) -> None:
+        timeline = StartupTimeline()
+        self.assertEqual(timeline.to_dict(), {})
+        self.assertEqual(timeline.render(), [])
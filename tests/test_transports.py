@@ -0,0 +1,437 @@
+from __future__ import annotations
+
+from LSP.plugin.core.snapshots import TextSnapshot
+from LSP.plugin.core.transports import _encode_json
+from LSP.plugin.core.transports import decode_json
+from LSP.plugin.core.transports import encode_json
+from LSP.plugin.core.transports import ErrorReader
+from LSP.plugin.core.transports import FileObjectTransport
+from LSP.plugin.core.transports import MessageFramer
+from LSP.plugin.core.transports import notification_method
+from LSP.plugin.core.transports import SendQueue
+from LSP.plugin.core.transports import StopLoopError
+from LSP.plugin.core.transports import TransportCallbacks
+from LSP.plugin.core.transports import TransportWrapper
+from typing import Any
+from unittest.mock import MagicMock
+from unittest.mock import patch
+import io
+import os
+import threading
+import time
+import unittest
+
+
+def frame(payload: Any, extra_headers: bytes = b"") -> bytes:
+    body = encode_json(payload)
+    return b"Content-Length: " + str(len(body)).encode("ascii") + b"\r\n" + extra_headers + b"\r\n" + body
+
+
+class MessageFramerTests(unittest.TestCase):
+
+    def test_single_message(self) -> None:
+        framer = MessageFramer()
+        framer.feed(frame({"id": 1}))
+        self.assertEqual(framer.next_message(), b'{"id":1}')
+        self.assertIsNone(framer.next_message())
+        self.assertEqual(framer.pending(), 0)
+
+    def test_multiple_messages_in_one_chunk(self) -> None:
+        framer = MessageFramer()
+        framer.feed(frame({"id": 1}) + frame({"id": 2}) + frame({"id": 3}))
+        self.assertEqual(framer.next_message(), b'{"id":1}')
+        self.assertEqual(framer.next_message(), b'{"id":2}')
+        self.assertEqual(framer.next_message(), b'{"id":3}')
+        self.assertIsNone(framer.next_message())
+
+    def test_byte_by_byte(self) -> None:
+        framer = MessageFramer()
+        payloads = [{"id": i, "result": "😃" * i} for i in range(10)]
+        bodies: list[bytes] = []
+        for byte in b"".join(frame(payload) for payload in payloads):
+            framer.feed(bytes((byte,)))
+            if (body := framer.next_message()) is not None:
+                bodies.append(body)
+        self.assertEqual([decode_json(body) for body in bodies], payloads)
+        self.assertEqual(framer.pending(), 0)
+
+    def test_missing(self) -> None:
+        framer = MessageFramer()
+        data = frame({"result": "x" * 100})
+        framer.feed(data[:40])
+        self.assertIsNone(framer.next_message())
+        self.assertEqual(framer.missing(), len(data) - 40)
+
+    def test_other_headers_are_ignored(self) -> None:
+        framer = MessageFramer()
+        framer.feed(frame({"id": 1}, b"Content-Type: application/vscode-jsonrpc; charset=utf-8\r\n"))
+        self.assertEqual(framer.next_message(), b'{"id":1}')
+
+    def test_header_name_is_case_insensitive(self) -> None:
+        framer = MessageFramer()
+        framer.feed(b"content-length: 2\r\n\r\n{}")
+        self.assertEqual(framer.next_message(), b"{}")
+
+    def test_missing_content_length(self) -> None:
+        framer = MessageFramer()
+        framer.feed(b"Content-Type: foo\r\n\r\n{}")
+        with self.assertRaises(ValueError):
+            framer.next_message()
+
+    def test_invalid_header_line(self) -> None:
+        framer = MessageFramer()
+        framer.feed(b"hello world\r\nContent-Length: 2\r\n\r\n{}")
+        with self.assertRaises(ValueError):
+            framer.next_message()
+
+
+class NotificationMethodTests(unittest.TestCase):
+
+    def test_notification(self) -> None:
+        body = b'{"jsonrpc":"2.0","method":"window/logMessage","params":{"type":4,"message":"hello"}}'
+        self.assertEqual(notification_method(body), "window/logMessage")
+
+    def test_whitespace(self) -> None:
+        body = b'{ "jsonrpc": "2.0", "method" : "$/progress", "params": {} }'
+        self.assertEqual(notification_method(body), "$/progress")
+
+    def test_request(self) -> None:
+        body = b'{"jsonrpc":"2.0","id":1,"method":"workspace/configuration","params":{"items":[]}}'
+        self.assertIsNone(notification_method(body))
+
+    def test_nested_method(self) -> None:
+        body = b'{"jsonrpc":"2.0","params":{"method":"foo"},"method":"telemetry/event"}'
+        self.assertIsNone(notification_method(body))
+
+    def test_method_in_string(self) -> None:
+        body = b'{"jsonrpc":"2.0, \\"method\\": \\"foo\\"","method":"telemetry/event"}'
+        self.assertEqual(notification_method(body), "telemetry/event")
+
+
+class TextSnapshotEncodingTests(unittest.TestCase):
+
+    def did_change(self, uri: str, text: str) -> dict[str, Any]:
+        return {"jsonrpc": "2.0", "method": "textDocument/didChange", "params": {
+            "textDocument": {"uri": uri, "version": 3}, "contentChanges": [{"text": text}]}}
+
+    def test_encoding_is_unchanged(self) -> None:
+        text = 'def f():\n    return "\u00e9\\"\t\U0001f600\n'
+        snapshot = TextSnapshot(text, 1, 3)
+        payload = self.did_change("file:///a.py", snapshot)
+        self.assertEqual(encode_json(payload), encode_json(self.did_change("file:///a.py", text)))
+        self.assertIs(payload["params"]["contentChanges"][0]["text"], snapshot)
+        did_open = {"jsonrpc": "2.0", "method": "textDocument/didOpen", "params": {"textDocument": {
+            "uri": "file:///a.py", "languageId": "python", "version": 3, "text": snapshot}}}
+        self.assertEqual(decode_json(encode_json(did_open))["params"]["textDocument"]["text"], text)
+
+    def test_text_is_encoded_once(self) -> None:
+        snapshot = TextSnapshot("x" * 1000, 1, 3)
+        with patch("LSP.plugin.core.transports._encode_json", wraps=_encode_json) as encoder:
+            first = encode_json(self.did_change("file:///a.py", snapshot))
+            second = encode_json(self.did_change("file:///b.py", snapshot))
+        texts = [call.args[0] for call in encoder.call_args_list if isinstance(call.args[0], str)]
+        self.assertEqual(texts, [snapshot])
+        self.assertEqual(first.replace(b"a.py", b"b.py"), second)
+
+    def test_message_is_not_modified(self) -> None:
+        snapshot = TextSnapshot("x" * 1000, 1, 3)
+        payload = self.did_change("file:///a.py", snapshot)
+
+        def encode(data: Any) -> bytes:
+            # Other threads may read the message while it is encoded.
+            self.assertIs(payload["params"]["contentChanges"][0]["text"], snapshot)
+            return _encode_json(data)
+
+        with patch("LSP.plugin.core.transports._encode_json", side_effect=encode):
+            encode_json(payload)
+        self.assertEqual(payload, self.did_change("file:///a.py", "x" * 1000))
+
+
+def request(method: str, request_id: int) -> dict[str, Any]:
+    return {"jsonrpc": "2.0", "id": request_id, "method": method, "params": {}}
+
+
+def notification(method: str) -> dict[str, Any]:
+    return {"jsonrpc": "2.0", "method": method, "params": {}}
+
+
+class SendQueueTests(unittest.TestCase):
+
+    def assert_order(self, payloads: list[Any], expected: list[Any]) -> None:
+        queue = SendQueue()
+        for payload in payloads:
+            queue.put(payload)
+        queue.close()
+        self.assertEqual(queue.get_batch(len(payloads)), expected)
+        self.assertIsNone(queue.get_batch(1))
+
+    def test_fifo_within_lane(self) -> None:
+        payloads = [request("textDocument/codeAction", i) for i in range(5)]
+        self.assert_order(payloads, payloads)
+
+    def test_cancel_overtakes_everything(self) -> None:
+        did_open = notification("textDocument/didOpen")
+        code_action = request("textDocument/codeAction", 1)
+        cancel = notification("$/cancelRequest")
+        self.assert_order([did_open, code_action, cancel], [cancel, did_open, code_action])
+
+    def test_interactive_overtakes_background(self) -> None:
+        watched_files = notification("workspace/didChangeWatchedFiles")
+        code_lens = request("textDocument/codeLens", 1)
+        completion = request("textDocument/completion", 2)
+        self.assert_order([watched_files, code_lens, completion], [completion, watched_files, code_lens])
+
+    def test_interactive_never_overtakes_document_sync(self) -> None:
+        watched_files = notification("workspace/didChangeWatchedFiles")
+        did_change = notification("textDocument/didChange")
+        completion = request("textDocument/completion", 1)
+        self.assert_order([watched_files, did_change, completion], [watched_files, did_change, completion])
+
+    def test_document_sync_never_overtakes_earlier_requests(self) -> None:
+        code_lens = request("textDocument/codeLens", 1)
+        did_change = notification("textDocument/didChange")
+        hover = request("textDocument/hover", 2)
+        self.assert_order([code_lens, did_change, hover], [code_lens, did_change, hover])
+
+    def test_limit(self) -> None:
+        queue = SendQueue()
+        for i in range(5):
+            queue.put(request("textDocument/codeAction", i))
+        self.assertEqual(len(queue.get_batch(3) or []), 3)
+        self.assertEqual(len(queue.get_batch(3) or []), 2)
+        self.assertEqual(queue.get_batch(3, block=False), [])
+
+
+class FileObjectTransportTests(unittest.TestCase):
+
+    def read_all(self, data: bytes, reader: Any = None) -> list[Any]:
+        transport = FileObjectTransport(encode_json, decode_json, reader or io.BytesIO(data), io.BytesIO())
+        payloads: list[Any] = []
+        with self.assertRaises(StopLoopError):
+            while True:
+                payloads.append(transport.read())
+        return payloads
+
+    def test_read(self) -> None:
+        payloads = [{"jsonrpc": "2.0", "id": i, "result": "x" * i * 1000} for i in range(100)]
+        self.assertEqual(self.read_all(b"".join(frame(payload) for payload in payloads)), payloads)
+
+    def test_read_with_header_parser(self) -> None:
+
+        class UnbufferedReader:
+
+            def __init__(self, data: bytes) -> None:
+                self._stream = io.BytesIO(data)
+                self.read = self._stream.read
+                self.readline = self._stream.readline
+
+        payloads = [{"jsonrpc": "2.0", "id": i} for i in range(10)]
+        data = b"".join(frame(payload) for payload in payloads)
+        self.assertEqual(self.read_all(data, UnbufferedReader(data)), payloads)
+
+    def test_ignore_body(self) -> None:
+        payloads = [{"jsonrpc": "2.0", "method": "telemetry/event" if i % 2 else "$/progress"} for i in range(10)]
+        data = b"".join(frame(payload) for payload in payloads)
+        transport = FileObjectTransport(encode_json, decode_json, io.BytesIO(data), io.BytesIO())
+        transport.ignore_body = lambda body: notification_method(body) == "telemetry/event"
+        received: list[Any] = []
+        with self.assertRaises(StopLoopError):
+            while True:
+                received.append(transport.read())
+        self.assertEqual(received, payloads[::2])
+
+    def test_unexpected_payload(self) -> None:
+        transport = FileObjectTransport(encode_json, decode_json, io.BytesIO(b"hello world\n"), io.BytesIO())
+        with self.assertRaisesRegex(Exception, "Unexpected payload in server's stdout"):
+            transport.read()
+
+    def test_json_decode_error(self) -> None:
+        reader = io.BytesIO(b"Content-Length: 2\r\n\r\n{{")
+        transport = FileObjectTransport(encode_json, decode_json, reader, io.BytesIO())
+        with self.assertRaisesRegex(Exception, "JSON decode error"):
+            transport.read()
+
+    def test_write_batch_flushes_once(self) -> None:
+
+        class Writer(io.BytesIO):
+            flushes = 0
+
+            def flush(self) -> None:
+                self.flushes += 1
+
+        writer = Writer()
+        transport = FileObjectTransport(encode_json, decode_json, io.BytesIO(), writer)
+        transport.write_batch([{"id": 1}, b"raw", {"id": 2}])
+        self.assertEqual(writer.flushes, 1)
+        self.assertEqual(writer.getvalue(), frame({"id": 1}) + b"raw" + frame({"id": 2}))
+
+
+class ErrorReaderTests(unittest.TestCase):
+
+    def test_lines_are_delivered_in_batches(self) -> None:
+
+        class Callbacks(TransportCallbacks):
+
+            def __init__(self) -> None:
+                self.batches: list[list[str]] = []
+
+            def on_stderr_messages(self, messages: list[str]) -> None:
+                self.batches.append(messages)
+
+        callbacks = Callbacks()
+        scheduled: list[Any] = []
+        mock_sublime = MagicMock(set_timeout_async=lambda f, *args: scheduled.append(f))
+        with patch("LSP.plugin.core.transports.sublime", mock_sublime):
+            read_fd, write_fd = os.pipe()
+            with os.fdopen(read_fd, "rb") as reader:
+                error_reader = ErrorReader(callbacks, reader)
+                os.write(write_fd, b"".join(f"line {i}\r\n".encode("ascii") for i in range(1000)) + b"last")
+                os.close(write_fd)
+                # The reader stops at the end of the stream.
+                assert error_reader._thread
+                error_reader._thread.join(5)
+        for f in scheduled:
+            f()
+        self.assertEqual(callbacks.batches, [[f"line {i}" for i in range(1000)] + ["last"]])
+
+    def test_callbacks_for_single_lines_receive_all_lines(self) -> None:
+
+        class Callbacks(TransportCallbacks):
+
+            def __init__(self) -> None:
+                self.lines: list[str] = []
+
+            def on_stderr_message(self, message: str) -> None:
+                self.lines.append(message)
+
+        callbacks = Callbacks()
+        callbacks.on_stderr_messages(["a", "b"])
+        self.assertEqual(callbacks.lines, ["a", "b"])
+
+    def test_history_keeps_suppressed_lines(self) -> None:
+        scheduled: list[Any] = []
+        mock_sublime = MagicMock(set_timeout_async=lambda f, *args: scheduled.append(f))
+        with patch("LSP.plugin.core.transports.sublime", mock_sublime), \
+                patch("LSP.plugin.core.transports.g_stderr_lines_per_second", 10), \
+                patch("LSP.plugin.core.transports.STDERR_HISTORY_LINES", 100):
+            read_fd, write_fd = os.pipe()
+            with os.fdopen(read_fd, "rb") as reader:
+                error_reader = ErrorReader(TransportCallbacks(), reader)
+                os.write(write_fd, b"".join(f"line {i}\n".encode("ascii") for i in range(1000)))
+                os.close(write_fd)
+                assert error_reader._thread
+                error_reader._thread.join(5)
+        self.assertEqual(error_reader.history(), [f"line {i}" for i in range(900, 1000)])
+
+
+class TransportWrapperTests(unittest.TestCase):
+
+    def test_failing_handler_does_not_stop_delivery(self) -> None:
+
+        class Callbacks(TransportCallbacks):
+
+            def __init__(self) -> None:
+                self.received: list[Any] = []
+
+            def on_payload(self, payload: Any) -> None:
+                self.received.append(payload["id"])
+                if payload["id"] == 1:
+                    raise RuntimeError("handler failed")
+
+        callbacks = Callbacks()
+        scheduled: list[Any] = []
+
+        def run_scheduled() -> None:
+            while scheduled:
+                scheduled.pop(0)()
+
+        mock_sublime = MagicMock(set_timeout_async=lambda f, *args: scheduled.append(f))
+        with patch("LSP.plugin.core.transports.sublime", mock_sublime), \
+                patch("LSP.plugin.core.transports.exception_log"):
+            # The server never writes, so that all payloads come from `receive`.
+            read_fd, write_fd = os.pipe()
+            with os.fdopen(read_fd, "rb") as reader, os.fdopen(write_fd, "wb") as writer:
+                wrapper = TransportWrapper(
+                    callbacks, FileObjectTransport(encode_json, decode_json, reader, io.BytesIO()), None, None)
+                for i in range(3):
+                    wrapper.receive({"jsonrpc": "2.0", "id": i, "result": None})
+                run_scheduled()
+                wrapper.receive({"jsonrpc": "2.0", "id": 3, "result": None})
+                run_scheduled()
+                writer.close()
+                wrapper.close()
+        self.assertEqual(callbacks.received, [0, 1, 2, 3])
+
+    @unittest.skipIf(os.name == "nt", "the shared I/O thread is not available on Windows")
+    def test_shared_io_thread_writes_queue_before_closing(self) -> None:
+        payloads = [{"jsonrpc": "2.0", "method": "test", "params": {"text": "x" * 10000, "i": i}} for i in range(100)]
+        received = bytearray()
+        server_stdout, client_stdin = os.pipe()
+        client_stdout, server_stdin = os.pipe()
+
+        def read_slowly() -> None:
+            # The payloads don't fit in the pipe, so most of them are still queued when the transport is closed.
+            time.sleep(0.2)
+            while chunk := os.read(server_stdout, 64 * 1024):
+                received.extend(chunk)
+
+        server = threading.Thread(target=read_slowly)
+        server.start()
+        with patch("LSP.plugin.core.transports.g_shared_io_thread", True), \
+                patch("LSP.plugin.core.transports.sublime"), \
+                os.fdopen(client_stdout, "rb") as reader, \
+                os.fdopen(client_stdin, "wb") as writer:
+            wrapper = TransportWrapper(
+                TransportCallbacks(), FileObjectTransport(encode_json, decode_json, reader, writer), None, None)
+            for payload in payloads:
+                wrapper.send(payload)
+            wrapper.close()
+        os.close(server_stdin)
+        server.join(5)
+        os.close(server_stdout)
+        framer = MessageFramer()
+        framer.feed(bytes(received))
+        messages = []
+        while (body := framer.next_message()) is not None:
+            messages.append(decode_json(body))
+        self.assertEqual(messages, payloads)
+
+    @unittest.skipIf(os.name == "nt", "the shared I/O thread is not available on Windows")
+    def test_closing_transport_does_not_block_shared_io_thread(self) -> None:
+        payloads = [{"jsonrpc": "2.0", "method": "test", "params": {"text": "x" * 10000, "i": i}} for i in range(100)]
+        stuck_server_stdout, stuck_client_stdin = os.pipe()
+        stuck_client_stdout, stuck_server_stdin = os.pipe()
+        other_server_stdout, other_client_stdin = os.pipe()
+        other_client_stdout, other_server_stdin = os.pipe()
+        with patch("LSP.plugin.core.transports.g_shared_io_thread", True), \
+                patch("LSP.plugin.core.transports.sublime"), \
+                patch("LSP.plugin.core.transports.CLOSE_FLUSH_TIMEOUT", 1), \
+                os.fdopen(stuck_client_stdout, "rb") as stuck_reader, \
+                os.fdopen(stuck_client_stdin, "wb") as stuck_writer, \
+                os.fdopen(other_client_stdout, "rb") as other_reader, \
+                os.fdopen(other_client_stdin, "wb") as other_writer:
+            # The server of the stuck transport never reads, so closing it waits for the deadline.
+            stuck = TransportWrapper(
+                TransportCallbacks(), FileObjectTransport(encode_json, decode_json, stuck_reader, stuck_writer),
+                None, None)
+            other = TransportWrapper(
+                TransportCallbacks(), FileObjectTransport(encode_json, decode_json, other_reader, other_writer),
+                None, None)
+            for payload in payloads:
+                stuck.send(payload)
+            closing = threading.Thread(target=stuck.close)
+            closing.start()
+            try:
+                time.sleep(0.1)
+                os.write(other_server_stdin, frame({"jsonrpc": "2.0", "id": 1, "result": None}))
+                deadline = time.monotonic() + 0.5
+                while not other._inbound and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                self.assertEqual(list(other._inbound), [{"jsonrpc": "2.0", "id": 1, "result": None}])
+                self.assertTrue(closing.is_alive())
+            finally:
+                closing.join(5)
+                other.close()
+            self.assertFalse(closing.is_alive())
+        for fd in (stuck_server_stdout, stuck_server_stdin, other_server_stdout, other_server_stdin):
+            os.close(fd)
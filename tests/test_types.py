@@ -1,9 +1,17 @@
 from __future__ import annotations
 
+from LSP.plugin.core.types import AdaptiveScheduler
 from LSP.plugin.core.types import basescope2languageid
+from LSP.plugin.core.types import Capabilities
 from LSP.plugin.core.types import diff
 from LSP.plugin.core.types import DocumentSelectorMatcher
+from LSP.plugin.core.types import FEATURES_TIMEOUT
+from LSP.plugin.core.types import MAX_FEATURES_TIMEOUT
+from LSP.plugin.core.types import MIN_FEATURES_TIMEOUT
+from LSP.plugin.core.types import TimerWheel
+from typing import Callable
 from unittest.mock import MagicMock
+from unittest.mock import patch
 import sublime
 import unittest
 
@@ -42,6 +50,117 @@ class TestDiff(unittest.TestCase):
         self.assertFalse(removed)
 
 
+class TestCapabilities(unittest.TestCase):
+
+    def test_get(self) -> None:
+        capabilities = Capabilities()
+        capabilities.assign({
+            "hoverProvider": True,
+            "completionProvider": {"triggerCharacters": ["."]},
+            "textDocumentSync": 2,
+        })
+        self.assertTrue(capabilities.get("hoverProvider"))
+        self.assertEqual(capabilities.get("completionProvider"), {"triggerCharacters": ["."]})
+        self.assertEqual(capabilities.get("completionProvider.triggerCharacters"), ["."])
+        self.assertEqual(capabilities.text_sync_kind(), 2)
+        self.assertIsNone(capabilities.get("completionProvider.resolveProvider"))
+        self.assertFalse(capabilities.get("hoverProvider.foo", False))
+        self.assertIn("textDocumentSync.didOpen", capabilities)
+
+    def test_register_and_unregister(self) -> None:
+        capabilities = Capabilities()
+        capabilities.assign({})
+        self.assertNotIn("codeLensProvider", capabilities)
+        capabilities.register("1", "codeLensProvider", "codeLensProvider.id", {"resolveProvider": True})
+        self.assertTrue(capabilities.get("codeLensProvider.resolveProvider"))
+        capabilities.unregister("1", "codeLensProvider", "codeLensProvider.id")
+        self.assertNotIn("codeLensProvider", capabilities)
+        self.assertIsNone(capabilities.get("codeLensProvider.resolveProvider"))
+        capabilities.assign({"hoverProvider": True})
+        capabilities.clear()
+        self.assertNotIn("hoverProvider", capabilities)
+
+
+class TestAdaptiveScheduler(unittest.TestCase):
+
+    def test_debounce(self) -> None:
+        scheduler = AdaptiveScheduler()
+        methods = ["textDocument/diagnostic", "textDocument/semanticTokens"]
+        self.assertEqual(scheduler.debounce_ms(methods, 100), FEATURES_TIMEOUT)
+        scheduler.record("textDocument/diagnostic", 0.005)
+        scheduler.record("textDocument/semanticTokens/full/delta", 0.015)
+        self.assertEqual(scheduler.debounce_ms(methods, 100), MIN_FEATURES_TIMEOUT)
+        self.assertEqual(scheduler.debounce_ms(methods, 1000000), 110)
+        for _ in range(20):
+            scheduler.record("textDocument/diagnostic", 5)
+        self.assertEqual(scheduler.debounce_ms(methods, 100), MAX_FEATURES_TIMEOUT)
+
+    def test_by_latency(self) -> None:
+        scheduler = AdaptiveScheduler()
+        scheduler.record("textDocument/codeLens", 0.5)
+        scheduler.record("textDocument/semanticTokens/full", 0.1)
+        scheduler.record("textDocument/semanticTokens/range", 0.2)
+        self.assertAlmostEqual(scheduler.latency("textDocument/semanticTokens"), 0.13)  # type: ignore
+        self.assertEqual(
+            scheduler.by_latency(["textDocument/codeLens", "textDocument/semanticTokens", "textDocument/inlayHint"]),
+            ["textDocument/inlayHint", "textDocument/semanticTokens", "textDocument/codeLens"])
+
+
+class TestTimerWheel(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.now = 1000.0
+        self.timeouts: list[tuple[float, Callable[[], None]]] = []
+        patchers = [
+            patch("LSP.plugin.core.types.time", MagicMock(monotonic=lambda: self.now)),
+            patch("LSP.plugin.core.types.sublime", MagicMock(
+                set_timeout_async=lambda f, timeout_ms: self.timeouts.append((self.now + timeout_ms / 1000, f)))),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def advance(self, ms: int) -> None:
+        self.now += ms / 1000
+        while due := [timeout for timeout in self.timeouts if timeout[0] <= self.now]:
+            for timeout in due:
+                self.timeouts.remove(timeout)
+                timeout[1]()
+
+    def test_reschedule(self) -> None:
+        wheel = TimerWheel(async_thread=True)
+        calls: list[int] = []
+        for i in range(100):
+            wheel.schedule("key", 100, lambda i=i: calls.append(i))
+            self.advance(10)
+        self.assertEqual(len(self.timeouts), 1)
+        self.assertIn("key", wheel)
+        self.advance(100)
+        self.assertEqual(calls, [99])
+        self.assertNotIn("key", wheel)
+
+    def test_cancel(self) -> None:
+        wheel = TimerWheel(async_thread=True)
+        calls: list[str] = []
+        wheel.schedule("a", 50, lambda: calls.append("a"))
+        wheel.schedule("b", 100, lambda: calls.append("b"))
+        self.assertTrue(wheel.cancel("a"))
+        self.assertFalse(wheel.cancel("c"))
+        self.advance(200)
+        self.assertEqual(calls, ["b"])
+
+    def test_order(self) -> None:
+        wheel = TimerWheel(async_thread=True)
+        calls: list[str] = []
+        wheel.schedule("late", 300, lambda: calls.append("late"))
+        wheel.schedule("early", 100, lambda: calls.append("early"))
+        self.advance(150)
+        self.assertEqual(calls, ["early"])
+        self.advance(200)
+        self.assertEqual(calls, ["early", "late"])
+        self.assertFalse(self.timeouts)
+
+
 class TestDocumentSelector(unittest.TestCase):
 
     def setUp(self) -> None: